@@ -10,6 +10,10 @@ def create_app():
     # ----------------- CONFIG -----------------
     app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "super-secret")
 
+    # ----------------- JSON -----------------
+    from app.utils import OrjsonProvider
+    app.json = OrjsonProvider(app)
+
     # ----------------- JWT -----------------
     JWTManager(app)
 
@@ -33,6 +37,10 @@ def create_app():
     from app.aggregation.routes import aggregation_bp
     from app.tba_sio.routes import sio_bp
     from app.image.routes import image_bp
+    from app.admin.routes import admin_bp
+    from app.events.routes import events_bp
+    from app.batch.routes import batch_bp
+    from app.dashboard.routes import dashboard_bp
 
     # ----------------- REGISTER BLUEPRINTS -----------------
     app.register_blueprint(expenses_bp)
@@ -42,6 +50,10 @@ def create_app():
     app.register_blueprint(aggregation_bp)
     app.register_blueprint(sio_bp)
     app.register_blueprint(image_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(dashboard_bp)
 
     # ----------------- ROUTES -----------------
     @app.route("/")
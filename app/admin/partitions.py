@@ -0,0 +1,314 @@
+import os
+import re
+from datetime import date
+from app.utils import get_db_connection  # absolute import
+
+# ----------------- CONFIG -----------------
+# Monthly partitions kept ready after the current one
+PARTITION_MONTHS_AHEAD = int(os.environ.get("EXPENSE_PARTITION_MONTHS_AHEAD", 3))
+# DDL gives up after this long instead of queueing every request behind its lock
+PARTITION_LOCK_TIMEOUT = os.environ.get("EXPENSE_PARTITION_LOCK_TIMEOUT", "5s")
+
+DEFAULT_PARTITION = "expenses_default"
+PARTITION_NAME_RE = re.compile(r"^expenses_y(\d{4})m(\d{2})$")
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"expenses_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'public.expenses'::regclass")
+    return cur.fetchone()[0]
+
+
+def copy_columns(cur, table):
+    """The columns COPY reads and writes for a table: all but the generated ones."""
+    cur.execute("""
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+    """, (f"public.{table}",))
+    return cur.fetchone()[0]
+
+
+def monthly_partitions(cur):
+    """Returns [(month, name)] of the attached monthly partitions, oldest first."""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.expenses'::regclass
+    """)
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+# ----------------- CONVERSION -----------------
+def convert():
+    """
+    Turns the plain expenses table into a partitioned one, online. The
+    slow steps (proving date NOT NULL, building the (id, date) unique
+    index) run first without blocking writers; the swap that follows only
+    changes the catalog. The old table becomes the default partition, so
+    no row moves yet: migrate() does that a month at a time.
+    Returns False if expenses is already partitioned.
+    """
+    conn = get_db_connection(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            if is_partitioned(cur):
+                return False
+            cur.execute("SET lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+            # The partition key can't be NULL; the API never writes one
+            cur.execute("UPDATE public.expenses SET date = CURRENT_DATE WHERE date IS NULL")
+            cur.execute("ALTER TABLE public.expenses DROP CONSTRAINT IF EXISTS expenses_date_not_null")
+            cur.execute("ALTER TABLE public.expenses ADD CONSTRAINT expenses_date_not_null CHECK (date IS NOT NULL) NOT VALID")
+            cur.execute("ALTER TABLE public.expenses VALIDATE CONSTRAINT expenses_date_not_null")
+            # The build waits for older transactions to finish, however long
+            cur.execute("RESET lock_timeout")
+            # A failed earlier run can leave an invalid index behind
+            cur.execute("DROP INDEX CONCURRENTLY IF EXISTS public.expenses_id_date_key")
+            cur.execute("CREATE UNIQUE INDEX CONCURRENTLY expenses_id_date_key ON public.expenses (id, date)")
+
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+            cur.execute("LOCK TABLE public.expenses IN ACCESS EXCLUSIVE MODE")
+            cur.execute("""
+                SELECT i.indexname, i.indexdef
+                FROM pg_indexes i
+                WHERE i.schemaname = 'public' AND i.tablename = 'expenses'
+                  AND i.indexname <> 'expenses_id_date_key'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_constraint c
+                      WHERE c.conname = i.indexname AND c.connamespace = 'public'::regnamespace
+                  )
+            """)
+            indexes = cur.fetchall()
+            cur.execute("""
+                SELECT conrelid::regclass::text, conname FROM pg_constraint
+                WHERE contype = 'f' AND confrelid = 'public.expenses'::regclass
+            """)
+            for table, constraint in cur.fetchall():
+                cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{constraint}"')
+            cur.execute("SELECT pg_get_serial_sequence('public.expenses', 'id')")
+            sequence = cur.fetchone()[0]
+
+            # SET NOT NULL trusts the validated check instead of scanning
+            cur.execute("ALTER TABLE public.expenses DROP CONSTRAINT expenses_pkey")
+            cur.execute("ALTER TABLE public.expenses ALTER COLUMN date SET NOT NULL")
+            cur.execute("ALTER TABLE public.expenses DROP CONSTRAINT expenses_date_not_null")
+            cur.execute(f"ALTER TABLE public.expenses ADD CONSTRAINT {DEFAULT_PARTITION}_pkey PRIMARY KEY USING INDEX expenses_id_date_key")
+            cur.execute(f"ALTER TABLE public.expenses RENAME TO {DEFAULT_PARTITION}")
+            for index_name, _ in indexes:
+                cur.execute(f'ALTER INDEX public."{index_name}" RENAME TO "{DEFAULT_PARTITION}_{index_name}"')
+
+            cur.execute(f"""
+                CREATE TABLE public.expenses
+                    (LIKE public.{DEFAULT_PARTITION} INCLUDING DEFAULTS INCLUDING GENERATED)
+                    PARTITION BY RANGE (date)
+            """)
+            cur.execute("ALTER TABLE public.expenses ADD CONSTRAINT expenses_pkey PRIMARY KEY (id, date)")
+            cur.execute("""
+                ALTER TABLE public.expenses ADD CONSTRAINT expenses_category_id_fkey
+                FOREIGN KEY (category_id) REFERENCES public.categories(id) ON DELETE CASCADE
+            """)
+            cur.execute("""
+                ALTER TABLE public.expenses ADD CONSTRAINT expenses_user_id_fkey
+                FOREIGN KEY (user_id) REFERENCES public.users(id) ON DELETE CASCADE
+            """)
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY public.expenses.id")
+            # Keys and indexes already on the old table are taken over, not rebuilt
+            cur.execute(f"ALTER TABLE public.expenses ATTACH PARTITION public.{DEFAULT_PARTITION} DEFAULT")
+            for _, index_def in indexes:
+                cur.execute(index_def)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _attached(cur, name):
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_inherits
+            WHERE inhparent = 'public.expenses'::regclass AND inhrelid = to_regclass(%s)
+        )
+    """, (f"public.{name}",))
+    return cur.fetchone()[0]
+
+
+def create_partition(conn, month, move_rows=True):
+    """
+    Creates the partition for one month. Returns the number of rows moved
+    into it from the default partition, or None if the partition exists
+    or, without move_rows, the default partition holds rows for the month.
+
+    Without such rows (the usual case: maintain() creates months ahead of
+    time) nothing blocks reads or writes of other months. A NOT VALID
+    check keeps the month out of the default partition, VALIDATE proves it
+    under SHARE UPDATE EXCLUSIVE, and ATTACH then skips its scan. Writes
+    dated in that month are rejected until the attach, for as long as the
+    validation scan runs.
+
+    With such rows (migrate()), they move in one transaction, and ATTACH
+    has to scan the default partition under ACCESS EXCLUSIVE. That blocks
+    every read and write of expenses for the length of the scan, which
+    grows with the rows the default partition still holds.
+    """
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+            if _attached(cur, name):
+                conn.rollback()
+                return None
+
+            # Holds off writes to the default partition until commit, so no
+            # row for the month arrives between the check and the constraint
+            cur.execute(f"LOCK TABLE public.{DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE")
+            # Left behind by a failed online attach: empty, not attached
+            cur.execute("SELECT to_regclass(%s)", (f"public.{name}",))
+            if cur.fetchone()[0] is not None:
+                cur.execute(f"SELECT EXISTS (SELECT 1 FROM public.{name})")
+                if cur.fetchone()[0]:
+                    raise RuntimeError(f"{name} exists, holds rows and is not attached to expenses")
+                cur.execute(f"DROP TABLE public.{name}")
+            cur.execute(f"ALTER TABLE public.{DEFAULT_PARTITION} DROP CONSTRAINT IF EXISTS {DEFAULT_PARTITION}_not_{name}")
+            cur.execute(
+                f"SELECT EXISTS (SELECT 1 FROM public.{DEFAULT_PARTITION} WHERE date >= %s AND date < %s)",
+                (start, end)
+            )
+            has_rows = cur.fetchone()[0]
+            if has_rows and not move_rows:
+                conn.rollback()
+                return None
+
+            cur.execute(f"CREATE TABLE public.{name} (LIKE public.expenses INCLUDING DEFAULTS INCLUDING GENERATED)")
+            if has_rows:
+                rows = _move_rows(cur, name, start, end)
+            else:
+                rows = 0
+                cur.execute(
+                    f"ALTER TABLE public.{DEFAULT_PARTITION} ADD CONSTRAINT {DEFAULT_PARTITION}_not_{name} "
+                    f"CHECK (NOT (date >= %s AND date < %s)) NOT VALID",
+                    (start, end)
+                )
+            # The check lets ATTACH skip scanning the new partition; indexes are built by it
+            cur.execute(f"ALTER TABLE public.{name} ADD CONSTRAINT {name}_range CHECK (date >= %s AND date < %s)", (start, end))
+            if has_rows:
+                _attach(cur, name, start, end)
+        conn.commit()
+        if has_rows:
+            return rows
+    except Exception:
+        conn.rollback()
+        raise
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE public.{DEFAULT_PARTITION} VALIDATE CONSTRAINT {DEFAULT_PARTITION}_not_{name}")
+        conn.commit()
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+            _attach(cur, name, start, end)
+            cur.execute(f"ALTER TABLE public.{DEFAULT_PARTITION} DROP CONSTRAINT {DEFAULT_PARTITION}_not_{name}")
+        conn.commit()
+        return 0
+    except Exception:
+        conn.rollback()
+        # Let the month's writes land in the default partition again
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+            cur.execute(f"ALTER TABLE public.{DEFAULT_PARTITION} DROP CONSTRAINT IF EXISTS {DEFAULT_PARTITION}_not_{name}")
+            cur.execute(f"DROP TABLE IF EXISTS public.{name}")
+        conn.commit()
+        raise
+
+
+def _move_rows(cur, name, start, end):
+    columns = copy_columns(cur, "expenses")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM public.{DEFAULT_PARTITION} WHERE date >= %s AND date < %s
+            RETURNING {columns}
+        )
+        INSERT INTO public.{name} ({columns}) SELECT {columns} FROM moved
+    """, (start, end))
+    return cur.rowcount
+
+
+def _attach(cur, name, start, end):
+    cur.execute(f"ALTER TABLE public.expenses ATTACH PARTITION public.{name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    cur.execute(f"ALTER TABLE public.{name} DROP CONSTRAINT {name}_range")
+
+
+def default_partition_months(cur):
+    """Returns [(month, rows)] the default partition holds, oldest first."""
+    cur.execute(f"""
+        SELECT date_trunc('month', date)::date, COUNT(*) FROM public.{DEFAULT_PARTITION}
+        GROUP BY 1 ORDER BY 1
+    """)
+    return cur.fetchall()
+
+
+def migrate():
+    """
+    Moves everything the default partition holds into monthly partitions,
+    one month per transaction, oldest first. Yields (partition, rows).
+    Each month blocks expenses while ATTACH scans the default partition
+    (see create_partition); run it when the API is quiet.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            months = [month for month, _ in default_partition_months(cur)]
+        conn.commit()
+        for month in months:
+            yield partition_name(month), create_partition(conn, month)
+    finally:
+        conn.close()
+
+
+# ----------------- MAINTENANCE -----------------
+# Old months are not detached here: 'flask admin archive-expenses' moves
+# them into per-user archive files that reads still see.
+def maintain(months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    The periodic job. Creates the partitions for the current month and
+    months_ahead after it, without ever blocking reads (see
+    create_partition). Months the default partition holds rows for are
+    left alone and reported instead: rows dated before the oldest
+    partition or in a gap, or ahead of the partitions. Moving them takes
+    'flask admin partitions-migrate'.
+    Returns {"created": {partition: rows moved}, "default": {month: rows}}.
+    """
+    this_month = date.today().replace(day=1)
+    result = {"created": {}, "default": {}}
+    conn = get_db_connection()
+    try:
+        for offset in range(months_ahead + 1):
+            month = add_months(this_month, offset)
+            rows = create_partition(conn, month, move_rows=False)
+            if rows is not None:
+                result["created"][partition_name(month)] = rows
+
+        with conn.cursor() as cur:
+            result["default"] = {month.isoformat(): rows for month, rows in default_partition_months(cur)}
+        conn.commit()
+    finally:
+        conn.close()
+    return result
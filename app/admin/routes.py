@@ -0,0 +1,328 @@
+import os
+import threading
+import click
+from flask import Blueprint, jsonify, send_file
+from flask_jwt_extended import jwt_required
+from app.utils import admin_required, flights  # absolute import
+from app.admin import snapshot, partitions
+from app.expenses import archive
+from app.expenses.cache import expense_cache
+
+admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
+
+# One snapshot at a time per process; each one already uses several connections
+_snapshot_lock = threading.Lock()
+
+
+def _run_snapshot(name):
+    try:
+        snapshot.create_snapshot(name)
+    finally:
+        _snapshot_lock.release()
+
+
+@admin_bp.route("/snapshots", methods=["POST"])
+@jwt_required()
+@admin_required
+def start_snapshot():
+    """
+    Start a full database snapshot (admin only)
+    ---
+    tags:
+      - Admin
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    responses:
+      202:
+        description: Snapshot started; it appears in GET /admin/snapshots when complete
+        schema:
+          type: object
+          properties:
+            name:
+              type: string
+              example: "20250924T101500"
+            status_url:
+              type: string
+              example: "/admin/snapshots/20250924T101500"
+      403:
+        description: Admin rights required
+      409:
+        description: A snapshot is already running
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "A snapshot is already running"
+    """
+    if not _snapshot_lock.acquire(blocking=False):
+        return jsonify({"error": "A snapshot is already running"}), 409
+
+    name = snapshot.new_snapshot_name()
+    threading.Thread(target=_run_snapshot, args=(name,), daemon=True).start()
+    return jsonify({"name": name, "status_url": f"/admin/snapshots/{name}"}), 202
+
+
+@admin_bp.route("/snapshots", methods=["GET"])
+@jwt_required()
+@admin_required
+def get_snapshots():
+    """
+    List completed snapshots (admin only)
+    ---
+    tags:
+      - Admin
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    responses:
+      200:
+        description: Snapshot manifests, newest first
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              name:
+                type: string
+                example: "20250924T101500"
+              created_at:
+                type: string
+                example: "2025-09-24T10:15:07Z"
+              tables:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    table:
+                      type: string
+                      example: "expenses"
+                    file:
+                      type: string
+                      example: "expenses.copy.gz"
+                    rows:
+                      type: integer
+                      example: 120000
+                    bytes:
+                      type: integer
+                      example: 2483112
+      403:
+        description: Admin rights required
+    """
+    return jsonify(snapshot.list_snapshots())
+
+
+@admin_bp.route("/snapshots/<name>", methods=["GET"])
+@jwt_required()
+@admin_required
+def get_snapshot(name):
+    """
+    Get a snapshot's manifest (admin only)
+    ---
+    tags:
+      - Admin
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    parameters:
+      - name: name
+        in: path
+        type: string
+        required: true
+        example: "20250924T101500"
+    responses:
+      200:
+        description: Snapshot manifest
+      403:
+        description: Admin rights required
+      404:
+        description: Snapshot not found or still running
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Snapshot not found"
+    """
+    manifest = snapshot.load_manifest(name)
+    if manifest is None:
+        return jsonify({"error": "Snapshot not found"}), 404
+    return jsonify(manifest)
+
+
+@admin_bp.route("/snapshots/<name>/<table>", methods=["GET"])
+@jwt_required()
+@admin_required
+def download_snapshot_table(name, table):
+    """
+    Download one table of a snapshot as a gzipped COPY stream (admin only)
+    ---
+    tags:
+      - Admin
+    security:
+      - Bearer: []
+    produces:
+      - application/gzip
+    parameters:
+      - name: name
+        in: path
+        type: string
+        required: true
+        example: "20250924T101500"
+      - name: table
+        in: path
+        type: string
+        required: true
+        example: "expenses"
+    responses:
+      200:
+        description: gzipped PostgreSQL COPY text format
+      403:
+        description: Admin rights required
+      404:
+        description: Snapshot or table not found
+    """
+    manifest = snapshot.load_manifest(name)
+    entry = next((t for t in manifest["tables"] if t["table"] == table), None) if manifest else None
+    if entry is None:
+        return jsonify({"error": "Snapshot not found"}), 404
+    return send_file(
+        os.path.join(snapshot.snapshot_dir(name), entry["file"]),
+        mimetype="application/gzip",
+        as_attachment=True,
+        download_name=f"{name}-{entry['file']}"
+    )
+
+
+@admin_bp.route("/metrics", methods=["GET"])
+@jwt_required()
+@admin_required
+def get_metrics():
+    """
+    Request coalescing and expense cache counters of this worker process (admin only)
+    ---
+    tags:
+      - Admin
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    responses:
+      200:
+        description: Counters since the worker started
+        schema:
+          type: object
+          properties:
+            single_flight:
+              type: object
+              properties:
+                leaders:
+                  type: integer
+                  description: Requests that ran their query
+                  example: 1520
+                coalesced:
+                  type: integer
+                  description: Requests answered with a concurrent identical request's result
+                  example: 311
+                in_flight:
+                  type: integer
+                  example: 2
+            expense_cache:
+              type: object
+              properties:
+                users:
+                  type: integer
+                  example: 840
+                bytes:
+                  type: integer
+                  example: 51380224
+                hits:
+                  type: integer
+                  description: Reads answered from cached columns
+                  example: 9120
+                loads:
+                  type: integer
+                  description: Columns (re)loaded from the database
+                  example: 1204
+                patches:
+                  type: integer
+                  description: Expense writes applied to cached columns
+                  example: 3377
+      403:
+        description: Admin rights required
+    """
+    return jsonify({"single_flight": flights.stats(), "expense_cache": expense_cache.stats()})
+
+
+# ----------------- CLI -----------------
+# flask --app app.app:app admin snapshot
+# flask --app app.app:app admin restore data/snapshots/20250924T101500
+# flask --app app.app:app admin partitions-migrate
+# flask --app app.app:app admin partitions-maintain  (daily, e.g. from cron)
+# flask --app app.app:app admin archive-expenses  (monthly)
+@admin_bp.cli.command("snapshot")
+def snapshot_command():
+    """Write a consistent snapshot of all tables."""
+    manifest = snapshot.create_snapshot()
+    for entry in manifest["tables"]:
+        click.echo(f"{entry['table']:<20} {entry['rows']:>12} rows {entry['bytes']:>14} bytes")
+    click.echo(f"Snapshot {manifest['name']} written to {snapshot.snapshot_dir(manifest['name'])}")
+
+
+@admin_bp.cli.command("restore")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--yes", is_flag=True, help="Don't ask for confirmation.")
+def restore_command(directory, yes):
+    """Replace all data with the snapshot in DIRECTORY."""
+    if not yes:
+        click.confirm("This replaces ALL data in the database. Continue?", abort=True)
+    rows = snapshot.restore_snapshot(directory)
+    for table, count in rows.items():
+        click.echo(f"{table:<20} {count:>12} rows")
+    click.echo("Restore complete")
+
+
+@admin_bp.cli.command("partitions-migrate")
+def partitions_migrate_command():
+    """
+    Partition expenses by month, moving existing rows one month at a time.
+    Each month locks expenses (reads included) while the default partition
+    is scanned; run it when the API is quiet.
+    """
+    if partitions.convert():
+        click.echo("expenses converted; existing rows are in the default partition")
+    for name, rows in partitions.migrate():
+        click.echo(f"{name:<20} {rows:>12} rows moved")
+    partitions_maintain_command.callback(partitions.PARTITION_MONTHS_AHEAD)
+
+
+@admin_bp.cli.command("partitions-maintain")
+@click.option("--months-ahead", type=int, default=partitions.PARTITION_MONTHS_AHEAD, show_default=True,
+              help="Monthly partitions to keep ready after the current one.")
+def partitions_maintain_command(months_ahead):
+    """
+    Create upcoming expense partitions without blocking reads, and report
+    rows left in the default partition. Old months are archived by
+    archive-expenses, not detached here.
+    """
+    result = partitions.maintain(months_ahead)
+    for name in result["created"]:
+        click.echo(f"{name:<20} created")
+    for month, rows in result["default"].items():
+        click.echo(f"{month[:7]:<20} {rows} rows in the default partition; run partitions-migrate to move them")
+
+
+@admin_bp.cli.command("archive-expenses")
+@click.option("--months", type=int, default=archive.ARCHIVE_AFTER_MONTHS, show_default=True,
+              help="Archive expenses dated before the first of the month this many months back.")
+def archive_expenses_command(months):
+    """Move old expenses into per-user Parquet archive files."""
+    total = 0
+    for user_id, rows in archive.archive_expenses(months):
+        click.echo(f"user {user_id:<10} {rows:>12} rows archived")
+        total += rows
+    click.echo(f"{total} rows archived to {archive.ARCHIVE_ROOT}")
@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import gzip
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2.extensions
+from app.utils import CATEGORIES_SCOPE, get_db_connection  # absolute import
+from app.admin.partitions import copy_columns
+
+# ----------------- CONFIG -----------------
+SNAPSHOT_ROOT = os.environ.get(
+    "ADMIN_SNAPSHOT_ROOT",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "snapshots")
+)
+# gzip level: 1 keeps compression ahead of a fast disk, 9 squeezes backups harder
+SNAPSHOT_COMPRESS_LEVEL = int(os.environ.get("ADMIN_SNAPSHOT_COMPRESS_LEVEL", 1))
+SNAPSHOT_WORKERS = int(os.environ.get("ADMIN_SNAPSHOT_WORKERS", 4))
+
+# Foreign-key order: parents first. Tables with a serial id get their
+# sequence reset after a restore.
+TABLES = (
+    ("users", True),
+    ("categories", True),
+    ("tba_sio", False),
+    ("password_resets", True),
+    ("expenses", True),
+    ("expense_tombstones", False),
+    ("receipts", True),
+    ("merchant_keywords", True),
+    # The archive files themselves are not part of a snapshot
+    ("expense_archives", False)
+)
+
+SNAPSHOT_NAME_RE = re.compile(r"^\d{8}T\d{6}$")
+MANIFEST = "manifest.json"
+
+
+def table_file(table):
+    return f"{table}.copy.gz"
+
+
+def snapshot_dir(name):
+    return os.path.join(SNAPSHOT_ROOT, name)
+
+
+# ----------------- SNAPSHOT -----------------
+def _copy_source(cur, table):
+    """COPY can't read a partitioned table itself, only a query over it."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", (f"public.{table}",))
+    if cur.fetchone()[0] == "p":
+        return f"(SELECT {copy_columns(cur, table)} FROM public.{table})"
+    return f"public.{table}"
+
+
+def _dump_table(snapshot_id, table, path):
+    """
+    Copies one table on its own connection, inside the exported snapshot so
+    every table sees the same point in time. gzip and COPY both run in C
+    and release the GIL, so the workers proceed in parallel.
+    """
+    conn = get_db_connection()
+    try:
+        conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+            source = _copy_source(cur, table)
+            with gzip.open(path, "wb", compresslevel=SNAPSHOT_COMPRESS_LEVEL) as fh:
+                cur.copy_expert(f"COPY {source} TO STDOUT", fh)
+            rows = cur.rowcount
+        conn.rollback()
+        return rows
+    finally:
+        conn.close()
+
+
+def new_snapshot_name():
+    return datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+
+
+def create_snapshot(name=None):
+    """
+    Writes every table as a gzipped COPY stream plus a manifest into
+    SNAPSHOT_ROOT/<name>/. The manifest is written last, so a directory
+    without one is an incomplete snapshot. Returns the manifest.
+    """
+    name = name or new_snapshot_name()
+    directory = snapshot_dir(name)
+    os.makedirs(directory, exist_ok=False)
+
+    # The exporting transaction must stay open until all workers have attached
+    coordinator = get_db_connection()
+    try:
+        coordinator.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        with coordinator.cursor() as cur:
+            cur.execute("SELECT pg_export_snapshot()")
+            snapshot_id = cur.fetchone()[0]
+
+            with ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS) as pool:
+                futures = {
+                    table: pool.submit(_dump_table, snapshot_id, table, os.path.join(directory, table_file(table)))
+                    for table, _ in TABLES
+                }
+                rows = {table: future.result() for table, future in futures.items()}
+        coordinator.rollback()
+    finally:
+        coordinator.close()
+
+    manifest = {
+        "name": name,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "tables": [
+            {
+                "table": table,
+                "file": table_file(table),
+                "rows": rows[table],
+                "bytes": os.path.getsize(os.path.join(directory, table_file(table)))
+            }
+            for table, _ in TABLES
+        ]
+    }
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def list_snapshots():
+    """Returns manifests of complete snapshots, newest first."""
+    if not os.path.isdir(SNAPSHOT_ROOT):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(SNAPSHOT_ROOT), reverse=True):
+        path = os.path.join(snapshot_dir(name), MANIFEST)
+        if SNAPSHOT_NAME_RE.match(name) and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as fh:
+                manifests.append(json.load(fh))
+    return manifests
+
+
+def load_manifest(name):
+    if not SNAPSHOT_NAME_RE.match(name or ""):
+        return None
+    try:
+        with open(os.path.join(snapshot_dir(name), MANIFEST), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except OSError:
+        return None
+
+
+# ----------------- RESTORE -----------------
+def restore_snapshot(directory):
+    """
+    Replaces the contents of all snapshot tables with the snapshot in the
+    given directory, in one transaction. Secondary indexes are dropped
+    before loading and rebuilt afterwards, which is much faster than
+    maintaining them row by row. Returns {table: rows}.
+    """
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    files = {entry["table"]: entry["file"] for entry in manifest["tables"]}
+    tables = [table for table, _ in TABLES if table in files]
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            # The snapshot is consistent already; skip FK triggers while loading
+            cur.execute("SET LOCAL session_replication_role = replica")
+            cur.execute("SET LOCAL maintenance_work_mem = '512MB'")
+
+            # Indexes not backing a constraint (primary keys, unique) can go.
+            # Dropping a partitioned table's index drops its partitions' too.
+            cur.execute("""
+                SELECT i.indexname, i.indexdef
+                FROM pg_indexes i
+                WHERE i.schemaname = 'public' AND i.tablename = ANY(%s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_constraint c
+                      WHERE c.conname = i.indexname AND c.connamespace = 'public'::regnamespace
+                  )
+            """, (tables,))
+            indexes = cur.fetchall()
+            for index_name, _ in indexes:
+                cur.execute(f'DROP INDEX public."{index_name}"')
+
+            cur.execute("TRUNCATE " + ", ".join(f"public.{table}" for table in tables) + " CASCADE")
+
+            rows = {}
+            for table in tables:
+                with gzip.open(os.path.join(directory, files[table]), "rb") as fh:
+                    cur.copy_expert(f"COPY public.{table} FROM STDIN", fh, size=1 << 20)
+                rows[table] = cur.rowcount
+
+            for _, index_def in indexes:
+                # "ON ONLY" would leave a partitioned index unbuilt on the partitions
+                cur.execute(index_def.replace(" ON ONLY ", " ON ", 1))
+
+            for table, has_serial in TABLES:
+                if has_serial and table in rows:
+                    cur.execute(
+                        f"SELECT setval(pg_get_serial_sequence('public.{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM public.{table}"
+                    )
+                if table in rows:
+                    cur.execute(f"ANALYZE public.{table}")
+
+            cur.execute("""
+                SELECT setval('expense_change_seq', GREATEST(
+                    (SELECT COALESCE(MAX(change_seq), 0) FROM expenses),
+                    (SELECT COALESCE(MAX(change_seq), 0) FROM expense_tombstones)
+                ) + 1, false)
+            """)
+
+            # Everything changed: invalidate every client's cached responses.
+            # Upserted, since a scope never written to has no row yet (its
+            # version reads as 0 and would still match a pre-restore ETag).
+            # 'user:' || id is user_scope(id); UNION keeps each scope once
+            cur.execute("""
+                INSERT INTO data_versions (scope, version)
+                SELECT 'user:' || id, 1 FROM users
+                UNION SELECT %s, 1
+                UNION SELECT scope, 1 FROM data_versions
+                ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1
+            """, (CATEGORIES_SCOPE,))
+        conn.commit()
+    finally:
+        conn.close()
+    return rows
@@ -1,19 +1,19 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, g
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.utils import get_db_connection  # absolute import
+from app.utils import get_db_connection, conditional_get, single_flight, Money, CATEGORIES_SCOPE  # absolute import
 from datetime import date
+from app.expenses.cache import expense_cache
 
 aggregation_bp = Blueprint("aggregation", __name__, url_prefix="/aggregation")
 
 
-@aggregation_bp.route("/", methods=["GET"])
-@jwt_required()
-def aggregation():
+def compute_aggregation(conn, user_id, period, versions=None):
     """
-    Aggregate user finances over a period: month, quarter, year
+    Totals and KPIs for the period (month, quarter or year) on the given
+    connection. Expense totals come from the user's cached columns
+    (archived expenses included); versions are the data versions the
+    caller already read, if any. Raises ValueError for an unknown period.
     """
-    user_id = get_jwt_identity()
-    period = request.args.get("period", "month")
     today = date.today()
 
     # ---- Determine start date ----
@@ -26,26 +26,19 @@ def aggregation():
     elif period == "year":
         start_date = date(today.year, 1, 1)
     else:
-        return jsonify({"error": "Invalid period, use month|quarter|year"}), 400
+        raise ValueError(period)
 
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            # ---- User balance ----
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            user_balance = float(cur.fetchone()[0] or 0)
+    with conn.cursor() as cur:
+        # ---- User balance ----
+        cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
+        user_balance = Money(cur.fetchone()[0] or 0)
 
-            # ---- Expenses by category ----
-            cur.execute("""
-                SELECT c.name, COALESCE(SUM(e.amount),0)
-                FROM expenses e
-                JOIN categories c ON e.category_id = c.id
-                WHERE e.user_id=%s AND e.date >= %s AND e.date <= %s
-                GROUP BY c.name
-            """, (user_id, start_date, today))
-            expenses_by_category = {row[0]: float(row[1]) for row in cur.fetchall()}
+    # ---- Expenses by category ----
+    expenses = expense_cache.get(conn, user_id, versions)
+    expenses_by_category = expenses.filter(start_date, today).group_by("name")
 
-    # ---- KPIs ----
-    spent = sum(expenses_by_category.values())
+    # ---- KPIs (integer cents; only the ratios are floats) ----
+    spent = sum(expenses_by_category.values(), Money(0))
     earned = user_balance + spent
     housing = expenses_by_category.get("Rent / Mortgage", 0)
     utilities = expenses_by_category.get("Utilities", 0)
@@ -57,7 +50,7 @@ def aggregation():
     fixed_expenses = housing + utilities + insurance + subscriptions
     fixed_expense_ratio = (fixed_expenses / earned * 100) if earned else 0
 
-    return jsonify({
+    return {
         "period": period,
         "start_date": str(start_date),
         "end_date": str(today),
@@ -72,4 +65,24 @@ def aggregation():
             "discretionary_ratio_percent": round((discretionary / earned * 100) if earned else 0, 2),
             "housing_cost_ratio_percent": round((housing / earned * 100) if earned else 0, 2)
         }
-    })
+    }
+
+
+@aggregation_bp.route("/", methods=["GET"])
+@jwt_required()
+@conditional_get("user", CATEGORIES_SCOPE)
+@single_flight
+def aggregation():
+    """
+    Aggregate user finances over a period: month, quarter, year
+    """
+    user_id = get_jwt_identity()
+    period = request.args.get("period", "month")
+
+    try:
+        with get_db_connection() as conn:
+            result = compute_aggregation(conn, user_id, period, g.get("data_versions"))
+    except ValueError:
+        return jsonify({"error": "Invalid period, use month|quarter|year"}), 400
+
+    return jsonify(result)
@@ -6,6 +6,21 @@ from app.utils import get_db_connection, validate_password  # absolute import
 
 auth_bp = Blueprint("auth", __name__, template_folder='../templates')
 
+REGISTER_SQL = """
+    WITH taken AS (
+        SELECT COALESCE(bool_or(username = %(username)s), false) AS username,
+               COALESCE(bool_or(email = %(email)s), false) AS email
+        FROM users WHERE username = %(username)s OR email = %(email)s
+    ), created AS (
+        INSERT INTO users (username, password, email, balance, created_at)
+        SELECT %(username)s, %(password)s, %(email)s, 0, %(created_at)s
+        FROM taken WHERE NOT (taken.username OR taken.email)
+        ON CONFLICT DO NOTHING
+        RETURNING id
+    )
+    SELECT (SELECT id FROM created), taken.username, taken.email FROM taken
+"""
+
 
 # Registration
 @auth_bp.route("/register", methods=["POST"])
@@ -78,30 +93,26 @@ def register():
 
     hashed_pw = generate_password_hash(password)
 
-    with get_db_connection() as conn:
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
-            # Check if username exists
-            cur.execute("SELECT id FROM users WHERE username=%s", (username,))
-            if cur.fetchone():
-                return jsonify({"error": "Username already exists"}), 400
-
-            # Check if email exists
-            cur.execute("SELECT id FROM users WHERE email=%s", (email,))
-            if cur.fetchone():
-                return jsonify({"error": "Email already exists"}), 400
-
-            # Insert user with email
-            cur.execute(
-                """
-                INSERT INTO users (username, password, email, balance, created_at)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-                """,
-                (username, hashed_pw, email, 0, datetime.utcnow())
-            )
-            user_id = cur.fetchone()[0]
+            # Duplicate checks and insert in one round trip; ON CONFLICT
+            # covers a concurrent registration of the same name or email
+            cur.execute(REGISTER_SQL, {
+                "username": username,
+                "email": email,
+                "password": hashed_pw,
+                "created_at": datetime.utcnow()
+            })
+            user_id, username_taken, email_taken = cur.fetchone()
             conn.commit()
 
+    if username_taken:
+        return jsonify({"error": "Username already exists"}), 400
+    if email_taken:
+        return jsonify({"error": "Email already exists"}), 400
+    if user_id is None:
+        return jsonify({"error": "Username or email already exists"}), 400
+
     return jsonify({"id": user_id, "username": username, "email": email}), 201
 
 
@@ -0,0 +1,3 @@
+#from flask import Blueprint
+
+#batch_bp = Blueprint("batch", __name__, url_prefix="/batch")
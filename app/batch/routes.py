@@ -0,0 +1,203 @@
+import os
+from flask import Blueprint, jsonify, request, current_app, g
+from flask_jwt_extended import jwt_required
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+from app.utils import get_db_connection, SharedConnection  # absolute import
+
+batch_bp = Blueprint("batch", __name__, url_prefix="/batch")
+
+MAX_BATCH_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+
+# Streaming, multipart or long-running endpoints can't be batched
+EXCLUDED_ENDPOINTS = {
+    "batch.batch",
+    "events.events",
+    "expenses.export_expenses",
+    "image.upload_receipt",
+    "image.upload_receipts",
+    "image.receipt_thumbnail",
+    "admin.start_snapshot",
+    "admin.download_snapshot_table",
+    "dashboard.dashboard"
+}
+
+# Headers worth passing back per sub-request
+RESULT_HEADERS = ("ETag", "Location", "X-Next-Cursor")
+
+# Code object of the function jwt_required() wraps views in. The batch
+# verifies the JWT once; sub-requests skip straight to the wrapped view.
+_JWT_WRAPPER_CODE = jwt_required()(lambda: None).__code__
+
+
+def _unwrap_jwt(view):
+    if getattr(view, "__code__", None) is _JWT_WRAPPER_CODE and hasattr(view, "__wrapped__"):
+        return view.__wrapped__
+    return view
+
+
+def _dispatch(item):
+    """
+    Runs one sub-request through the app's URL map and view functions in
+    its own request context. The JWT data in g is already set by the
+    outer request. Returns a Flask response.
+    """
+    app = current_app._get_current_object()
+    builder = EnvironBuilder(
+        path=item.get("path", ""),
+        method=item.get("method", "GET").upper(),
+        json=item.get("body"),
+        headers={"Authorization": request.headers.get("Authorization", "")}
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    with app.request_context(environ) as ctx:
+        try:
+            if ctx.request.routing_exception is not None:
+                raise ctx.request.routing_exception
+            endpoint = ctx.request.url_rule.endpoint
+            if endpoint in EXCLUDED_ENDPOINTS:
+                return jsonify({"error": f"{item.get('path')} can't be used in a batch"}), 400
+            view = _unwrap_jwt(app.view_functions[endpoint])
+            return app.make_response(view(**ctx.request.view_args))
+        except HTTPException as e:
+            return jsonify({"error": e.name}), e.code
+        except Exception as e:
+            # JWT and other errors with a registered handler become their response
+            try:
+                return app.make_response(app.handle_user_exception(e))
+            except Exception:
+                app.logger.exception("Batch sub-request failed")
+                return jsonify({"error": "Internal server error"}), 500
+
+
+def _result(response):
+    if isinstance(response, tuple):
+        response = current_app.make_response(response)
+    body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    headers = {name: response.headers[name] for name in RESULT_HEADERS if name in response.headers}
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+
+@batch_bp.route("", methods=["POST"])
+@jwt_required()
+def batch():
+    """
+    Run several API calls in one round trip
+    ---
+    tags:
+      - Batch
+    security:
+      - Bearer: []
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - requests
+          properties:
+            atomic:
+              type: boolean
+              description: All-or-nothing; the first failing call rolls back the whole batch
+              example: true
+            requests:
+              type: array
+              items:
+                type: object
+                properties:
+                  method:
+                    type: string
+                    example: "POST"
+                  path:
+                    type: string
+                    example: "/expenses"
+                  body:
+                    type: object
+                    example: {"amount": 12.5, "description": "Konzum", "categoryId": 3}
+              example:
+                - {"method": "POST", "path": "/expenses", "body": {"amount": 12.5, "description": "Konzum"}}
+                - {"method": "GET", "path": "/me"}
+                - {"method": "GET", "path": "/aggregation/?period=month"}
+    responses:
+      200:
+        description: One result per request, in order. In an atomic batch, calls after a failure are not run (status 424)
+        schema:
+          type: object
+          properties:
+            committed:
+              type: boolean
+              example: true
+            responses:
+              type: array
+              items:
+                type: object
+                properties:
+                  status:
+                    type: integer
+                    example: 201
+                  headers:
+                    type: object
+                  body:
+                    type: object
+      400:
+        description: Invalid batch
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "requests must be a non-empty list of at most 20 calls"
+    """
+    data = request.get_json() or {}
+    items = data.get("requests")
+    atomic = bool(data.get("atomic", False))
+
+    if not isinstance(items, list) or not items or len(items) > MAX_BATCH_REQUESTS \
+            or not all(isinstance(item, dict) and isinstance(item.get("path"), str) for item in items):
+        return jsonify({"error": f"requests must be a non-empty list of at most {MAX_BATCH_REQUESTS} calls"}), 400
+
+    conn = get_db_connection()
+    shared = SharedConnection(conn, atomic)
+    g._batch_connection = shared
+    results = []
+    failed = False
+    try:
+        for item in items:
+            if failed:
+                results.append({"status": 424, "headers": {}, "body": {"error": "Not run, an earlier call failed"}})
+                continue
+
+            shared.begin_item()
+            result = _result(_dispatch(item))
+            results.append(result)
+
+            if atomic:
+                failed = result["status"] >= 400
+            elif conn.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+                conn.rollback()
+            else:
+                # Each call stands alone, like it would as its own request
+                conn.commit()
+
+        if atomic and failed:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        g._batch_connection = None
+        conn.close()
+
+    return jsonify({"committed": not failed, "responses": results})
@@ -0,0 +1,246 @@
+import os
+import re
+import time
+import string
+import threading
+import unicodedata
+from collections import deque, OrderedDict
+from app.utils import get_db_connection  # absolute import
+
+# ----------------- CONFIG -----------------
+# How long a process trusts its copy of a dictionary before re-reading it
+# (entries learned, or categories deleted, by other worker processes)
+USER_DICTIONARY_TTL = int(os.environ.get("MERCHANT_DICTIONARY_TTL", 300))
+# Per-user dictionaries kept per process, least recently used evicted first
+MAX_USER_DICTIONARIES = int(os.environ.get("MERCHANT_MAX_USER_DICTIONARIES", 10000))
+MAX_KEYWORD_LENGTH = 100
+# A learned keyword is the description's leading words up to the first
+# one with a digit in it ("lidl 24.05 receipt 1234" -> "lidl")
+MAX_KEYWORD_WORDS = 3
+MIN_KEYWORD_LENGTH = 3
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """
+    Lower-cases, strips accents (č -> c) and collapses whitespace, so
+    keywords and descriptions are compared in the same form.
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _WHITESPACE_RE.sub(" ", stripped.lower()).strip()
+
+
+# ----------------- AHO-CORASICK -----------------
+class Automaton:
+    """
+    Aho-Corasick automaton over keyword -> category id. Matching walks the
+    text once regardless of how many keywords there are. The automaton is
+    complete when the constructor returns and never changes after that,
+    so request threads can match on it concurrently; adding a keyword
+    means building a new one (with_keyword).
+    """
+
+    def __init__(self, entries=()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]  # (keyword, category_id) ending at this node
+        self.entries = {}
+        for keyword, category_id in entries:
+            self._add(keyword, category_id)
+        self._build_links()
+
+    def with_keyword(self, keyword, category_id):
+        return Automaton(list(self.entries.items()) + [(keyword, category_id)])
+
+    def _add(self, keyword, category_id):
+        keyword = normalize_text(keyword)
+        if not keyword:
+            return
+        self.entries[keyword] = category_id
+        node = 0
+        for char in keyword:
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+            node = nxt
+        self.output[node] = (keyword, category_id)
+
+    def _build_links(self):
+        """Breadth-first pass setting each node's failure link."""
+        fail = self.fail
+        queue = deque()
+        for child in self.goto[0].values():
+            fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in self.goto[state]:
+                    state = fail[state]
+                fail[child] = self.goto[state].get(char, 0)
+
+    def matches(self, text):
+        """
+        Yields (keyword, category_id) for every keyword found in the
+        normalized text on word boundaries.
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            state = node
+            while state:
+                hit = output[state]
+                if hit is not None:
+                    start = end - len(hit[0]) + 1
+                    before_ok = start == 0 or not text[start - 1].isalnum()
+                    after_ok = end + 1 == len(text) or not text[end + 1].isalnum()
+                    if before_ok and after_ok:
+                        yield hit
+                state = fail[state]
+
+
+def _best(matches):
+    """Longest keyword wins: 'caffe bar marina' beats 'marina'."""
+    best = None
+    for keyword, category_id in matches:
+        if best is None or len(keyword) > len(best[0]):
+            best = (keyword, category_id)
+    return best
+
+
+# ----------------- DICTIONARIES -----------------
+_global_automaton = None  # (automaton, loaded_at)
+_user_automata = OrderedDict()  # user_id -> (automaton, loaded_at), least recently used first
+_lock = threading.Lock()
+
+
+def _load_entries(user_id):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if user_id is None:
+                cur.execute("SELECT keyword, category_id FROM merchant_keywords WHERE user_id IS NULL")
+            else:
+                cur.execute("SELECT keyword, category_id FROM merchant_keywords WHERE user_id = %s", (user_id,))
+            return cur.fetchall()
+
+
+def _global():
+    global _global_automaton
+    now = time.monotonic()
+    cached = _global_automaton
+    if cached and now - cached[1] < USER_DICTIONARY_TTL:
+        return cached[0]
+    automaton = Automaton(_load_entries(None))
+    with _lock:
+        _global_automaton = (automaton, now)
+    return automaton
+
+
+def _store_user(user_id, automaton, loaded_at):
+    # Caller holds _lock
+    _user_automata[user_id] = (automaton, loaded_at)
+    _user_automata.move_to_end(user_id)
+    while len(_user_automata) > MAX_USER_DICTIONARIES:
+        _user_automata.popitem(last=False)
+
+
+def _for_user(user_id):
+    now = time.monotonic()
+    with _lock:
+        cached = _user_automata.get(user_id)
+        if cached:
+            _user_automata.move_to_end(user_id)
+    if cached and now - cached[1] < USER_DICTIONARY_TTL:
+        return cached[0]
+    automaton = Automaton(_load_entries(user_id))
+    with _lock:
+        _store_user(user_id, automaton, now)
+    return automaton
+
+
+def forget_dictionaries():
+    """
+    Drops every dictionary this process holds, e.g. after a category
+    delete took its keywords with it. They are reloaded on next use.
+    """
+    global _global_automaton
+    with _lock:
+        _global_automaton = None
+        _user_automata.clear()
+
+
+def suggest_category(user_id, text):
+    """
+    Suggests a category for an expense description or receipt text.
+    The user's learned keywords take precedence over the global ones.
+    Returns {"category_id", "keyword", "source"} or None.
+    """
+    text = normalize_text(text)
+    if not text:
+        return None
+    for source, automaton in (("user", _for_user(user_id)), ("global", _global())):
+        hit = _best(automaton.matches(text))
+        if hit:
+            return {"category_id": hit[1], "keyword": hit[0], "source": source}
+    return None
+
+
+def merchant_keyword(text):
+    """
+    The keyword to learn from a description: its leading words up to the
+    first one containing a digit (dates, amounts, receipt numbers), at
+    most MAX_KEYWORD_WORDS of them. None if that leaves nothing stable.
+    """
+    words = []
+    for word in normalize_text(text).split(" "):
+        word = word.strip(string.punctuation)
+        if not word or any(ch.isdigit() for ch in word):
+            break
+        words.append(word)
+        if len(words) == MAX_KEYWORD_WORDS:
+            break
+    keyword = " ".join(words)[:MAX_KEYWORD_LENGTH].strip()
+    return keyword if len(keyword) >= MIN_KEYWORD_LENGTH else None
+
+
+def learn_category(user_id, text, category_id):
+    """
+    Remembers that this user files descriptions starting with this
+    merchant under category_id. Only the user's own automaton is
+    replaced; the global one is untouched.
+    """
+    keyword = merchant_keyword(text)
+    if not keyword:
+        return
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO merchant_keywords (user_id, keyword, category_id, hits, updated_at)
+                VALUES (%s, %s, %s, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id, keyword) DO UPDATE
+                SET category_id = EXCLUDED.category_id,
+                    hits = merchant_keywords.hits + 1,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (user_id, keyword, category_id))
+            conn.commit()
+
+    with _lock:
+        cached = _user_automata.get(user_id)
+    if cached:
+        # Built outside the lock, published whole
+        automaton = cached[0].with_keyword(keyword, category_id)
+        with _lock:
+            if _user_automata.get(user_id) is cached:
+                _store_user(user_id, automaton, cached[1])
@@ -1,8 +1,19 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required
-from app.utils import get_db_connection  # absolute import
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils import get_db_connection, bump_versions, conditional_get, notify_all, json_array_sql, json_response, SQL_JSON_RESPONSES, CATEGORIES_SCOPE  # absolute import
+from app.categories.merchants import suggest_category, forget_dictionaries
 
 categories_bp = Blueprint("categories", __name__, url_prefix="/categories")
+
+
+CATEGORIES_JSON_SQL = json_array_sql("SELECT id, name FROM categories", "r.name")
+
+
+def list_categories(conn):
+    """All categories ordered by name, as [{"id", "name"}]."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, name FROM categories ORDER BY name")
+        return [{"id": row[0], "name": row[1]} for row in cur.fetchall()]
  
 
 
@@ -76,12 +87,15 @@ def api_create_category():
                 "INSERT INTO categories (name) VALUES (%s) RETURNING id", (name,)
             )
             category_id = cur.fetchone()[0]
+            bump_versions(cur, CATEGORIES_SCOPE)
+            notify_all(cur, categories={"op": "created", "id": category_id})
             conn.commit()
 
     return jsonify({"id": category_id, "name": name}), 201
 
 @categories_bp.route("", methods=["GET"])
 @jwt_required()
+@conditional_get(CATEGORIES_SCOPE)
 def api_get_categories():
     """
     Get all categories
@@ -118,9 +132,11 @@ def api_get_categories():
 
     """Get all global categories"""
     with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, name FROM categories ORDER BY name")
-            categories = [{"id": row[0], "name": row[1]} for row in cur.fetchall()]
+        if SQL_JSON_RESPONSES:
+            with conn.cursor() as cur:
+                cur.execute(CATEGORIES_JSON_SQL)
+                return json_response(cur.fetchone()[0])
+        categories = list_categories(conn)
 
     return jsonify(categories)
 
@@ -207,6 +223,8 @@ def update_category(id):
             updated = cur.fetchone()
             if updated is None:
                 return jsonify({"error": "Category not found"}), 404
+            bump_versions(cur, CATEGORIES_SCOPE)
+            notify_all(cur, categories={"op": "updated", "id": id}, aggregation={})
             conn.commit()
 
     return jsonify({"id": id, "name": name})
@@ -259,15 +277,99 @@ def delete_category(id):
     """Delete a global category"""
     with get_db_connection() as conn:
         with conn.cursor() as cur:
+            # Expenses go with the category (ON DELETE CASCADE): lock their
+            # owners like the expense handlers do and leave sync tombstones
+            cur.execute("""
+                SELECT id FROM users
+                WHERE id IN (SELECT DISTINCT user_id FROM expenses WHERE category_id = %s)
+                ORDER BY id
+                FOR UPDATE
+            """, (id,))
+            cur.execute("""
+                INSERT INTO expense_tombstones (expense_id, user_id)
+                SELECT id, user_id FROM expenses WHERE category_id = %s
+                ON CONFLICT (expense_id) DO NOTHING
+            """, (id,))
+            # receipts.expense_id can't be a foreign key to the partitioned table
+            cur.execute("""
+                UPDATE receipts SET expense_id = NULL
+                WHERE expense_id IN (SELECT id FROM expenses WHERE category_id = %s)
+            """, (id,))
+
             cur.execute(
                 "DELETE FROM categories WHERE id = %s RETURNING id", (id,)
             )
             deleted = cur.fetchone()
             if deleted is None:
                 return jsonify({"error": "Category not found"}), 404
+            bump_versions(cur, CATEGORIES_SCOPE)
+            notify_all(cur, categories={"op": "deleted", "id": id}, aggregation={})
             conn.commit()
 
+    # Its merchant keywords went with it; other processes catch up within MERCHANT_DICTIONARY_TTL
+    forget_dictionaries()
     return jsonify({"message": "Category deleted"})
 
-  
 
+@categories_bp.route("/suggest", methods=["GET"])
+@jwt_required()
+def api_suggest_category():
+    """
+    Suggest a category for an expense description or receipt text
+    ---
+    tags:
+      - Categories
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Description or receipt text to match against the merchant dictionary
+    responses:
+      200:
+        description: Best matching category, or null when nothing matched
+        schema:
+          type: object
+          properties:
+            category_id:
+              type: integer
+              example: 3
+            name:
+              type: string
+              example: "Groceries"
+            keyword:
+              type: string
+              example: "konzum"
+            source:
+              type: string
+              enum: [user, global]
+              example: "global"
+      400:
+        description: Missing query
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "q is required"
+    """
+    user_id = get_jwt_identity()
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+
+    suggestion = suggest_category(user_id, q)
+    if suggestion is None:
+        return jsonify(None)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT name FROM categories WHERE id = %s", (suggestion["category_id"],))
+            row = cur.fetchone()
+    if row is None:
+        return jsonify(None)
+    return jsonify({**suggestion, "name": row[0]})
@@ -0,0 +1,3 @@
+#from flask import Blueprint
+
+#dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/dashboard")
@@ -0,0 +1,121 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.datastructures import MultiDict
+from app.utils import apply_monthly_payday, get_db_connection, pooled_connection, conditional_get, single_flight, CATEGORIES_SCOPE  # absolute import
+from app.users.routes import get_profile
+from app.aggregation.routes import compute_aggregation
+from app.expenses.routes import query_expenses, MAX_PAGE_SIZE
+from app.categories.routes import list_categories
+
+dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/dashboard")
+
+DASHBOARD_WORKERS = int(os.environ.get("DASHBOARD_WORKERS", 8))
+DEFAULT_RECENT = 10
+
+# Shared by all requests; each task borrows its own pooled connection
+_executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix="dashboard")
+
+
+def _in_snapshot(snapshot_id, fn, *args):
+    """Runs fn(conn, *args) on a pooled connection that sees snapshot_id."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+        return fn(conn, *args)
+
+
+@dashboard_bp.route("", methods=["GET"])
+@jwt_required()
+@conditional_get("user", CATEGORIES_SCOPE)
+@single_flight
+def dashboard():
+    """
+    Everything the dashboard shows, in one call
+    ---
+    tags:
+      - Dashboard
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    parameters:
+      - name: period
+        in: query
+        type: string
+        enum: [month, quarter, year]
+        default: month
+        description: Aggregation period
+      - name: recent
+        in: query
+        type: integer
+        default: 10
+        description: Number of most recent expenses
+    responses:
+      200:
+        description: |
+          The /me, /aggregation/, /expenses?limit=recent and /categories
+          payloads, all read from the same database snapshot
+        schema:
+          type: object
+          properties:
+            me:
+              type: object
+            aggregation:
+              type: object
+            recentExpenses:
+              type: array
+              items:
+                type: object
+            categories:
+              type: array
+              items:
+                type: object
+      304:
+        description: Not modified since the ETag in If-None-Match
+      400:
+        description: Invalid period
+      404:
+        description: User not found
+    """
+    user_id = get_jwt_identity()
+    period = request.args.get("period", "month")
+    if period not in ("month", "quarter", "year"):
+        return jsonify({"error": "Invalid period, use month|quarter|year"}), 400
+    recent = max(1, min(request.args.get("recent", DEFAULT_RECENT, type=int), MAX_PAGE_SIZE))
+
+    apply_monthly_payday(user_id)
+
+    # The four reads run in parallel. The lead connection exports its
+    # snapshot so the pooled ones see exactly the same data. It is not
+    # taken from the pool, so waiting on the others can't exhaust it.
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cur.execute("SELECT pg_export_snapshot()")
+            snapshot_id = cur.fetchone()[0]
+
+        aggregation = _executor.submit(_in_snapshot, snapshot_id, compute_aggregation, user_id, period)
+        expenses = _executor.submit(_in_snapshot, snapshot_id, query_expenses, user_id, MultiDict({"limit": recent}))
+        categories = _executor.submit(_in_snapshot, snapshot_id, list_categories)
+        try:
+            profile = get_profile(conn, user_id)
+        finally:
+            # The exporting transaction must stay open until the others have imported it
+            for future in (aggregation, expenses, categories):
+                future.exception()
+    finally:
+        conn.close()
+
+    if profile is None:
+        return jsonify({"error": "User not found"}), 404
+
+    return jsonify({
+        "me": profile,
+        "aggregation": aggregation.result(),
+        "recentExpenses": expenses.result()[0],
+        "categories": categories.result()
+    })
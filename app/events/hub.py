@@ -0,0 +1,107 @@
+import os
+import json
+import queue
+import select
+import threading
+import time
+from app.utils import get_db_connection, EVENTS_CHANNEL  # absolute import
+
+# ----------------- CONFIG -----------------
+# Events buffered per client; a client that falls further behind gets a
+# "resync" event instead and should re-fetch what it shows
+CLIENT_QUEUE_SIZE = int(os.environ.get("EVENTS_CLIENT_QUEUE_SIZE", 100))
+RECONNECT_DELAY = 2
+
+
+class EventHub:
+    """
+    Fans NOTIFY messages out to the /events clients of this process.
+    One LISTEN connection and one thread serve every client; each client
+    only owns a small queue.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # user_id -> set of queues
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_id):
+        client = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(str(user_id), set()).add(client)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, user_id, client):
+        with self._lock:
+            clients = self._subscribers.get(str(user_id))
+            if clients:
+                clients.discard(client)
+                if not clients:
+                    del self._subscribers[str(user_id)]
+
+    # ----------------- LISTENER -----------------
+    def _listen(self):
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = get_db_connection()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {EVENTS_CHANNEL}")
+                # Anything sent while we were disconnected is lost
+                if not first:
+                    self._broadcast("resync", {})
+                first = False
+
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"Event listener error: {e}")
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _dispatch(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        with self._lock:
+            if message.get("user") is None:
+                clients = [c for group in self._subscribers.values() for c in group]
+            else:
+                clients = list(self._subscribers.get(message["user"], ()))
+        for event, data in message.get("events", {}).items():
+            for client in clients:
+                self._deliver(client, event, data)
+
+    def _broadcast(self, event, data):
+        with self._lock:
+            clients = [c for group in self._subscribers.values() for c in group]
+        for client in clients:
+            self._deliver(client, event, data)
+
+    @staticmethod
+    def _deliver(client, event, data):
+        try:
+            client.put_nowait((event, data))
+        except queue.Full:
+            # Slow client: drop its backlog, tell it to re-fetch
+            try:
+                while True:
+                    client.get_nowait()
+            except queue.Empty:
+                pass
+            client.put_nowait(("resync", {}))
+
+
+hub = EventHub()
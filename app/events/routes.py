@@ -0,0 +1,69 @@
+import os
+import json
+import queue
+import time
+from flask import Blueprint, Response
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from app.events.hub import hub
+
+events_bp = Blueprint("events", __name__, url_prefix="/events")
+
+# Comment line sent when idle, so proxies don't close the connection
+HEARTBEAT_SECONDS = int(os.environ.get("EVENTS_HEARTBEAT_SECONDS", 15))
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@events_bp.route("", methods=["GET"])
+@jwt_required(locations=["headers", "query_string"])
+def events():
+    """
+    Server-Sent Events stream of the user's changes
+    ---
+    tags:
+      - Events
+    security:
+      - Bearer: []
+    produces:
+      - text/event-stream
+    parameters:
+      - name: jwt
+        in: query
+        type: string
+        required: false
+        description: Access token, for EventSource clients that can't send headers
+    responses:
+      200:
+        description: |
+          Event stream. Events: ready (connected), balance ({balance}),
+          expense ({op: created|updated|deleted, id}), aggregation (totals
+          changed, re-fetch /aggregation/), categories ({op, id}) and resync
+          (events were lost, re-fetch everything). The stream ends when the
+          token expires; reconnect with a fresh one.
+      401:
+        description: Unauthorized (JWT missing or invalid)
+    """
+    user_id = get_jwt_identity()
+    expires_at = get_jwt().get("exp")
+    client = hub.subscribe(user_id)
+
+    def _generate():
+        try:
+            yield "retry: 5000\n\n"
+            yield format_event("ready", {})
+            while expires_at is None or time.time() < expires_at:
+                try:
+                    event, data = client.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(event, data)
+        finally:
+            hub.unsubscribe(user_id, client)
+
+    return Response(_generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
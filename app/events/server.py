@@ -0,0 +1,34 @@
+"""
+Cooperative server for the long-lived /events streams. Under gevent an
+idle client is a parked greenlet rather than an OS thread, so thousands
+of open streams cost little memory. The rest of the API keeps running
+on the regular server.
+
+    python -m gevent.monkey --module app.events.server
+
+gevent.monkey patches the standard library before the app package (and
+Flask, JWT, ssl) are imported, which doing it in this module would be
+too late for.
+"""
+import os
+from gevent import monkey
+from gevent.pywsgi import WSGIServer
+from psycogreen.gevent import patch_psycopg
+from app import create_app
+
+EVENTS_HOST = os.environ.get("EVENTS_HOST", "0.0.0.0")
+EVENTS_PORT = int(os.environ.get("EVENTS_PORT", 5001))
+
+
+def main():
+    if not monkey.is_module_patched("socket"):
+        raise SystemExit("Start with: python -m gevent.monkey --module app.events.server")
+    # Database calls yield to other greenlets instead of blocking the loop
+    patch_psycopg()
+    server = WSGIServer((EVENTS_HOST, EVENTS_PORT), create_app())
+    print(f"Serving /events on {EVENTS_HOST}:{EVENTS_PORT}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import os
+from datetime import date
+from app.utils import get_db_connection, bump_versions, user_scope, Money  # absolute import
+from app.admin.partitions import add_months
+
+# ----------------- CONFIG -----------------
+ARCHIVE_ROOT = os.environ.get(
+    "EXPENSE_ARCHIVE_ROOT",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "archive")
+)
+# Expenses dated before the first of the month this many months back get archived
+ARCHIVE_AFTER_MONTHS = int(os.environ.get("EXPENSE_ARCHIVE_AFTER_MONTHS", 24))
+ARCHIVE_COMPRESSION = os.environ.get("EXPENSE_ARCHIVE_COMPRESSION", "zstd")
+# Rows are stored newest first; per row group min/max dates let date filters skip groups
+ARCHIVE_ROW_GROUP_ROWS = 16384
+
+# Sort order of archive files and of every result read from them
+NEWEST_FIRST = [("date", "descending"), ("id", "descending")]
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int32()),
+        ("date", pa.date32()),
+        ("description", pa.string()),
+        ("amount", pa.int64()),
+        ("category_id", pa.int32())
+    ])
+
+
+def archive_path(user_id):
+    return os.path.join(ARCHIVE_ROOT, f"{int(user_id)}.parquet")
+
+
+def has_archive(user_id):
+    return os.path.exists(archive_path(user_id))
+
+
+def archive_horizon(cur, user_id):
+    """
+    The date before which the user's expenses live in their archive file,
+    or None. Users without a file cost a stat() and no query.
+    """
+    if not has_archive(user_id):
+        return None
+    cur.execute("SELECT horizon FROM expense_archives WHERE user_id = %s", (user_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def reaches_archive(horizon, args):
+    """True if a query with the startDate in args reaches back past the horizon."""
+    if horizon is None:
+        return False
+    start_date = _parse_date(args.get("startDate"))
+    return start_date is None or start_date < horizon
+
+
+# ----------------- READING -----------------
+def read_archive(user_id, horizon, args=None, before=None, limit=None):
+    """
+    Reads the user's archived expenses through a memory map, newest first,
+    as a pyarrow Table with the columns of _schema(). args holds the
+    GET /expenses filters (categoryId, minAmount, maxAmount, startDate,
+    endDate), before a [date, id] keyset cursor.
+    Only rows dated before horizon count: the file can hold newer ones
+    while an archival run that rewrote it hasn't committed yet.
+    """
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    expr = pc.field("date") < horizon
+    if args is not None:
+        category_id = args.get("categoryId", type=int)
+        min_amount = args.get("minAmount", type=Money.parse)
+        max_amount = args.get("maxAmount", type=Money.parse)
+        start_date = _parse_date(args.get("startDate"))
+        end_date = _parse_date(args.get("endDate"))
+        if category_id is not None:
+            expr &= pc.field("category_id") == category_id
+        if min_amount is not None:
+            expr &= pc.field("amount") >= int(min_amount)
+        if max_amount is not None:
+            expr &= pc.field("amount") <= int(max_amount)
+        if start_date is not None:
+            expr &= pc.field("date") >= start_date
+        if end_date is not None:
+            expr &= pc.field("date") <= end_date
+    if before is not None:
+        expr &= (pc.field("date") < before[0]) | ((pc.field("date") == before[0]) & (pc.field("id") < before[1]))
+
+    table = pq.read_table(archive_path(user_id), memory_map=True, filters=expr, schema=_schema())
+    table = table.sort_by(NEWEST_FIRST)
+    return table if limit is None else table.slice(0, limit)
+
+
+def is_archived(user_id, expense_id):
+    """
+    True if the expense is in the user's archive, where the API can't
+    change it. Only asked after an update or delete found nothing, so
+    users without a file cost a stat().
+    """
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    if not has_archive(user_id):
+        return False
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            horizon = archive_horizon(cur, user_id)
+    if horizon is None:
+        return False
+    expr = (pc.field("id") == expense_id) & (pc.field("date") < horizon)
+    return pq.read_table(archive_path(user_id), memory_map=True, filters=expr,
+                         columns=["id"], schema=_schema()).num_rows > 0
+
+
+def _category_names(cur, category_ids):
+    cur.execute("SELECT id, name FROM categories WHERE id = ANY(%s)", (list(category_ids),))
+    return dict(cur.fetchall())
+
+
+def archived_rows(cur, user_id, horizon, args, before, limit):
+    """
+    The archived part of a GET /expenses page: at most limit + 1 rows
+    shaped like expenses_query's (id, description, amount, date,
+    category_id, name, score), newest first. Expenses whose category was
+    deleted since are left out, as the category's delete would have done.
+    """
+    table = read_archive(user_id, horizon, args, before, None if limit is None else limit + 1)
+    rows = table.to_pylist()
+    names = _category_names(cur, {row["category_id"] for row in rows})
+    return [
+        (row["id"], row["description"], row["amount"], row["date"], row["category_id"], names[row["category_id"]], 0)
+        for row in rows if row["category_id"] in names
+    ]
+
+
+def export_tail(user_id, horizon, where, params, args):
+    """
+    The end of an export whose database part stops at the horizon: the
+    database's few rows dated before it merged with the archive's, newest
+    first, as (id, date, description, amount in cents, category_id, category).
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT e.id, e.date, e.description, e.amount, e.category_id, c.name
+                FROM expenses e
+                JOIN categories c ON e.category_id = c.id
+                WHERE {where} AND e.date < %s
+            """, tuple(params) + (horizon,))
+            rows = cur.fetchall()
+            archived = read_archive(user_id, horizon, args).to_pylist()
+            names = _category_names(cur, {row["category_id"] for row in archived})
+        conn.rollback()
+    finally:
+        conn.close()
+
+    rows += [
+        (row["id"], row["date"], row["description"], row["amount"], row["category_id"], names[row["category_id"]])
+        for row in archived if row["category_id"] in names
+    ]
+    rows.sort(key=lambda r: (r[1], r[0]), reverse=True)
+    yield from rows
+
+
+# ----------------- ARCHIVING -----------------
+def archive_user(conn, user_id, horizon):
+    """
+    Moves the user's expenses dated before horizon into their archive file,
+    in one transaction that holds the user's row lock like every expense
+    write does. The rewritten file (old archive plus the moved rows) is
+    renamed into place before the rows are deleted and the new horizon is
+    recorded. Readers filter the file by the recorded horizon, so they see
+    every expense exactly once, even if the commit never happens.
+    Returns the number of rows moved.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema()
+    path = archive_path(user_id)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (user_id,))
+            if cur.fetchone() is None:
+                conn.rollback()
+                return 0
+            old_horizon = archive_horizon(cur, user_id)
+            if old_horizon is not None and old_horizon >= horizon:
+                conn.rollback()
+                return 0
+
+            cur.execute("""
+                SELECT id, date, description, amount, category_id FROM expenses
+                WHERE user_id = %s AND date < %s
+            """, (user_id, horizon))
+            rows = cur.fetchall()
+            if not rows and old_horizon is None:
+                conn.rollback()
+                return 0
+
+            columns = list(zip(*rows)) if rows else [[] for _ in schema]
+            moved = pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            )
+            tables = [moved]
+            if old_horizon is not None:
+                tables.append(read_archive(user_id, old_horizon))
+
+            os.makedirs(ARCHIVE_ROOT, exist_ok=True)
+            pq.write_table(pa.concat_tables(tables).sort_by(NEWEST_FIRST), path + ".tmp",
+                           compression=ARCHIVE_COMPRESSION, row_group_size=ARCHIVE_ROW_GROUP_ROWS)
+            os.replace(path + ".tmp", path)
+
+            cur.execute("DELETE FROM expenses WHERE user_id = %s AND id = ANY(%s)", (user_id, [row[0] for row in rows]))
+            cur.execute("""
+                INSERT INTO expense_archives (user_id, horizon, rows) VALUES (%s, %s, %s)
+                ON CONFLICT (user_id) DO UPDATE
+                SET horizon = EXCLUDED.horizon, rows = expense_archives.rows + EXCLUDED.rows, archived_at = CURRENT_TIMESTAMP
+            """, (user_id, horizon, len(rows)))
+            # Search results no longer include the archived expenses
+            bump_versions(cur, user_scope(user_id))
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def archive_expenses(months=ARCHIVE_AFTER_MONTHS):
+    """
+    The archival job: for every user with expenses older than the first of
+    the month `months` back, moves them to the archive. One transaction per
+    user. Yields (user_id, rows moved).
+    """
+    horizon = add_months(date.today().replace(day=1), -months)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT user_id FROM expenses WHERE date < %s ORDER BY user_id", (horizon,))
+            user_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        for user_id in user_ids:
+            yield user_id, archive_user(conn, user_id, horizon)
+    finally:
+        conn.close()
+
+
+def remove_archive(user_id):
+    """Deletes a deleted user's archive file."""
+    try:
+        os.remove(archive_path(user_id))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,309 @@
+"""
+Per-user columnar expense cache for analytics. A user's whole history
+(archived expenses included) is a few hundred KB as a NumPy structured
+array of id, date, category and amount in cents, so totals, series and
+percentiles are computed here instead of in SQL.
+
+Each entry is stamped with the user's and the categories' data versions
+it reflects. The expense write paths patch the entry with the version
+their statement bumped; anything else that bumps a version (another
+worker process, payday, archival, a category delete) leaves the entry
+behind, and the next read reloads it. Entries are evicted least recently
+used once EXPENSE_CACHE_MAX_BYTES is exceeded.
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from flask import g, has_app_context
+from app.utils import user_scope, Money, CATEGORIES_SCOPE  # absolute import
+from app.expenses.archive import has_archive, read_archive
+
+# ----------------- CONFIG -----------------
+EXPENSE_CACHE_ENABLED = os.environ.get("EXPENSE_CACHE", "1") == "1"
+EXPENSE_CACHE_MAX_BYTES = int(os.environ.get("EXPENSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Rows are kept sorted by (date, id)
+EXPENSE_DTYPE = np.dtype([
+    ("id", np.int32),
+    ("date", "datetime64[D]"),
+    ("category_id", np.int32),
+    ("amount", np.int64)
+])
+
+BUCKET_UNITS = ("day", "week", "month", "year")
+
+# Versions, categories and expenses in one statement, so they come from one snapshot
+LOAD_SQL = """
+    SELECT COALESCE((SELECT version FROM data_versions WHERE scope = %(scope)s), 0),
+           COALESCE((SELECT version FROM data_versions WHERE scope = %(categories)s), 0),
+           (SELECT horizon FROM expense_archives WHERE user_id = %(user_id)s::int),
+           (SELECT json_object_agg(id, name) FROM categories),
+           array_agg(id ORDER BY date, id),
+           array_agg(date ORDER BY date, id),
+           array_agg(category_id ORDER BY date, id),
+           array_agg(amount ORDER BY date, id)
+    FROM expenses WHERE user_id = %(user_id)s::int
+"""
+
+
+def _in_batch():
+    # A /batch connection may hold writes that are never committed
+    return has_app_context() and g.get("_batch_connection") is not None
+
+
+class ExpenseColumns:
+    """
+    An immutable set of one user's expenses with a small query API.
+    names maps category ids to category names as of the load.
+    """
+
+    __slots__ = ("rows", "names")
+
+    def __init__(self, rows, names):
+        self.rows = rows
+        self.names = names
+
+    def __len__(self):
+        return len(self.rows)
+
+    def filter(self, start=None, end=None, category_ids=None, min_amount=None, max_amount=None):
+        """Expenses with start <= date <= end, in the given categories and amount range."""
+        rows = self.rows
+        # Sorted by date: the date range is a slice
+        lo = 0 if start is None else np.searchsorted(rows["date"], np.datetime64(start, "D"), "left")
+        hi = len(rows) if end is None else np.searchsorted(rows["date"], np.datetime64(end, "D"), "right")
+        rows = rows[lo:hi]
+
+        mask = None
+        if category_ids is not None:
+            mask = np.isin(rows["category_id"], list(category_ids))
+        if min_amount is not None:
+            mask = (rows["amount"] >= int(min_amount)) if mask is None else mask & (rows["amount"] >= int(min_amount))
+        if max_amount is not None:
+            mask = (rows["amount"] <= int(max_amount)) if mask is None else mask & (rows["amount"] <= int(max_amount))
+        return ExpenseColumns(rows if mask is None else rows[mask], self.names)
+
+    def total(self):
+        return Money(int(self.rows["amount"].sum()))
+
+    def group_by(self, key="category"):
+        """
+        Totals per category id ("category") or per category name ("name"),
+        as {key: Money}.
+        """
+        if key not in ("category", "name"):
+            raise ValueError(key)
+        ids, inverse = np.unique(self.rows["category_id"], return_inverse=True)
+        sums = np.zeros(len(ids), dtype=np.int64)
+        np.add.at(sums, inverse, self.rows["amount"])
+
+        totals = {}
+        for category_id, total in zip(ids.tolist(), sums.tolist()):
+            group = category_id if key == "category" else self.names.get(category_id)
+            totals[group] = totals.get(group, Money(0)) + total
+        return totals
+
+    def bucket(self, unit="day", start=None, end=None):
+        """
+        Totals per day, week (starting Monday), month or year as a list of
+        (first day of the bucket, Money), with every bucket from start (or
+        the first expense) to end (or the last expense), empty ones as 0.
+        """
+        if unit not in BUCKET_UNITS:
+            raise ValueError(unit)
+        dates = self.rows["date"]
+        if not len(dates) and (start is None or end is None):
+            return []
+        first = np.datetime64(start, "D") if start is not None else dates[0]
+        last = np.datetime64(end, "D") if end is not None else dates[-1]
+
+        keys = self._bucket_start(dates, unit)
+        first, last = self._bucket_start(np.array([first, last]), unit)
+        starts = self._bucket_range(first, last, unit)
+
+        sums = np.zeros(len(starts), dtype=np.int64)
+        inside = (keys >= first) & (keys <= last)
+        np.add.at(sums, np.searchsorted(starts, keys[inside]), self.rows["amount"][inside])
+        return [(day, Money(total)) for day, total in zip(starts.astype(object).tolist(), sums.tolist())]
+
+    @staticmethod
+    def _bucket_start(dates, unit):
+        if unit == "day":
+            return dates
+        if unit == "week":
+            # 1970-01-01 was a Thursday
+            days = dates.astype(np.int64)
+            return (days - (days + 3) % 7).astype("datetime64[D]")
+        return dates.astype("datetime64[M]" if unit == "month" else "datetime64[Y]").astype("datetime64[D]")
+
+    @staticmethod
+    def _bucket_range(first, last, unit):
+        if unit == "day":
+            return np.arange(first, last + 1)
+        if unit == "week":
+            return np.arange(first, last + 1, 7)
+        step = "datetime64[M]" if unit == "month" else "datetime64[Y]"
+        return np.arange(first.astype(step), last.astype(step) + 1).astype("datetime64[D]")
+
+    def percentiles(self, qs):
+        """Expense amounts at the given percentiles (0-100), as Money; None without expenses."""
+        if not len(self.rows):
+            return [None for _ in qs]
+        values = np.percentile(self.rows["amount"], qs, method="lower")
+        return [Money(int(value)) for value in np.atleast_1d(values)]
+
+
+class _Entry:
+    __slots__ = ("columns", "version", "categories_version")
+
+    def __init__(self, columns, version, categories_version):
+        self.columns = columns
+        self.version = version
+        self.categories_version = categories_version
+
+
+class ExpenseCache:
+    """
+    LRU map of user id -> ExpenseColumns. get() loads on a miss or when
+    the stamped versions are stale; insert/update/delete patch a cached
+    entry after a committed write.
+    """
+
+    def __init__(self, max_bytes=EXPENSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user id -> _Entry, least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.loads = 0
+        self.patches = 0
+
+    def get(self, conn, user_id, versions=None):
+        """
+        The user's expenses as ExpenseColumns. versions is {scope: version}
+        for the user and categories scopes if the caller already read them
+        (conditional_get does); otherwise they are looked up on conn.
+        """
+        user_id = int(user_id)
+        if not EXPENSE_CACHE_ENABLED or _in_batch():
+            return self._load(conn, user_id)[0]
+
+        if versions is None:
+            with conn.cursor() as cur:
+                cur.execute("SELECT scope, version FROM data_versions WHERE scope = ANY(%s)",
+                            ([user_scope(user_id), CATEGORIES_SCOPE],))
+                versions = dict(cur.fetchall())
+        version = versions.get(user_scope(user_id), 0)
+        categories_version = versions.get(CATEGORIES_SCOPE, 0)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.version == version and entry.categories_version == categories_version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry.columns
+
+        columns, version, categories_version = self._load(conn, user_id)
+        with self._lock:
+            self.loads += 1
+            self._store(user_id, _Entry(columns, version, categories_version))
+        return columns
+
+    def _load(self, conn, user_id):
+        with conn.cursor() as cur:
+            cur.execute(LOAD_SQL, {"scope": user_scope(user_id), "categories": CATEGORIES_SCOPE, "user_id": user_id})
+            version, categories_version, horizon, names, ids, dates, category_ids, amounts = cur.fetchone()
+        names = {int(category_id): name for category_id, name in (names or {}).items()}
+
+        rows = np.empty(len(ids or ()), dtype=EXPENSE_DTYPE)
+        if ids:
+            rows["id"] = ids
+            rows["date"] = dates
+            rows["category_id"] = category_ids
+            rows["amount"] = amounts
+
+        if horizon is not None and has_archive(user_id):
+            import pyarrow as pa
+            import pyarrow.compute as pc
+
+            table = read_archive(user_id, horizon)
+            archived = np.empty(table.num_rows, dtype=EXPENSE_DTYPE)
+            archived["id"] = table.column("id").to_numpy()
+            archived["date"] = pc.cast(table.column("date"), pa.int32()).to_numpy().astype("datetime64[D]")
+            archived["category_id"] = table.column("category_id").to_numpy()
+            archived["amount"] = table.column("amount").to_numpy()
+            # Expenses of since deleted categories are gone, as in the database
+            archived = archived[np.isin(archived["category_id"], list(names))]
+            rows = np.concatenate([archived, rows])
+            rows = rows[np.lexsort((rows["id"], rows["date"]))]
+
+        return ExpenseColumns(rows, names), version, categories_version
+
+    def _store(self, user_id, entry):
+        self._drop(user_id)
+        self._entries[user_id] = entry
+        self._bytes += entry.columns.rows.nbytes
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.columns.rows.nbytes
+
+    # ----------------- WRITE PATHS -----------------
+    def _patch(self, user_id, version, change):
+        """
+        Applies change(rows) -> new rows if the entry is exactly one write
+        behind version; any other entry for the user is dropped. Rows are
+        replaced, never modified, so a query holding the old ones is unaffected.
+        """
+        user_id = int(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if version is None or entry.version != version - 1 or _in_batch():
+                self._drop(user_id)
+                return
+            columns = ExpenseColumns(change(entry.columns.rows), entry.columns.names)
+            self._store(user_id, _Entry(columns, version, entry.categories_version))
+            self.patches += 1
+
+    def insert(self, user_id, version, expenses):
+        """expenses: (id, date, category_id, amount in cents) tuples written under version."""
+        def change(rows):
+            added = np.array([(i, np.datetime64(day, "D"), c, int(a)) for i, day, c, a in expenses], dtype=EXPENSE_DTYPE)
+            rows = np.concatenate([rows, added])
+            return rows[np.lexsort((rows["id"], rows["date"]))]
+        self._patch(user_id, version, change)
+
+    def update(self, user_id, version, expense_id, expense_date=None, category_id=None, amount=None):
+        def change(rows):
+            rows = rows.copy()
+            at = rows["id"] == expense_id
+            if expense_date is not None:
+                rows["date"][at] = np.datetime64(expense_date, "D")
+            if category_id is not None:
+                rows["category_id"][at] = int(category_id)
+            if amount is not None:
+                rows["amount"][at] = int(amount)
+            return rows if expense_date is None else rows[np.lexsort((rows["id"], rows["date"]))]
+        self._patch(user_id, version, change)
+
+    def delete(self, user_id, version, expense_id):
+        self._patch(user_id, version, lambda rows: rows[rows["id"] != expense_id])
+
+    def forget(self, user_id):
+        with self._lock:
+            self._drop(int(user_id))
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry.columns.rows.nbytes
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+                    "loads": self.loads, "patches": self.patches}
+
+
+expense_cache = ExpenseCache()
@@ -0,0 +1,233 @@
+import io
+import csv
+import zlib
+import queue
+import threading
+import orjson
+from app.utils import get_db_connection, Money  # absolute import
+
+# ----------------- CONFIG -----------------
+# Rows fetched per round trip from the server-side cursor
+FETCH_ROWS = 5000
+# Rows per Parquet row group
+PARQUET_ROWS = 50000
+# COPY output is handed to the response in chunks; at most this many are buffered
+COPY_QUEUE_CHUNKS = 16
+
+# Amounts are stored in cents and exported in major units (25.50)
+EXPORT_COLUMNS = "e.id, e.date, e.description, (e.amount / 100.0)::numeric(20,2) AS amount, c.id AS category_id, c.name AS category"
+
+_DONE = object()
+
+
+def export_query(where):
+    return f"""
+        SELECT {EXPORT_COLUMNS}
+        FROM expenses e
+        JOIN categories c ON e.category_id = c.id
+        WHERE {where}
+        ORDER BY e.date DESC, e.id DESC
+    """
+
+
+# ----------------- CSV (COPY) -----------------
+class _QueueWriter:
+    """File-like target for copy_expert that hands each write to the consumer."""
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            raise IOError("Export cancelled")
+        self.chunks.put(data if isinstance(data, bytes) else data.encode("utf-8"))
+        return len(data)
+
+
+def csv_chunks(where, params, tail=None):
+    """
+    Streams COPY ... TO STDOUT output. copy_expert blocks until the copy
+    is done, so it runs in a thread feeding a bounded queue; the response
+    drains the queue and the thread waits whenever the client is slower.
+    tail rows (id, date, description, cents, category_id, category), if
+    any, follow as CSV lines in the same format.
+    """
+    chunks = queue.Queue(maxsize=COPY_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    errors = []
+
+    def _copy():
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                select = cur.mogrify(export_query(where), params).decode("utf-8")
+                cur.copy_expert(f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)", _QueueWriter(chunks, cancelled))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+            chunks.put(_DONE)
+
+    thread = threading.Thread(target=_copy, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+        if tail is not None:
+            yield from _csv_lines(tail)
+    finally:
+        # Client went away: stop the copy and unblock the writer
+        cancelled.set()
+        while thread.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for count, (expense_id, day, description, cents, category_id, category) in enumerate(rows, 1):
+        # str(Money) matches the numeric(20,2) text COPY writes
+        writer.writerow((expense_id, day.isoformat(), description, str(Money(cents)), category_id, category))
+        if count % FETCH_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# ----------------- NDJSON -----------------
+def ndjson_chunks(where, params, tail=None):
+    """
+    One JSON object per line, serialized by PostgreSQL (row_to_json) and
+    read through a server-side cursor, so Python never builds the rows.
+    tail rows, if any, follow in the same format (_ndjson_line).
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(name="expenses_export") as cur:
+            cur.itersize = FETCH_ROWS
+            cur.execute(f"SELECT row_to_json(x)::text FROM ({export_query(where)}) x", params)
+            while True:
+                rows = cur.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                yield "".join(row[0] + "\n" for row in rows).encode("utf-8")
+    finally:
+        conn.close()
+
+    if tail is not None:
+        lines = []
+        for row in tail:
+            lines.append(_ndjson_line(*row))
+            if len(lines) == FETCH_ROWS:
+                yield b"".join(lines)
+                lines = []
+        yield b"".join(lines)
+
+
+def _ndjson_line(expense_id, day, description, cents, category_id, category):
+    # row_to_json writes numeric(20,2) as an unquoted 25.50; orjson has no
+    # raw number, so the amount goes in as str(Money) text
+    return b'{"id":%d,"date":%s,"description":%s,"amount":%s,"category_id":%d,"category":%s}\n' % (
+        expense_id, orjson.dumps(day), orjson.dumps(description), str(Money(cents)).encode("ascii"),
+        category_id, orjson.dumps(category)
+    )
+
+
+# ----------------- PARQUET -----------------
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects what the Parquet writer produces."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def parquet_chunks(where, params, tail=None):
+    """
+    Writes one row group per PARQUET_ROWS rows and yields the bytes as
+    soon as each group is written; tail rows, if any, go into the same
+    file after the database's. Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int32()),
+        ("date", pa.date32()),
+        ("description", pa.string()),
+        ("amount", pa.float64()),
+        ("category_id", pa.int32()),
+        ("category", pa.string())
+    ])
+    sink = _ChunkSink()
+    conn = get_db_connection()
+    try:
+        with conn.cursor(name="expenses_export") as cur:
+            cur.itersize = PARQUET_ROWS
+            cur.execute(
+                f"SELECT id, date, description, amount::float8, category_id, category FROM ({export_query(where)}) x",
+                params
+            )
+            with pq.ParquetWriter(sink, schema) as writer:
+                def _write(rows):
+                    columns = list(zip(*rows))
+                    writer.write_batch(pa.RecordBatch.from_arrays(
+                        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                        schema=schema
+                    ))
+
+                while True:
+                    rows = cur.fetchmany(PARQUET_ROWS)
+                    if not rows:
+                        break
+                    _write(rows)
+                    yield sink.take()
+
+                rows = []
+                for expense_id, day, description, cents, category_id, category in tail or ():
+                    rows.append((expense_id, day, description, Money(cents).to_float(), category_id, category))
+                    if len(rows) == PARQUET_ROWS:
+                        _write(rows)
+                        yield sink.take()
+                        rows = []
+                if rows:
+                    _write(rows)
+            yield sink.take()
+    finally:
+        conn.close()
+
+
+# ----------------- COMPRESSION -----------------
+def gzip_chunks(chunks, level=6):
+    """Gzips a stream of byte chunks on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
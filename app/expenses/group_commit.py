@@ -0,0 +1,207 @@
+"""
+Group commit for POST /expenses. With EXPENSE_GROUP_COMMIT=1, concurrent
+create-expense requests hand their row to one writer thread, which
+collects whatever arrives within a few milliseconds and writes it all in
+a single transaction: one multi-row insert, one balance update per user,
+one commit (and one WAL flush). Each request returns only after that
+commit, so an acknowledged expense is as durable as before.
+"""
+import os
+import queue
+import threading
+import time
+import psycopg2
+from app.utils import get_db_connection, bump_versions, user_scope, notify_users, Money  # absolute import
+from app.expenses.cache import expense_cache
+
+# ----------------- CONFIG -----------------
+GROUP_COMMIT_ENABLED = os.environ.get("EXPENSE_GROUP_COMMIT", "0") == "1"
+# How long the writer waits for more requests after the first one arrives.
+# Requests that queue up while a batch is being written join the next one
+# regardless, so 0 still batches under load without adding latency.
+GROUP_COMMIT_WINDOW = int(os.environ.get("EXPENSE_GROUP_COMMIT_WINDOW_MS", 5)) / 1000
+GROUP_COMMIT_MAX = int(os.environ.get("EXPENSE_GROUP_COMMIT_MAX", 500))
+
+
+class ExpenseWriter:
+    """
+    Owns one connection and one thread. submit() blocks the calling
+    request until its expense is committed (or has failed).
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+
+    def submit(self, user_id, description, amount, category_id, expense_date, receipt_id):
+        """
+        Returns {"id", "balance", "category": (id, name)} once committed,
+        or {"error", "status"} when the expense was rejected.
+        """
+        item = {
+            "user_id": int(user_id),
+            "description": description,
+            "amount": amount,
+            "category_id": int(category_id),
+            "date": expense_date,
+            "receipt_id": receipt_id,
+            "done": threading.Event(),
+            "result": None,
+            "error": None
+        }
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="expense-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(item)
+        item["done"].wait()
+        if item["error"] is not None:
+            raise item["error"]
+        return item["result"]
+
+    # ----------------- WRITER -----------------
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            results = self._write(batch)
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            # One bad row shouldn't fail its neighbours: write them one by one
+            results = []
+            for item in batch:
+                try:
+                    results.extend(self._write([item]))
+                except Exception as e:
+                    results.append(e)
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for item, result in zip(batch, results):
+            if isinstance(result, Exception):
+                item["error"] = result
+            else:
+                item["result"] = result
+            item["done"].set()
+
+    def _write(self, batch):
+        """Writes the batch in one transaction; returns one result per item."""
+        if self._conn is None or self._conn.closed:
+            self._conn = get_db_connection()
+        conn = self._conn
+        try:
+            with conn.cursor() as cur:
+                results, versions = self._insert(cur, batch)
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+        # One version bump per user covers all of the user's rows in the batch
+        written = {}
+        for item, result in zip(batch, results):
+            if "id" in result:
+                written.setdefault(item["user_id"], []).append(
+                    (result["id"], item["date"], item["category_id"], item["amount"])
+                )
+        for user_id, expenses in written.items():
+            expense_cache.insert(user_id, versions.get(user_scope(user_id)), expenses)
+        return results
+
+    @staticmethod
+    def _insert(cur, batch):
+        results = [None] * len(batch)
+
+        cur.execute(
+            "SELECT id, name FROM categories WHERE id = ANY(%s)",
+            (list({item["category_id"] for item in batch}),)
+        )
+        categories = dict(cur.fetchall())
+
+        # Lock the users in id order, like the single-row writers lock theirs,
+        # so change_seq order stays commit order per user
+        cur.execute(
+            "SELECT id, balance FROM users WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+            (sorted({item["user_id"] for item in batch}),)
+        )
+        balances = {user_id: Money(balance or 0) for user_id, balance in cur.fetchall()}
+
+        rows = []
+        for i, item in enumerate(batch):
+            if item["category_id"] not in categories:
+                results[i] = {"error": "Category not found", "status": 404}
+            elif item["user_id"] not in balances:
+                results[i] = {"error": "User not found", "status": 404}
+            else:
+                # Same balance each request would have seen had they run one after another
+                balances[item["user_id"]] -= item["amount"]
+                results[i] = {
+                    "balance": balances[item["user_id"]],
+                    "category": (item["category_id"], categories[item["category_id"]])
+                }
+                rows.append(i)
+        if not rows:
+            return results, {}
+
+        cur.execute(
+            "SELECT nextval(pg_get_serial_sequence('expenses', 'id')) FROM generate_series(1, %s)",
+            (len(rows),)
+        )
+        for i, (expense_id,) in zip(rows, cur.fetchall()):
+            results[i]["id"] = expense_id
+
+        written = [batch[i] for i in rows]
+        ids = [results[i]["id"] for i in rows]
+        cur.execute("""
+            INSERT INTO expenses (id, description, amount, category_id, user_id, date)
+            SELECT * FROM unnest(%s::int[], %s::text[], %s::bigint[], %s::int[], %s::int[], %s::date[])
+        """, (
+            ids,
+            [item["description"] for item in written],
+            [item["amount"] for item in written],
+            [item["category_id"] for item in written],
+            [item["user_id"] for item in written],
+            [item["date"] for item in written]
+        ))
+
+        users = sorted({item["user_id"] for item in written})
+        cur.execute("""
+            UPDATE users SET balance = b.balance
+            FROM unnest(%s::int[], %s::bigint[]) AS b(id, balance)
+            WHERE users.id = b.id
+        """, (users, [balances[user_id] for user_id in users]))
+
+        receipts = [(expense_id, item["receipt_id"], item["user_id"])
+                    for expense_id, item in zip(ids, written) if item["receipt_id"]]
+        if receipts:
+            cur.execute("""
+                UPDATE receipts SET expense_id = r.expense_id
+                FROM unnest(%s::int[], %s::int[], %s::int[]) AS r(expense_id, id, user_id)
+                WHERE receipts.id = r.id AND receipts.user_id = r.user_id
+            """, tuple(map(list, zip(*receipts))))
+
+        bump_versions(cur, *(user_scope(user_id) for user_id in users))
+        versions = dict(cur.fetchall())
+        notify_users(cur, [
+            (item["user_id"], {
+                "expense": {"op": "created", "id": results[i]["id"]},
+                "balance": {"balance": results[i]["balance"]},
+                "aggregation": {}
+            })
+            for i, item in zip(rows, written)
+        ])
+        return results, versions
+
+
+writer = ExpenseWriter()
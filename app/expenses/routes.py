@@ -1,10 +1,356 @@
-from flask import Blueprint, jsonify, request
+import re
+import json
+import base64
+from flask import Blueprint, jsonify, request, Response, stream_with_context, g
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from decimal import Decimal
 from datetime import date
-from app.utils import get_db_connection  # absolute import
+from app.utils import get_db_connection, bump_version_sql, notify_sql, money_sql, money_event_sql, Money, conditional_get, single_flight, user_scope, json_response, SQL_JSON_RESPONSES, CATEGORIES_SCOPE  # absolute import
+from app.categories.merchants import suggest_category, learn_category, forget_dictionaries
+from app.expenses.export import csv_chunks, ndjson_chunks, parquet_chunks, gzip_chunks
+from app.expenses.group_commit import writer, GROUP_COMMIT_ENABLED
+from app.expenses.archive import has_archive, archive_horizon, reaches_archive, archived_rows, export_tail, is_archived
+from app.expenses.cache import expense_cache
 
 expenses_bp = Blueprint("expenses", __name__, url_prefix="/expenses")
+
+MAX_PAGE_SIZE = 500
+CHANGES_PAGE_SIZE = 500
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", csv_chunks),
+    "ndjson": ("application/x-ndjson", ndjson_chunks),
+    "parquet": ("application/vnd.apache.parquet", parquet_chunks)
+}
+WORD_RE = re.compile(r"\w+")
+
+
+def expense_filters(user_id, args):
+    """
+    Builds the WHERE clause (over expenses e) for the common query filters:
+    categoryId, minAmount, maxAmount, startDate and endDate.
+    Returns (sql, params).
+    """
+    where = ["e.user_id = %s"]
+    params = [user_id]
+
+    category_id = args.get("categoryId", type=int)
+    min_amount = args.get("minAmount", type=Money.parse)
+    max_amount = args.get("maxAmount", type=Money.parse)
+    start_date = args.get("startDate")
+    end_date = args.get("endDate")
+
+    if category_id is not None:
+        where.append("e.category_id = %s")
+        params.append(category_id)
+    if min_amount is not None:
+        where.append("e.amount >= %s")
+        params.append(min_amount)
+    if max_amount is not None:
+        where.append("e.amount <= %s")
+        params.append(max_amount)
+    if start_date:
+        where.append("e.date >= %s")
+        params.append(start_date)
+    if end_date:
+        where.append("e.date <= %s")
+        params.append(end_date)
+
+    return " AND ".join(where), params
+
+
+# Full-text match, or a similar word for typos ("restarant"); params: q, q
+SEARCH_FILTER = """
+    (e.description_tsv @@ websearch_to_tsquery('simple', %s)
+     OR %s <%% e.description)
+"""
+
+# ----------------- SINGLE-STATEMENT WRITES -----------------
+# Create, update and delete each run as one statement on an autocommit
+# connection: one round trip instead of one per step. Balances change by
+# a delta on the locked row, never by a value read earlier. The user's row
+# is locked before change_seq is drawn, as in delete_category.
+CREATED_EVENTS = f"""json_build_object(
+    'expense', json_build_object('op', 'created', 'id', created.id),
+    'balance', json_build_object('balance', {money_event_sql("charged.balance")}),
+    'aggregation', '{{}}'::json)"""
+
+CREATE_EXPENSE_SQL = f"""
+    WITH category AS (
+        SELECT id, name FROM categories WHERE id = %(category_id)s
+    ), charged AS (
+        UPDATE users SET balance = COALESCE(balance, 0) - %(amount)s
+        WHERE id = %(user_id)s::int AND EXISTS (SELECT 1 FROM category)
+        RETURNING balance
+    ), created AS (
+        INSERT INTO expenses (description, amount, category_id, user_id, date)
+        SELECT %(description)s, %(amount)s, category.id, %(user_id)s::int, %(date)s
+        FROM category, charged
+        RETURNING id
+    ), linked AS (
+        UPDATE receipts SET expense_id = created.id FROM created
+        WHERE receipts.id = %(receipt_id)s AND receipts.user_id = %(user_id)s::int
+    ), bumped AS ({bump_version_sql("created")}
+    ), notified AS ({notify_sql(CREATED_EVENTS, "created, charged")})
+    SELECT (SELECT id FROM category), (SELECT name FROM category),
+           (SELECT balance FROM charged), (SELECT id FROM created),
+           (SELECT version FROM bumped), (SELECT COUNT(*) FROM notified)
+"""
+
+
+def update_expense_sql(fields, amount_changed):
+    """
+    UPDATE for the given "column = %(param)s" assignments. Returns the old
+    description and category (NULL if the expense doesn't exist), the
+    new balance when the amount changed and the user's new data version.
+    """
+    events = ["'expense', json_build_object('op', 'updated', 'id', updated.id)", "'aggregation', '{}'::json"]
+    if amount_changed:
+        balanced = """
+            UPDATE users SET balance = COALESCE(balance, 0) - changed.delta
+            FROM changed
+            WHERE users.id = %(user_id)s::int
+            RETURNING users.balance"""
+        events.append(f"'balance', json_build_object('balance', {money_event_sql('updated.balance')})")
+    else:
+        balanced = "SELECT NULL::bigint AS balance"
+
+    return f"""
+        WITH locked AS (
+            SELECT id FROM users WHERE id = %(user_id)s::int FOR UPDATE
+        ), old AS (
+            SELECT e.amount, e.description, e.category_id
+            FROM expenses e, locked
+            WHERE e.id = %(expense_id)s AND e.user_id = locked.id
+            FOR UPDATE OF e
+        ), changed AS (
+            UPDATE expenses e SET {", ".join(fields)}, change_seq = nextval('expense_change_seq')
+            FROM old
+            WHERE e.id = %(expense_id)s AND e.user_id = %(user_id)s::int
+            RETURNING e.id, e.amount - old.amount AS delta
+        ), balanced AS ({balanced}
+        ), updated AS (
+            SELECT changed.id, balanced.balance FROM changed LEFT JOIN balanced ON true
+        ), bumped AS ({bump_version_sql("updated")}
+        ), notified AS ({notify_sql(f"json_build_object({', '.join(events)})", "updated")})
+        SELECT (SELECT description FROM old), (SELECT category_id FROM old),
+               (SELECT balance FROM updated), (SELECT version FROM bumped),
+               (SELECT COUNT(*) FROM notified)
+    """
+
+
+DELETED_EVENTS = f"""json_build_object(
+    'expense', json_build_object('op', 'deleted', 'id', deleted.id),
+    'balance', json_build_object('balance', {money_event_sql("refunded.balance")}),
+    'aggregation', '{{}}'::json)"""
+
+DELETE_EXPENSE_SQL = f"""
+    WITH locked AS (
+        SELECT id FROM users WHERE id = %(user_id)s::int FOR UPDATE
+    ), deleted AS (
+        DELETE FROM expenses e USING locked
+        WHERE e.id = %(expense_id)s AND e.user_id = locked.id
+        RETURNING e.id, e.amount
+    ), unlinked AS (
+        UPDATE receipts SET expense_id = NULL FROM deleted WHERE receipts.expense_id = deleted.id
+    ), tombstone AS (
+        -- Tombstone for clients syncing through /expenses/changes
+        INSERT INTO expense_tombstones (expense_id, user_id)
+        SELECT id, %(user_id)s::int FROM deleted
+        ON CONFLICT (expense_id) DO NOTHING
+    ), refunded AS (
+        UPDATE users SET balance = COALESCE(balance, 0) + deleted.amount
+        FROM deleted
+        WHERE users.id = %(user_id)s::int
+        RETURNING users.balance
+    ), bumped AS ({bump_version_sql("deleted")}
+    ), notified AS ({notify_sql(DELETED_EVENTS, "deleted, refunded")})
+    SELECT (SELECT id FROM deleted), (SELECT balance FROM refunded),
+           (SELECT version FROM bumped), (SELECT COUNT(*) FROM notified)
+"""
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Decodes an opaque cursor or sync token. Raises ValueError if malformed."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid token")
+
+
+def decode_cursor(cursor, mode):
+    """
+    Decodes a keyset cursor: [date, id] for date-ordered pages, [score, id]
+    for ranked search results. Raises ValueError if it doesn't fit the mode.
+    """
+    if not cursor:
+        return None
+    key = decode_token(cursor)
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], int):
+        raise ValueError("Invalid cursor")
+    if mode == "date":
+        key[0] = date.fromisoformat(key[0]) if isinstance(key[0], str) else None
+    elif not isinstance(key[0], (int, float)):
+        key[0] = None
+    if key[0] is None:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def expenses_query(user_id, args):
+    """
+    Builds the GET /expenses query (filters, q, limit, cursor taken from
+    args). It returns at most limit + 1 rows of (id, description, amount,
+    date, category_id, name, score) in page order.
+    Returns (query, params, limit, order). Raises ValueError for an
+    invalid cursor.
+    """
+    q = args.get("q", "").strip()
+    limit = args.get("limit", type=int)
+    cursor = decode_cursor(args.get("cursor"), "score" if q else "date")
+
+    where, params = expense_filters(user_id, args)
+
+    if q:
+        where += " AND " + SEARCH_FILTER
+        params += [q, q]
+        # real (float4); selected as float8 below, so the cursor's value
+        # compares equal to the row's own score when the next page is read
+        score = "ts_rank(e.description_tsv, websearch_to_tsquery('simple', %s)) + word_similarity(%s, e.description)"
+        score_params = [q, q]
+        order = "score DESC, id DESC"
+    else:
+        score, score_params = "0", []
+        order = "date DESC, id DESC"
+        if cursor:
+            # Implied by the cursor condition, but only this form lets the
+            # planner skip the partitions of months after the cursor
+            where += " AND e.date <= %s"
+            params.append(cursor[0])
+
+    query = f"""
+        SELECT * FROM (
+            SELECT e.id, e.description, e.amount, e.date, c.id AS category_id, c.name, ({score})::float8 AS score
+            FROM expenses e
+            JOIN categories c ON e.category_id = c.id
+            WHERE {where}
+        ) matches
+    """
+    params = score_params + params
+
+    if cursor:
+        query += " WHERE (score, id) < (%s, %s)" if q else " WHERE (date, id) < (%s, %s)"
+        params += cursor
+
+    query += f" ORDER BY {order}"
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
+    return query, params, limit, order
+
+
+def query_expenses(conn, user_id, args):
+    """
+    Runs the GET /expenses query on the given connection, merging in the
+    user's archived expenses when the page reaches past the archive horizon
+    (full-text search covers the database only).
+    Returns (expenses, next_cursor). Raises ValueError for an invalid cursor.
+    """
+    query, params, limit, order = expenses_query(user_id, args)
+    with conn.cursor() as cur:
+        cur.execute(query, tuple(params))
+        rows = cur.fetchall()
+        horizon = None if order.startswith("score") else archive_horizon(cur, user_id)
+        # A full page of rows from after the horizon leaves no room for archived ones
+        if reaches_archive(horizon, args) and not (limit is not None and len(rows) > limit and rows[-1][3] >= horizon):
+            rows += archived_rows(cur, user_id, horizon, args, decode_cursor(args.get("cursor"), "date"), limit)
+            rows.sort(key=lambda r: (r[3], r[0]), reverse=True)
+            if limit is not None:
+                rows = rows[:limit + 1]
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last[6] if order.startswith("score") else last[3].isoformat(), last[0]])
+
+    expenses = [{
+        "id": r[0],
+        "description": r[1],
+        "amount": Money(r[2]),
+        "date": r[3],
+        "category": {"id": r[4], "name": r[5]}
+    } for r in rows]
+    return expenses, next_cursor
+
+
+def query_expenses_json(conn, user_id, args):
+    """
+    query_expenses with the JSON array rendered by PostgreSQL.
+    Returns (body text, next_cursor).
+    """
+    query, params, limit, order = expenses_query(user_id, args)
+    key = "score::float8" if order.startswith("score") else "date"
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT COALESCE('[' || string_agg(row_to_json(r)::text, ',' ORDER BY page.position)
+                                   FILTER (WHERE page.position <= COALESCE(%s, page.position)) || ']', '[]'),
+                   (array_agg(json_build_array(page.{key}, page.id)::text)
+                        FILTER (WHERE page.position = %s))[1],
+                   COUNT(*) > %s
+            FROM (
+                SELECT matches.*, row_number() OVER (ORDER BY {order}) AS position
+                FROM ({query}) matches
+            ) page,
+            LATERAL (
+                SELECT {money_sql("page.amount")} AS amount,
+                       (SELECT row_to_json(c) FROM (SELECT page.category_id AS id, page.name) c) AS category,
+                       page.date, page.description, page.id
+            ) r
+        """, (limit, limit, limit) + tuple(params))
+        body, last_key, has_more = cur.fetchone()
+
+    next_cursor = encode_cursor(json.loads(last_key)) if has_more and last_key else None
+    return body, next_cursor
+
+
+def write_expense(user_id, description, amount, category_id, expense_date, receipt_id):
+    """
+    Inserts one expense, through the group-commit writer when it is
+    enabled. Returns {"id", "balance", "category": (id, name)}, or
+    {"error", "status"} when the category or the user doesn't exist.
+    """
+    if GROUP_COMMIT_ENABLED and g.get("_batch_connection") is None:
+        # Written together with other concurrent requests; returns after the shared commit
+        return writer.submit(user_id, description, amount, category_id, expense_date, receipt_id)
+
+    with get_db_connection(autocommit=True) as conn:
+        with conn.cursor() as cur:
+            # Category check, balance, insert, receipt link and events in one round trip
+            cur.execute(CREATE_EXPENSE_SQL, {
+                "user_id": user_id,
+                "scope": user_scope(user_id),
+                "category_id": category_id,
+                "description": description,
+                "amount": amount,
+                "date": expense_date,
+                "receipt_id": receipt_id
+            })
+            cat_id, cat_name, balance, expense_id, version, _ = cur.fetchone()
+            conn.commit()
+    if cat_id is None:
+        return {"error": "Category not found", "status": 404}
+    if expense_id is None:
+        return {"error": "User not found", "status": 404}
+    expense_cache.insert(user_id, version, [(expense_id, expense_date, cat_id, amount)])
+    return {"id": expense_id, "balance": balance, "category": (cat_id, cat_name)}
+
+
 @expenses_bp.route("", methods=["POST"])
 @jwt_required()
 def create_expense():
@@ -28,7 +374,6 @@ def create_expense():
           required:
             - amount
             - description
-            - categoryId
           properties:
             amount:
               type: number
@@ -39,11 +384,16 @@ def create_expense():
               example: "Lunch at restaurant"
             categoryId:
               type: integer
+              description: Optional; inferred from the description via the merchant dictionary when omitted
               example: 1
             date:
               type: string
               format: date
               example: "2025-09-24"
+            receiptId:
+              type: integer
+              description: Receipt (from /image/upload-receipt) this expense was booked from
+              example: 7
     responses:
       201:
         description: Expense created successfully (balance updated)
@@ -73,18 +423,22 @@ def create_expense():
                 name:
                   type: string
                   example: "Food"
+            categorySuggested:
+              type: boolean
+              description: True when the category was filled in from the merchant dictionary
+              example: false
             balance:
               type: number
               format: float
               example: 1974.50
       400:
-        description: Bad request (missing fields or invalid values)
+        description: Bad request (missing fields, invalid values or no category could be inferred)
         schema:
           type: object
           properties:
             error:
               type: string
-              example: "Amount, description, and categoryId are required"
+              example: "Amount and description are required"
       404:
         description: Category not found
         schema:
@@ -111,13 +465,22 @@ def create_expense():
     description = data.get("description")
     category_id = data.get("categoryId")
     expense_date = data.get("date", str(date.today()))
+    receipt_id = data.get("receiptId")
 
-    if not all([amount, description, category_id]):
-        return jsonify({"error": "Amount, description, and categoryId are required"}), 400
+    if not all([amount, description]):
+        return jsonify({"error": "Amount and description are required"}), 400
+
+    # Fill in or double-check the category from the merchant dictionary
+    suggestion = suggest_category(user_id, description)
+    category_suggested = not category_id
+    if category_suggested:
+        if not suggestion:
+            return jsonify({"error": "categoryId is required, no category could be inferred from the description"}), 400
+        category_id = suggestion["category_id"]
 
     try:
-        amount = Decimal(str(amount))
-    except:
+        amount = Money.parse(amount)
+    except ValueError:
         return jsonify({"error": "Amount must be a number"}), 400
 
     try:
@@ -125,39 +488,40 @@ def create_expense():
     except:
         return jsonify({"error": "Invalid date format, use YYYY-MM-DD"}), 400
 
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            # Check category exists
-            cur.execute("SELECT id, name FROM categories WHERE id = %s", (category_id,))
-            cat = cur.fetchone()
-            if not cat:
-                return jsonify({"error": "Category not found"}), 404
-
-            # Deduct expense from balance
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            balance = Decimal(cur.fetchone()[0] or 0)
-            balance -= amount
-            cur.execute("UPDATE users SET balance = %s WHERE id = %s", (balance, user_id))
-
-            # Insert expense
-            cur.execute(
-                "INSERT INTO expenses (description, amount, category_id, user_id, date) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-                (description, amount, category_id, user_id, expense_date)
-            )
-            expense_id = cur.fetchone()[0]
-            conn.commit()
+    if receipt_id is not None and (not isinstance(receipt_id, int) or isinstance(receipt_id, bool)):
+        return jsonify({"error": "receiptId must be an integer"}), 400
+
+    result = write_expense(user_id, description, amount, category_id, expense_date, receipt_id)
+    if result.get("error") == "Category not found" and category_suggested:
+        # The suggested category was deleted since this process loaded its
+        # dictionaries (another worker's delete): reload them and retry once
+        forget_dictionaries()
+        suggestion = suggest_category(user_id, description)
+        if not suggestion:
+            return jsonify({"error": "categoryId is required, no category could be inferred from the description"}), 400
+        result = write_expense(user_id, description, amount, suggestion["category_id"], expense_date, receipt_id)
+    if "error" in result:
+        return jsonify({"error": result["error"]}), result["status"]
+    expense_id, balance, cat = result["id"], result["balance"], result["category"]
+
+    # The user picked something the dictionary didn't predict: learn it
+    if not category_suggested and (not suggestion or suggestion["category_id"] != cat[0]):
+        learn_category(user_id, description, cat[0])
 
     return jsonify({
         "id": expense_id,
         "description": description,
-        "amount": float(amount),
+        "amount": amount,
         "date": str(expense_date),
         "category": {"id": cat[0], "name": cat[1]},
-        "balance": float(balance)
+        "categorySuggested": category_suggested,
+        "balance": Money(balance)
     }), 201
 
 @expenses_bp.route("", methods=["GET"])
 @jwt_required()
+@conditional_get("user", CATEGORIES_SCOPE)
+@single_flight
 def get_expenses():
     """
     Get user expenses
@@ -203,9 +567,32 @@ def get_expenses():
         required: false
         description: End date for filtering (YYYY-MM-DD)
         example: "2025-12-31"
+      - name: q
+        in: query
+        type: string
+        required: false
+        description: >
+          Search descriptions (full text, tolerant of typos); results are ranked by relevance.
+          Archived expenses (older than the archive horizon) are not searched.
+        example: "restaurant"
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size (max 500). Without it all matching expenses are returned
+        example: 50
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Opaque cursor from the X-Next-Cursor header of the previous page
     responses:
       200:
-        description: List of expenses
+        description: List of expenses. When more pages exist, the X-Next-Cursor header holds the cursor for the next one
+        headers:
+          X-Next-Cursor:
+            type: string
+            description: Cursor for the next page, absent on the last page
         schema:
           type: array
           items:
@@ -246,51 +633,324 @@ def get_expenses():
 
 
     user_id = get_jwt_identity()
-    category_id = request.args.get('categoryId', type=int)
-    min_amount = request.args.get('minAmount', type=float)
-    max_amount = request.args.get('maxAmount', type=float)
-    start_date = request.args.get('startDate')
-    end_date = request.args.get('endDate')
-
-    query = """
-        SELECT e.id, e.description, e.amount, e.date, c.id, c.name
-        FROM expenses e
-        JOIN categories c ON e.category_id = c.id
-        WHERE e.user_id = %s
+    # Pages that may include archived expenses are merged in Python
+    sql_json = SQL_JSON_RESPONSES and not has_archive(user_id)
+    try:
+        with get_db_connection() as conn:
+            if sql_json:
+                body, next_cursor = query_expenses_json(conn, user_id, request.args)
+            else:
+                expenses, next_cursor = query_expenses(conn, user_id, request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    response = json_response(body) if sql_json else jsonify(expenses)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@expenses_bp.route("/changes", methods=["GET"])
+@jwt_required()
+def get_changes():
     """
-    params = [user_id]
+    Changes since a sync token, for clients keeping an offline copy
+    Archived expenses (dated before archiveHorizon) are not part of a full
+    sync; archiving is not a change, so an offline copy keeps the ones it
+    already holds. Read older expenses from GET /expenses with a startDate
+    before the horizon.
+    ---
+    tags:
+      - Expenses
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    parameters:
+      - name: since
+        in: query
+        type: string
+        required: false
+        description: Token from the previous response; omit for a full sync
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum changes per page (default and max 500)
+    responses:
+      200:
+        description: Changes in the order they happened. Repeat with the returned token while hasMore is true
+        schema:
+          type: object
+          properties:
+            changes:
+              type: array
+              items:
+                type: object
+                properties:
+                  op:
+                    type: string
+                    enum: [upsert, delete]
+                  id:
+                    type: integer
+                    example: 10
+                  expense:
+                    type: object
+                    description: Present for upserts, same shape as GET /expenses items
+            token:
+              type: string
+              description: Pass as since on the next sync
+            hasMore:
+              type: boolean
+              example: false
+            archiveHorizon:
+              type: string
+              format: date
+              description: Expenses dated before this are archived and left out of the changes; null without an archive
+              example: "2024-10-01"
+      400:
+        description: Invalid token
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Invalid token"
+    """
+    user_id = get_jwt_identity()
+    limit = max(1, min(request.args.get("limit", CHANGES_PAGE_SIZE, type=int), CHANGES_PAGE_SIZE))
 
-    if category_id is not None:
-        query += " AND e.category_id = %s"
-        params.append(category_id)
-    if min_amount is not None:
-        query += " AND e.amount >= %s"
-        params.append(min_amount)
-    if max_amount is not None:
-        query += " AND e.amount <= %s"
-        params.append(max_amount)
-    if start_date:
-        query += " AND e.date >= %s"
-        params.append(start_date)
-    if end_date:
-        query += " AND e.date <= %s"
-        params.append(end_date)
+    since = 0
+    if request.args.get("since"):
+        try:
+            since = decode_token(request.args["since"])
+        except ValueError:
+            since = None
+        if not isinstance(since, int) or isinstance(since, bool):
+            return jsonify({"error": "Invalid token"}), 400
+
+    # Both halves walk a (user_id, change_seq) index from the token onwards
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                (SELECT e.change_seq, e.id, e.description, e.amount, e.date, c.id, c.name
+                 FROM expenses e
+                 JOIN categories c ON e.category_id = c.id
+                 WHERE e.user_id = %s AND e.change_seq > %s
+                 ORDER BY e.change_seq
+                 LIMIT %s)
+                UNION ALL
+                (SELECT t.change_seq, t.expense_id, NULL, NULL, NULL, NULL, NULL
+                 FROM expense_tombstones t
+                 WHERE t.user_id = %s AND t.change_seq > %s
+                 ORDER BY t.change_seq
+                 LIMIT %s)
+                ORDER BY 1
+                LIMIT %s
+            """, (user_id, since, limit + 1, user_id, since, limit + 1, limit + 1))
+            rows = cur.fetchall()
+            horizon = archive_horizon(cur, user_id)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes = []
+    for r in rows:
+        if r[2] is None:
+            changes.append({"op": "delete", "id": r[1]})
+        else:
+            changes.append({"op": "upsert", "id": r[1], "expense": {
+                "id": r[1],
+                "description": r[2],
+                "amount": Money(r[3]),
+                "date": r[4],
+                "category": {"id": r[5], "name": r[6]}
+            }})
+
+    return jsonify({
+        "changes": changes,
+        "token": encode_cursor(rows[-1][0] if rows else since),
+        "hasMore": has_more,
+        "archiveHorizon": horizon
+    })
+
+
+@expenses_bp.route("/export", methods=["GET"])
+@jwt_required()
+def export_expenses():
+    """
+    Export expenses as CSV, NDJSON or Parquet
+    ---
+    tags:
+      - Expenses
+    security:
+      - Bearer: []
+    produces:
+      - text/csv
+      - application/x-ndjson
+      - application/vnd.apache.parquet
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [csv, ndjson, parquet]
+        required: false
+        description: Output format (default csv)
+      - name: categoryId
+        in: query
+        type: integer
+        required: false
+      - name: minAmount
+        in: query
+        type: number
+        required: false
+      - name: maxAmount
+        in: query
+        type: number
+        required: false
+      - name: startDate
+        in: query
+        type: string
+        format: date
+        required: false
+      - name: endDate
+        in: query
+        type: string
+        format: date
+        required: false
+      - name: q
+        in: query
+        type: string
+        required: false
+        description: Same description search as GET /expenses; archived expenses are left out when it is given
+      - name: Accept-Encoding
+        in: header
+        type: string
+        required: false
+        description: Send "gzip" to get CSV/NDJSON gzip-compressed (Content-Encoding gzip)
+    responses:
+      200:
+        description: File download, streamed (newest expenses first)
+      400:
+        description: Unknown format
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "format must be one of csv, ndjson, parquet"
+      501:
+        description: Parquet requested but pyarrow is not installed
+    """
+    user_id = get_jwt_identity()
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be one of " + ", ".join(EXPORT_FORMATS)}), 400
+
+    where, params = expense_filters(user_id, request.args)
+    q = request.args.get("q", "").strip()
+    if q:
+        where += " AND " + SEARCH_FILTER
+        params += [q, q]
+
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return jsonify({"error": "Parquet export is not available on this server"}), 501
+
+    # Archived expenses follow the database's, merged with any it holds from before the horizon
+    tail = None
+    if not q and has_archive(user_id):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                horizon = archive_horizon(cur, user_id)
+        if reaches_archive(horizon, request.args):
+            tail = export_tail(user_id, horizon, where, tuple(params), request.args)
+            where += " AND e.date >= %s"
+            params.append(horizon)
+
+    mimetype, produce = EXPORT_FORMATS[fmt]
+    chunks = produce(where, tuple(params), tail)
+    headers = {"Content-Disposition": f'attachment; filename="expenses.{fmt}"'}
+
+    # Parquet pages are already compressed
+    if fmt != "parquet" and "gzip" in request.headers.get("Accept-Encoding", ""):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
 
-    query += " ORDER BY e.date DESC"
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
 
-    # Using context managers
+
+@expenses_bp.route("/suggest", methods=["GET"])
+@jwt_required()
+@conditional_get("user")
+def suggest_descriptions():
+    """
+    Autocomplete expense descriptions
+    ---
+    tags:
+      - Expenses
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: What the user has typed so far; every word is matched as a prefix
+        example: "lun rest"
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum number of suggestions (default 10)
+    responses:
+      200:
+        description: Previously used descriptions, most used first
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              description:
+                type: string
+                example: "Lunch at restaurant"
+              count:
+                type: integer
+                example: 12
+      400:
+        description: Missing query
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "q is required"
+    """
+    user_id = get_jwt_identity()
+    words = WORD_RE.findall(request.args.get("q", "").lower())
+    if not words:
+        return jsonify({"error": "q is required"}), 400
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+
+    prefix_query = " & ".join(f"{word}:*" for word in words)
     with get_db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(query, tuple(params))
-            expenses = [{
-                "id": r[0],
-                "description": r[1],
-                "amount": float(r[2]),
-                "date": r[3].isoformat(),
-                "category": {"id": r[4], "name": r[5]}
-            } for r in cur.fetchall()]
+            cur.execute("""
+                SELECT description, COUNT(*) AS uses
+                FROM expenses
+                WHERE user_id = %s AND description_tsv @@ to_tsquery('simple', %s)
+                GROUP BY description
+                ORDER BY lower(description) LIKE %s DESC, uses DESC, MAX(date) DESC
+                LIMIT %s
+            """, (user_id, prefix_query, words[0].replace("_", "\\_") + "%", limit))
+            suggestions = [{"description": r[0], "count": r[1]} for r in cur.fetchall()]
 
-    return jsonify(expenses)
+    return jsonify(suggestions)
 
  
 # ---------- EXPENSES ROUTES ----------
@@ -367,6 +1027,14 @@ def update_expense(expense_id):
             error:
               type: string
               example: "Expense not found"
+      409:
+        description: The expense is archived (older than the archive horizon) and can't be changed
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Expense is archived"
       401:
         description: Unauthorized (JWT missing or invalid)
         schema:
@@ -389,64 +1057,55 @@ def update_expense(expense_id):
     if not any([amount, description, category_id, expense_date]):
         return jsonify({"error": "At least one field is required to update"}), 400
 
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            # Fetch existing expense
-            cur.execute(
-                "SELECT amount FROM expenses WHERE id = %s AND user_id = %s",
-                (expense_id, user_id)
-            )
-            row = cur.fetchone()
-            if not row:
-                return jsonify({"error": "Expense not found"}), 404
-
-            old_amount = Decimal(row[0])
-
-            # Build update query
-            fields, values = [], []
-            if description:
-                fields.append("description = %s")
-                values.append(description)
-            if amount is not None:
-                try:
-                    amount = Decimal(str(amount))
-                except:
-                    return jsonify({"error": "Amount must be a number"}), 400
-                fields.append("amount = %s")
-                values.append(amount)
-            if category_id:
-                fields.append("category_id = %s")
-                values.append(category_id)
-            if expense_date:
-                try:
-                    expense_date = date.fromisoformat(expense_date)
-                except:
-                    return jsonify({"error": "Invalid date format, use YYYY-MM-DD"}), 400
-                fields.append("date = %s")
-                values.append(expense_date)
-
-            if not fields:
-                return jsonify({"error": "Nothing to update"}), 400
-
-            values.extend([expense_id, user_id])
-            cur.execute(
-                f"UPDATE expenses SET {', '.join(fields)} WHERE id = %s AND user_id = %s RETURNING id",
-                tuple(values)
-            )
-            updated = cur.fetchone()
-            if not updated:
-                return jsonify({"error": "Expense not found"}), 404
-
-            # Adjust user's balance if amount changed
-            if amount is not None:
-                cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-                balance = Decimal(cur.fetchone()[0] or 0)
-                balance = balance + old_amount - amount
-                cur.execute("UPDATE users SET balance = %s WHERE id = %s", (balance, user_id))
+    # Build update query
+    fields = []
+    params = {"user_id": user_id, "scope": user_scope(user_id), "expense_id": expense_id}
+    if description:
+        fields.append("description = %(description)s")
+        params["description"] = description
+    if amount is not None:
+        try:
+            amount = Money.parse(amount)
+        except ValueError:
+            return jsonify({"error": "Amount must be a number"}), 400
+        fields.append("amount = %(amount)s")
+        params["amount"] = amount
+    if category_id:
+        fields.append("category_id = %(category_id)s")
+        params["category_id"] = category_id
+    if expense_date:
+        try:
+            expense_date = date.fromisoformat(expense_date)
+        except:
+            return jsonify({"error": "Invalid date format, use YYYY-MM-DD"}), 400
+        fields.append("date = %(date)s")
+        params["date"] = expense_date
 
+    if not fields:
+        return jsonify({"error": "Nothing to update"}), 400
+
+    with get_db_connection(autocommit=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute(update_expense_sql(fields, amount is not None), params)
+            old_description, old_category_id, balance, version, _ = cur.fetchone()
         conn.commit()
 
-    return jsonify({"message": "Expense updated", "id": expense_id, "balance": float(balance) if amount is not None else None}), 200
+    if old_category_id is None:
+        if is_archived(user_id, expense_id):
+            return jsonify({"error": "Expense is archived"}), 409
+        return jsonify({"error": "Expense not found"}), 404
+    expense_cache.update(
+        user_id, version, expense_id,
+        expense_date=expense_date or None,
+        category_id=category_id or None,
+        amount=amount
+    )
+
+    # A changed category is a correction the merchant dictionary should learn
+    if category_id and int(category_id) != old_category_id:
+        learn_category(user_id, description or old_description, int(category_id))
+
+    return jsonify({"message": "Expense updated", "id": expense_id, "balance": Money(balance) if balance is not None else None}), 200
 
 @expenses_bp.route("/<int:expense_id>", methods=["DELETE"])
 @jwt_required()
@@ -490,6 +1149,14 @@ def delete_expense(expense_id):
             error:
               type: string
               example: "Expense not found"
+      409:
+        description: The expense is archived (older than the archive horizon) and can't be changed
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Expense is archived"
       401:
         description: Unauthorized (JWT missing or invalid)
         schema:
@@ -503,40 +1170,22 @@ def delete_expense(expense_id):
     """Delete an expense and restore user's balance"""
     user_id = get_jwt_identity()
 
-    with get_db_connection() as conn:
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
-            # Fetch amount before deletion
-            cur.execute(
-                "SELECT amount FROM expenses WHERE id = %s AND user_id = %s",
-                (expense_id, user_id)
-            )
-            row = cur.fetchone()
-            if not row:
-                return jsonify({"error": "Expense not found"}), 404
-
-            amount = Decimal(row[0])
-
-            # Delete expense
-            cur.execute(
-                "DELETE FROM expenses WHERE id = %s AND user_id = %s RETURNING id",
-                (expense_id, user_id)
-            )
-            deleted = cur.fetchone()
-            if not deleted:
-                return jsonify({"error": "Expense not found"}), 404
-
-            # Restore user's balance
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            balance = Decimal(cur.fetchone()[0] or 0)
-            balance += amount
-            cur.execute("UPDATE users SET balance = %s WHERE id = %s", (balance, user_id))
-
+            cur.execute(DELETE_EXPENSE_SQL, {"user_id": user_id, "scope": user_scope(user_id), "expense_id": expense_id})
+            deleted, balance, version, _ = cur.fetchone()
         conn.commit()
 
+    if deleted is None:
+        if is_archived(user_id, expense_id):
+            return jsonify({"error": "Expense is archived"}), 409
+        return jsonify({"error": "Expense not found"}), 404
+    expense_cache.delete(user_id, version, expense_id)
+
     return jsonify({
         "message": "Expense deleted",
         "id": expense_id,
-        "balance": float(balance)
+        "balance": Money(balance)
     }), 200
    
 
@@ -0,0 +1,276 @@
+import re
+import threading
+import cv2
+import numpy as np
+
+# ----------------- CONFIG -----------------
+GLYPH_SIZE = 20
+DIGITS = "0123456789"
+# Letters and symbols common on receipts; they are templates too, so that
+# "EUR", "DDV" etc. are recognised as "not a digit" instead of the nearest digit.
+# O/o/Q/I are left out: next to digits they are almost always 0 and 1.
+REJECT_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZabcdeghkmnpqrsuvwxyz%/-:"
+REJECT = "x"
+K_NEIGHBOURS = 3
+
+# Character spacing in units of the line's median character pitch
+WORD_STEP = 1.6
+LOST_COMMA_STEP = (1.25, 2.3)
+
+_FONTS = (
+    cv2.FONT_HERSHEY_SIMPLEX,
+    cv2.FONT_HERSHEY_DUPLEX,
+    cv2.FONT_HERSHEY_COMPLEX,
+    cv2.FONT_HERSHEY_TRIPLEX
+)
+_THICKNESSES = (2, 3, 4)
+_SHEARS = (-0.12, 0.0, 0.12)
+
+# An amount: digits, optional thousands groups, a separator and two decimals.
+# Not preceded or followed by more digit groups, so dates like 31.05.2025 don't match.
+AMOUNT_RE = re.compile(r"(?<![\d.])(?:\d{1,3}(?:\.\d{3})+|\d+)\.\d{2}(?!\.?\d)")
+
+# winSize, blockSize, blockStride, cellSize, nbins
+_HOG = cv2.HOGDescriptor((GLYPH_SIZE, GLYPH_SIZE), (10, 10), (5, 5), (5, 5), 9)
+
+_templates = None
+_templates_lock = threading.Lock()
+
+
+# ----------------- FEATURES -----------------
+def normalize_glyph(mask):
+    """
+    Centres a binary glyph in a square canvas (keeping its aspect ratio,
+    so a "1" stays thin) and scales it to GLYPH_SIZE x GLYPH_SIZE.
+    """
+    h, w = mask.shape
+    side = max(h, w) + 4
+    canvas = np.zeros((side, side), dtype=np.uint8)
+    y, x = (side - h) // 2, (side - w) // 2
+    canvas[y:y+h, x:x+w] = mask
+    return cv2.resize(canvas, (GLYPH_SIZE, GLYPH_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def glyph_features(glyphs):
+    """
+    HOG features for a list of normalized glyphs as an (n, d) float32 array.
+    The glyphs are laid side by side in one strip so a single HOG call
+    covers all of them, one window per glyph.
+    """
+    if not glyphs:
+        return np.zeros((0, _HOG.getDescriptorSize()), dtype=np.float32)
+    strip = np.hstack(glyphs)
+    features = _HOG.compute(strip, winStride=(GLYPH_SIZE, GLYPH_SIZE))
+    return features.reshape(len(glyphs), -1)
+
+
+# ----------------- TEMPLATES -----------------
+def _render_char(char, font, thickness, shear):
+    canvas = np.zeros((96, 96), dtype=np.uint8)
+    cv2.putText(canvas, char, (20, 70), font, 1.6, 255, thickness, cv2.LINE_AA)
+    if shear:
+        matrix = np.float32([[1, shear, -shear * 48], [0, 1, 0]])
+        canvas = cv2.warpAffine(canvas, matrix, (96, 96))
+    _, canvas = cv2.threshold(canvas, 127, 255, cv2.THRESH_BINARY)
+    ys, xs = np.nonzero(canvas)
+    if len(ys) == 0:
+        return None
+    return canvas[ys.min():ys.max() + 1, xs.min():xs.max() + 1]
+
+
+def build_templates():
+    """
+    Renders every template character in several fonts, weights and slants.
+    Returns (features, labels) as NumPy arrays.
+    """
+    glyphs, labels = [], []
+    for char in DIGITS + REJECT_CHARS:
+        label = char if char in DIGITS else REJECT
+        for font in _FONTS:
+            for thickness in _THICKNESSES:
+                for shear in _SHEARS:
+                    mask = _render_char(char, font, thickness, shear)
+                    if mask is not None:
+                        glyphs.append(normalize_glyph(mask))
+                        labels.append(label)
+    return glyph_features(glyphs), np.array(labels)
+
+
+def get_templates():
+    """Builds the template set once per process."""
+    global _templates
+    if _templates is None:
+        with _templates_lock:
+            if _templates is None:
+                features, labels = build_templates()
+                norms = np.einsum("ij,ij->i", features, features)
+                _templates = (features, labels, norms)
+    return _templates
+
+
+def classify_glyphs(glyphs):
+    """
+    Labels all glyphs at once: one matrix product gives the squared
+    distance from every glyph to every template, then a k-NN vote.
+    Returns a NumPy array of single-character labels.
+    """
+    if not glyphs:
+        return np.array([], dtype="<U1")
+    features = glyph_features(glyphs)
+    templates, labels, template_norms = get_templates()
+
+    distances = (
+        np.einsum("ij,ij->i", features, features)[:, None]
+        + template_norms[None, :]
+        - 2.0 * features @ templates.T
+    )
+    nearest = np.argpartition(distances, K_NEIGHBOURS, axis=1)[:, :K_NEIGHBOURS]
+    votes = labels[nearest]
+
+    # Majority of the k votes; ties go to the single closest template
+    closest = labels[np.argmin(distances, axis=1)]
+    result = closest.copy()
+    for k in range(K_NEIGHBOURS):
+        agree = (votes == votes[:, k:k+1]).sum(axis=1)
+        result = np.where(agree * 2 > K_NEIGHBOURS, votes[:, k], result)
+    return result
+
+
+# ----------------- LINE READING -----------------
+def binarize(gray):
+    """
+    Local thresholding copes with the shadows and uneven light of phone
+    photos, where a single global Otsu threshold loses whole lines.
+    """
+    block = max(15, (min(gray.shape[:2]) // 20) | 1)
+    blur = cv2.GaussianBlur(gray, (3, 3), 0)
+    return cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, block, 15)
+
+
+def read_lines(gray):
+    """
+    Finds character-sized blobs, classifies them and groups them into
+    text lines. Returns a list of strings, one per line, top to bottom,
+    with digits, "." for decimal marks, "x" for anything else and spaces
+    between words.
+    """
+    binary = binarize(gray)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return []
+
+    stats = stats[1:]
+    x, y, w, h, area = stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3], stats[:, 4]
+    img_h = gray.shape[0]
+
+    # ---- Character candidates: text-sized, not lines or specks ----
+    is_char = (h >= max(8, img_h * 0.008)) & (h <= img_h * 0.08) & (w <= h * 1.5) & (area >= h)
+    if not is_char.any():
+        return []
+    char_h = np.median(h[is_char])
+    is_char &= (h >= char_h * 0.6) & (h <= char_h * 1.6)
+
+    # ---- Decimal marks: small, squarish, sitting on a text baseline ----
+    is_mark = (h < char_h * 0.6) & (w < char_h * 0.4) & (h >= 2) & (w >= 2) & ~is_char
+
+    char_idx = np.flatnonzero(is_char)
+    glyphs = [
+        normalize_glyph(((labels[y[i]:y[i]+h[i], x[i]:x[i]+w[i]] == i + 1) * 255).astype(np.uint8))
+        for i in char_idx
+    ]
+    char_labels = classify_glyphs(glyphs)
+
+    # ---- Group characters into lines by baseline ----
+    bottoms = (y + h)[char_idx]
+    order = np.argsort(bottoms, kind="stable")
+    breaks = np.flatnonzero(np.diff(bottoms[order]) > char_h * 0.5) + 1
+    line_groups = np.split(order, breaks)
+
+    mark_idx = np.flatnonzero(is_mark)
+    mark_bottoms = (y + h)[mark_idx]
+
+    lines = []
+    for group in line_groups:
+        members = char_idx[group]
+        line_bottom = np.median((y + h)[members])
+        left, right = x[members].min(), (x + w)[members].max()
+
+        # Decimal marks whose bottom is near this baseline (commas hang below it)
+        near = (np.abs(mark_bottoms - line_bottom) <= char_h * 0.35) \
+            & (x[mark_idx] >= left) & (x[mark_idx] <= right)
+        marks = mark_idx[near]
+
+        idx = np.concatenate([members, marks])
+        text = np.concatenate([char_labels[group], np.full(len(marks), ".")])
+        order_x = np.argsort(x[idx], kind="stable")
+        idx, text = idx[order_x], text[order_x]
+
+        # Word breaks, measured centre to centre in units of the line's
+        # character pitch: receipt digits are tabular, so a narrow "1" has
+        # wide side gaps but a normal pitch
+        centers = (x + w / 2.0)[idx]
+        is_glyph = text != "."
+        glyph_steps = np.diff(centers[is_glyph])
+        pitch = np.median(glyph_steps) if len(glyph_steps) >= 3 else char_h * 0.7
+        steps = np.diff(centers) / max(pitch, 1.0)
+        edge_gaps = x[idx][1:] - (x + w)[idx][:-1]
+        next_to_mark = ~is_glyph[1:] | ~is_glyph[:-1]
+        is_break = np.where(
+            next_to_mark,
+            edge_gaps > char_h * 0.5,
+            ((steps > WORD_STEP) & (edge_gaps > char_h * 0.15))
+            | ((steps > 1.15) & (edge_gaps > char_h * 0.3))
+        )
+
+        words, word, word_steps, break_steps = [], [text[0]], [], []
+        for brk, step, char in zip(is_break, steps, text[1:]):
+            if brk:
+                words.append(_restore_separator(word, word_steps))
+                break_steps.append(step)
+                word, word_steps = [], []
+            else:
+                word_steps.append(step)
+            word.append(char)
+        words.append(_restore_separator(word, word_steps))
+        lines.append(_join_words(words, break_steps))
+    return lines
+
+
+def _restore_separator(chars, steps):
+    """
+    Commas are often lost in shadowed or faint print. If a run of digits
+    has no separator but a wider step before the last two digits, that is
+    where the decimal mark was.
+    """
+    text = "".join(chars)
+    if len(chars) < 3 or not text.isdigit():
+        return text
+    if steps[-2] > LOST_COMMA_STEP[0] and steps[-2] > np.median(steps) * 1.2:
+        return text[:-2] + "." + text[-2:]
+    return text
+
+
+def _join_words(words, steps):
+    """
+    Joins words with spaces, except where a lost comma split an amount:
+    digits, a step narrower than a real space, then exactly two digits.
+    """
+    out = words[0]
+    for step, word in zip(steps, words[1:]):
+        lost_comma = (
+            step < LOST_COMMA_STEP[1] and out[-1:].isdigit()
+            and len(word) >= 2 and word[:2].isdigit() and word[2:3] in ("", REJECT)
+        )
+        out += ("." if lost_comma else " ") + word
+    return out
+
+
+def parse_amounts(lines):
+    """Returns every amount found in the recognised lines, as floats."""
+    amounts = []
+    for line in lines:
+        for word in line.split():
+            for match in AMOUNT_RE.findall(word):
+                whole, _, cents = match.rpartition(".")
+                amounts.append(float(whole.replace(".", "") + "." + cents))
+    return amounts
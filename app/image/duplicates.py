@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import OrderedDict
+from app.utils import get_db_connection  # absolute import
+
+# ----------------- CONFIG -----------------
+# Max Hamming distance between two 64-bit pHashes to call them the same receipt
+DUPLICATE_DISTANCE = int(os.environ.get("RECEIPT_DUPLICATE_DISTANCE", 10))
+# Per-user indexes kept in memory; the least recently used beyond this are
+# dropped and rebuilt from the receipts table on the user's next upload
+MAX_USER_INDEXES = int(os.environ.get("RECEIPT_MAX_USER_INDEXES", 10000))
+
+_SIGN_BIT = 1 << 63
+
+
+def to_signed(value):
+    """Maps an unsigned 64-bit hash onto PostgreSQL's signed BIGINT range."""
+    return value - (1 << 64) if value >= _SIGN_BIT else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+# ----------------- BK-TREE -----------------
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance.
+    A radius query only descends into children whose edge distance is
+    within [d - radius, d + radius], so it visits a small fraction of
+    the stored hashes instead of all of them.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = (node[0] ^ value).bit_count()
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """Returns [(distance, item)] for all items within radius, closest first."""
+        if self.root is None:
+            return []
+
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = (node_value ^ value).bit_count()
+            if distance <= radius:
+                matches.extend((distance, item) for item in items)
+            low, high = distance - radius, distance + radius
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+
+        matches.sort(key=lambda m: m[0])
+        return matches
+
+
+# ----------------- PER-USER INDEX -----------------
+class _UserIndex:
+    def __init__(self):
+        self.tree = BKTree()
+        self.max_id = 0
+        self.lock = threading.Lock()
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _get_index(user_id):
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is None:
+            # Empty: the first _catch_up loads every receipt (max_id 0)
+            index = _indexes[user_id] = _UserIndex()
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > MAX_USER_INDEXES:
+            _indexes.popitem(last=False)
+        return index
+
+
+def _catch_up(cur, user_id, index):
+    """
+    Loads receipts added since the index was last synced, including ones
+    inserted by other worker processes. Caller holds index.lock.
+    """
+    cur.execute("""
+        SELECT id, phash FROM receipts
+        WHERE user_id = %s AND id > %s AND phash IS NOT NULL
+        ORDER BY id
+    """, (user_id, index.max_id))
+    for receipt_id, phash in cur.fetchall():
+        index.tree.add(to_unsigned(phash), receipt_id)
+        index.max_id = receipt_id
+
+
+def find_duplicates(user_id, phash, exclude_id=None):
+    """
+    Returns likely duplicates of a receipt among the user's receipts as
+    [{"receipt_id", "expense_id", "distance"}], closest first.
+    """
+    index = _get_index(user_id)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            with index.lock:
+                _catch_up(cur, user_id, index)
+                matches = [
+                    (distance, receipt_id)
+                    for distance, receipt_id in index.tree.search(phash, DUPLICATE_DISTANCE)
+                    if receipt_id != exclude_id
+                ]
+            if not matches:
+                return []
+
+            cur.execute(
+                "SELECT id, expense_id FROM receipts WHERE id = ANY(%s)",
+                ([receipt_id for _, receipt_id in matches],)
+            )
+            expense_ids = dict(cur.fetchall())
+
+    return [
+        {"receipt_id": receipt_id, "expense_id": expense_ids.get(receipt_id), "distance": distance}
+        for distance, receipt_id in matches
+        if receipt_id in expense_ids
+    ]
@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# ----------------- CONFIG -----------------
+# One OpenCV process per core; each worker gets its share of the cores for
+# OpenCV's own thread pool so the pool never oversubscribes the machine.
+CPU_COUNT = os.cpu_count() or 1
+POOL_WORKERS = int(os.environ.get("RECEIPT_POOL_WORKERS", CPU_COUNT))
+CV_THREADS_PER_WORKER = int(os.environ.get("RECEIPT_CV_THREADS", max(1, CPU_COUNT // max(POOL_WORKERS, 1))))
+JOB_TTL_SECONDS = int(os.environ.get("RECEIPT_JOB_TTL", 3600))
+IO_WORKERS = int(os.environ.get("RECEIPT_IO_WORKERS", 2))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Disk writes and other I/O that the response does not have to wait for
+_io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="receipt-io")
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+# ----------------- WORKER POOL -----------------
+def _init_worker(cv_threads):
+    """
+    Runs once in every pool process before it accepts work.
+    """
+    import cv2
+    from app.image.digits import get_templates
+    cv2.setNumThreads(cv_threads)
+    cv2.ocl.setUseOpenCL(False)
+    get_templates()
+
+
+def get_executor():
+    """
+    Returns the process-wide receipt pool, creating it on first use.
+    Workers are spawned rather than forked: forking a threaded web process
+    that already initialised OpenCV can deadlock in the child.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=POOL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(CV_THREADS_PER_WORKER,)
+                )
+    return _executor
+
+
+def run_in_background(fn, *args):
+    """
+    Runs fn(*args) on the I/O thread pool; failures are logged, not raised.
+    """
+    def _run():
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Background task {fn.__name__} failed: {e}")
+    return _io_executor.submit(_run)
+
+
+# ----------------- JOB REGISTRY -----------------
+def _purge_expired(now):
+    """
+    Drops finished jobs older than JOB_TTL_SECONDS. Caller holds _jobs_lock.
+    """
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job["finished_at"] and now - job["finished_at"] > JOB_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def submit_job(user_id, fn, *args, on_done=None):
+    """
+    Submits fn(*args) to the pool and returns the new job id.
+    on_done(result) runs in the web process once the worker finishes;
+    whatever it returns becomes the job result.
+    """
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "user_id": user_id,
+        "status": "queued",
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "finished_at": None,
+        "future": None
+    }
+
+    with _jobs_lock:
+        _purge_expired(now)
+        _jobs[job_id] = job
+
+    def _complete(future):
+        try:
+            result = future.result()
+            if on_done is not None:
+                result = on_done(result)
+            job["result"] = result
+            job["status"] = "done"
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "failed"
+        job["finished_at"] = time.time()
+
+    future = get_executor().submit(fn, *args)
+    job["future"] = future
+    future.add_done_callback(_complete)
+    return job_id
+
+
+def get_job(job_id, user_id):
+    """
+    Returns a JSON-ready snapshot of a job, or None if it does not exist
+    or belongs to another user. Jobs live in the memory of the web process
+    that accepted the upload.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if not job or job["user_id"] != user_id:
+        return None
+
+    status = job["status"]
+    if status == "queued" and job["future"] is not None and job["future"].running():
+        status = "running"
+
+    return {
+        "id": job["id"],
+        "status": status,
+        "result": job["result"],
+        "error": job["error"]
+    }
@@ -0,0 +1,225 @@
+import struct
+import cv2
+import numpy as np
+from app.image.digits import binarize, read_lines, parse_amounts
+
+# Bump whenever extraction output changes, so cached results are recomputed
+PIPELINE_VERSION = 4
+
+# Decoded images are scaled down until the long side is close to this.
+TARGET_LONG_SIDE = 1600
+
+_REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+}
+
+REDUCED_COLOR = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Number of candidate merchant header lines returned per receipt
+STORE_REGIONS = 5
+
+# JPEG start-of-frame markers that carry the image dimensions
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _to_gray(roi):
+    """Converts a cropped region to grayscale, if it is not already."""
+    if roi.ndim == 2:
+        return roi
+    return cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+
+
+def image_size(data):
+    """
+    Reads (width, height) from a PNG or JPEG header without decoding.
+    Returns None for other formats or truncated headers.
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+
+    if data[:2] == b"\xff\xd8":
+        pos = 2
+        while pos + 9 < len(data):
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                pos += 1 if marker == 0xFF else 2
+                continue
+            (length,) = struct.unpack(">H", data[pos + 2:pos + 4])
+            if marker in _JPEG_SOF_MARKERS:
+                height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+                return width, height
+            pos += 2 + length
+    return None
+
+
+def reduction_factor(size, target=TARGET_LONG_SIDE):
+    """Largest of 1/2/4/8 that keeps the long side at or above target."""
+    if not size:
+        return 1
+    long_side = max(size)
+    factor = 1
+    while factor < 8 and long_side // (factor * 2) >= target:
+        factor *= 2
+    return factor
+
+
+def decode_receipt(data):
+    """
+    Decodes upload bytes in place (np.frombuffer, no copy) straight to
+    grayscale, letting the codec downscale large scans while decoding.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    factor = reduction_factor(image_size(data))
+    img = cv2.imdecode(buf, _REDUCED_GRAYSCALE[factor])
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+def extract_amount_opencv(img):
+    """
+    Reads amounts in the lower-right quadrant, where totals are printed,
+    and returns the largest one (the total), or None if none was found.
+    """
+    h, w = img.shape[:2]
+    quadrant = img[h//2:, w//2:]
+
+    amounts = parse_amounts(read_lines(_to_gray(quadrant)))
+    return max(amounts) if amounts else None
+
+
+def extract_store_opencv(img):
+    """
+    Finds text lines in the top third, where the merchant header is
+    printed, and ranks them by how header-like they are: tall type, near
+    the top, centred and reasonably long.
+    Returns up to STORE_REGIONS boxes [{"x", "y", "w", "h", "score"}],
+    best first. Every step is whole-array work on component stats and
+    row projections, so cost does not grow with the number of blobs.
+    """
+    h, w = img.shape[:2]
+    top_strip = _to_gray(img[:h//3])
+    strip_h = top_strip.shape[0]
+
+    binary = binarize(top_strip)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return []
+
+    cx, cy, cw, ch, area = (stats[1:, i] for i in range(5))
+
+    # ---- Keep text-like components: not specks, rules, logos or shadows ----
+    keep = (ch >= max(6, strip_h * 0.01)) & (ch <= strip_h * 0.2) \
+        & (cw <= ch * 8) & (area >= ch) & (area <= cw * ch * 0.9)
+    if not keep.any():
+        return []
+    lut = np.concatenate([[False], keep])
+    text_mask = lut[labels]
+
+    # ---- Text lines from the row projection of the kept ink ----
+    # Rows are compared to the local peak (a 1-D max filter about two text
+    # heights wide), so the shallow valleys between slightly skewed,
+    # tightly spaced lines still split them.
+    profile = text_mask.sum(axis=1).astype(np.float32)
+    char_h = int(np.median(ch[keep]))
+    local_peak = cv2.dilate(profile.reshape(-1, 1), np.ones((2 * char_h + 1, 1), np.uint8)).ravel()
+    ink_rows = (profile >= 2) & (profile >= local_peak * 0.25)
+    edges = np.diff(np.concatenate([[0], ink_rows.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    tall = (ends - starts) >= max(6, strip_h * 0.01)
+    starts, ends = starts[tall], ends[tall]
+    if len(starts) == 0:
+        return []
+
+    # ---- Horizontal extent of each line from its components ----
+    centers = cy + ch / 2.0
+    line_of = np.searchsorted(starts, centers, side="right") - 1
+    inside = keep & (line_of >= 0) & (centers < ends[np.clip(line_of, 0, None)])
+    line_of, comp_x, comp_r, comp_h = line_of[inside], cx[inside], (cx + cw)[inside], ch[inside]
+
+    n_lines = len(starts)
+    lefts = np.full(n_lines, w, dtype=np.int64)
+    rights = np.zeros(n_lines, dtype=np.int64)
+    np.minimum.at(lefts, line_of, comp_x)
+    np.maximum.at(rights, line_of, comp_r)
+    glyphs = np.bincount(line_of, minlength=n_lines)
+    type_size = np.bincount(line_of, weights=comp_h, minlength=n_lines) / np.maximum(glyphs, 1)
+
+    valid = glyphs >= 3
+    if not valid.any():
+        return []
+    starts, ends, lefts, rights = starts[valid], ends[valid], lefts[valid], rights[valid]
+    glyphs, type_size = glyphs[valid], type_size[valid]
+    heights, widths = ends - starts, rights - lefts
+
+    # ---- Header likelihood ----
+    # Type size is the mean glyph height, so two lines that merged in the
+    # projection do not look like one big headline
+    size = type_size / type_size.max()
+    position = 1.0 - starts / strip_h
+    centred = 1.0 - np.abs((lefts + rights) / 2.0 - w / 2.0) / (w / 2.0)
+    length = np.minimum(glyphs / 8.0, 1.0)
+    score = 0.4 * size + 0.3 * position + 0.15 * centred + 0.15 * length
+
+    best = np.argsort(-score)[:STORE_REGIONS]
+    return [
+        {
+            "x": int(lefts[i]),
+            "y": int(starts[i]),
+            "w": int(widths[i]),
+            "h": int(heights[i]),
+            "score": round(float(score[i]), 3)
+        }
+        for i in best
+    ]
+
+
+def perceptual_hash(img):
+    """
+    64-bit DCT perceptual hash (pHash) of an image, as an unsigned int.
+    Small changes in exposure, scale or JPEG quality flip only a few bits,
+    so re-photographed receipts land within a small Hamming distance.
+    """
+    small = cv2.resize(_to_gray(img), (32, 32), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(np.float32(small))
+    low = dct[:8, :8].flatten()
+    # Skip the DC term when taking the median, it only encodes brightness
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def process_receipt(data):
+    """
+    Decodes raw upload bytes and runs the extraction passes.
+    Kept free of Flask so it can run inside pool worker processes.
+    """
+    img = decode_receipt(data)
+
+    # Report boxes in the coordinates of the uploaded image, not the decoded
+    # one. imdecode applies EXIF orientation, so a 90/270 degree photo comes
+    # back with width and height swapped against its header; the long side
+    # is the same either way.
+    size = image_size(data)
+    scale = max(size) / max(img.shape[:2]) if size else 1.0
+    regions = extract_store_opencv(img)
+    for region in regions:
+        for key in ("x", "y", "w", "h"):
+            region[key] = int(round(region[key] * scale))
+
+    return {
+        "store_regions": regions,
+        "amount": extract_amount_opencv(img),
+        "phash": f"{perceptual_hash(img):016x}"
+    }
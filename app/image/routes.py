@@ -1,75 +1,196 @@
-from flask import jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
 import os
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required
-from app.utils import get_db_connection  # absolute import
-import cv2
-import numpy as np
+import re
+import zipfile
+from concurrent.futures import wait, FIRST_COMPLETED
+from flask import Blueprint, jsonify, request, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils import get_db_connection, ndjson_response  # absolute import
+from app.image.processing import process_receipt, PIPELINE_VERSION
+from app.image.jobs import submit_job, get_job, run_in_background, get_executor, POOL_WORKERS
+from app.image import storage
+from app.image.duplicates import find_duplicates, to_signed
+from app.categories.merchants import suggest_category
 
 image_bp = Blueprint("image", __name__, url_prefix="/image")
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "tiff"}
 
+# Uploads up to this size are processed inline; bigger scans go to the pool.
+SYNC_MAX_BYTES = int(os.environ.get("RECEIPT_SYNC_MAX_BYTES", 512 * 1024))
 
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
-
-
-def extract_amount_opencv(img):
-    """Extract largest numeric-like region in lower-right quadrant using OpenCV."""
-    h, w = img.shape[:2]
-    quadrant = img[h//2:, w//2:]
-
-    gray = cv2.cvtColor(quadrant, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
-    _, thresh = cv2.threshold(blur, 150, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+# Batch uploads: images being decoded or processed at once, and the
+# largest ZIP entry accepted (guards against decompression bombs)
+BATCH_IN_FLIGHT = int(os.environ.get("RECEIPT_BATCH_IN_FLIGHT", POOL_WORKERS * 2))
+BATCH_MAX_ENTRY_BYTES = int(os.environ.get("RECEIPT_BATCH_MAX_ENTRY_BYTES", 25 * 1024 * 1024))
 
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    max_val = 0.0
+# Stored files never change under a given hash
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
 
-    for cnt in contours:
-        x, y, cw, ch = cv2.boundingRect(cnt)
-        roi = quadrant[y:y+ch, x:x+cw]
-        text_like = cv2.resize(roi, (100, 30))
-        # Simple numeric detection: count white pixels as proxy for digits
-        white_pixels = cv2.countNonZero(cv2.cvtColor(text_like, cv2.COLOR_BGR2GRAY))
-        if white_pixels > max_val:
-            max_val = white_pixels
-            # We could extract the number via image processing here if needed
-    return None  # Placeholder: without OCR we can't get exact number
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
 
 
-def extract_store_opencv(img):
-    """Detect top third region and find store name-like line (ends with d.o.o or d.d)"""
-    h, w = img.shape[:2]
-    top_strip = img[:h//3]
+def allowed_file(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    gray = cv2.cvtColor(top_strip, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5,5),0)
-    _, thresh = cv2.threshold(blur, 150, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
 
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    possible_names = []
-    for cnt in contours:
-        x, y, cw, ch = cv2.boundingRect(cnt)
-        if cw > 50 and ch > 10:  # heuristic to ignore small blobs
-            possible_names.append((x, y, cw, ch))
+def record_receipt(user_id, sha, filename, phash):
+    """
+    Links a stored receipt to the user; re-uploads reuse the existing row.
+    Returns the receipt id.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO receipts (user_id, sha256, filename, phash)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (user_id, sha256) DO UPDATE SET filename = EXCLUDED.filename
+                RETURNING id
+            """, (user_id, sha, filename, to_signed(phash)))
+            receipt_id = cur.fetchone()[0]
+            conn.commit()
+    return receipt_id
 
-    # Sort top to bottom
-    possible_names.sort(key=lambda b: b[1])
 
-    # Placeholder: return bounding box of top-most blob containing text
-    for x, y, cw, ch in possible_names:
-        roi_text = top_strip[y:y+ch, x:x+cw]
-        # Fake detection: return rectangle string
-        return f"ROI at x:{x}, y:{y}, w:{cw}, h:{ch}" 
-    return None
+def finish_receipt(user_id, sha, filename, result, cached=False, text=None):
+    """
+    Caches a fresh extraction result and builds the upload response.
+    Also runs as the job callback, outside the request context.
+    The category is suggested from the receipt text sent by the client
+    (and the file name), as merchant names are not read from the image.
+    """
+    if not cached:
+        storage.save_result(sha, PIPELINE_VERSION, result)
+    phash = int(result["phash"], 16)
+    receipt_id = record_receipt(user_id, sha, filename, phash)
+    return {
+        "success": True,
+        "receipt_id": receipt_id,
+        "sha256": sha,
+        "filename": filename,
+        "cached": cached,
+        "thumbnail_url": f"/image/receipts/{sha}/thumbnail",
+        "duplicates": find_duplicates(user_id, phash, exclude_id=receipt_id),
+        "category_suggestion": suggest_category(user_id, " ".join(filter(None, [text, filename]))),
+        **result
+    }
 
 
 @image_bp.route("/upload-receipt", methods=["POST"])
 @jwt_required()
 def upload_receipt():
+    """
+    Upload a receipt image for processing
+    ---
+    tags:
+      - Image
+    security:
+      - Bearer: []
+    consumes:
+      - multipart/form-data
+    produces:
+      - application/json
+    parameters:
+      - name: file
+        in: formData
+        type: file
+        required: true
+        description: Receipt image (png, jpg, jpeg, tiff)
+      - name: text
+        in: formData
+        type: string
+        required: false
+        description: Receipt text (e.g. from on-device OCR) used to suggest a category
+    responses:
+      200:
+        description: Receipt processed inline, or returned from the cache for a repeat upload
+        schema:
+          type: object
+          properties:
+            success:
+              type: boolean
+              example: true
+            receipt_id:
+              type: integer
+              example: 7
+            sha256:
+              type: string
+            filename:
+              type: string
+              example: "receipt.jpg"
+            cached:
+              type: boolean
+              example: false
+            thumbnail_url:
+              type: string
+            store_regions:
+              type: array
+              description: Candidate merchant header lines in the top third, best first
+              items:
+                type: object
+                properties:
+                  x:
+                    type: integer
+                  y:
+                    type: integer
+                  w:
+                    type: integer
+                  h:
+                    type: integer
+                  score:
+                    type: number
+                    example: 0.86
+            amount:
+              type: number
+              format: float
+            phash:
+              type: string
+              description: 64-bit perceptual hash, hex
+              example: "c3a1f0e87b2d4e19"
+            duplicates:
+              type: array
+              description: Likely re-photographed copies of this receipt, closest first
+              items:
+                type: object
+                properties:
+                  receipt_id:
+                    type: integer
+                    example: 3
+                  expense_id:
+                    type: integer
+                    example: 42
+                  distance:
+                    type: integer
+                    example: 4
+            category_suggestion:
+              type: object
+              description: Category matched by the merchant dictionary, or null
+              properties:
+                category_id:
+                  type: integer
+                  example: 3
+                keyword:
+                  type: string
+                  example: "konzum"
+                source:
+                  type: string
+                  enum: [user, global]
+      202:
+        description: Large image queued for processing, poll the job URL
+        schema:
+          type: object
+          properties:
+            job_id:
+              type: string
+              example: "3f2b9c0e8a4d4c2fa1b7d5e6c9a0b1c2"
+            status:
+              type: string
+              example: "queued"
+            status_url:
+              type: string
+              example: "/image/jobs/3f2b9c0e8a4d4c2fa1b7d5e6c9a0b1c2"
+      400:
+        description: No file or invalid file
+    """
     user_id = get_jwt_identity()
     if "file" not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
@@ -78,26 +199,249 @@ def upload_receipt():
     if file.filename == "" or not allowed_file(file.filename):
         return jsonify({"error": "Invalid file"}), 400
 
-    folder_name = request.form.get("folder_name", "receipts")
-    upload_folder = os.path.join(r"C:\inetpub\wwwroot\FlaskApp\static\image", folder_name)
-    os.makedirs(upload_folder, exist_ok=True)
-
     filename = file.filename
-    file_path = os.path.join(upload_folder, filename)
-    file.save(file_path)
+    text = request.form.get("text")
+
+    # Single read of the upload; decoding works on these bytes directly
+    data = file.read()
+    sha = storage.content_hash(data)
 
-    try:
-        img = cv2.imdecode(np.fromfile(file_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    # ---- Repeat upload: same bytes were already processed ----
+    cached = storage.load_result(sha, PIPELINE_VERSION)
+    if cached is not None:
+        if not storage.has_blob(sha):
+            run_in_background(storage.save_blob, sha, data)
+        return jsonify(finish_receipt(user_id, sha, filename, cached, cached=True, text=text)), 200
 
-        amount = extract_amount_opencv(img)
-        store_name = extract_store_opencv(img)
+    run_in_background(storage.save_blob, sha, data)
 
-    except Exception as e:
-        return jsonify({"error": f"Image processing failed: {str(e)}"}), 500
+    # ---- Fast path: small images are cheaper to do than to queue ----
+    if len(data) <= SYNC_MAX_BYTES:
+        try:
+            result = process_receipt(data)
+        except Exception as e:
+            return jsonify({"error": f"Image processing failed: {str(e)}"}), 500
+        return jsonify(finish_receipt(user_id, sha, filename, result, text=text)), 200
 
+    job_id = submit_job(
+        user_id, process_receipt, data,
+        on_done=lambda result: finish_receipt(user_id, sha, filename, result, text=text)
+    )
     return jsonify({
-        "success": True,
-        "filename": filename,
-        "store_name": store_name,
-        "amount": amount
-    }), 200
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/image/jobs/{job_id}"
+    }), 202
+
+
+def iter_batch_uploads(files):
+    """
+    Yields (filename, bytes or None, error or None) for every image in the
+    uploaded files. ZIP archives are read entry by entry from the upload
+    stream, never extracted to disk, so only one entry is held at a time.
+    """
+    for file in files:
+        name = file.filename or ""
+        if name.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile:
+                yield name, None, "Invalid ZIP archive"
+                continue
+            with archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if not allowed_file(info.filename):
+                        yield info.filename, None, "Invalid file"
+                    elif info.file_size > BATCH_MAX_ENTRY_BYTES:
+                        yield info.filename, None, "File too large"
+                    else:
+                        yield info.filename, archive.read(info), None
+        elif allowed_file(name):
+            yield name, file.read(), None
+        else:
+            yield name, None, "Invalid file"
+
+
+@image_bp.route("/upload-receipts", methods=["POST"])
+@jwt_required()
+def upload_receipts():
+    """
+    Upload many receipts at once (several files and/or ZIP archives)
+    ---
+    tags:
+      - Image
+    security:
+      - Bearer: []
+    consumes:
+      - multipart/form-data
+    produces:
+      - application/x-ndjson
+    parameters:
+      - name: files
+        in: formData
+        type: file
+        required: true
+        description: Receipt images or ZIP archives of them; repeat the field for several files
+    responses:
+      200:
+        description: >
+          One JSON object per line, in completion order. Successful lines have
+          the same fields as /image/upload-receipt; failed ones have filename and error.
+      400:
+        description: No files uploaded
+    """
+    user_id = get_jwt_identity()
+    files = request.files.getlist("files")
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    def _generate():
+        executor = get_executor()
+        uploads = iter_batch_uploads(files)
+        pending = {}
+        exhausted = False
+
+        while pending or not exhausted:
+            # ---- Keep the pool fed, at most BATCH_IN_FLIGHT images in memory ----
+            while not exhausted and len(pending) < BATCH_IN_FLIGHT:
+                item = next(uploads, None)
+                if item is None:
+                    exhausted = True
+                    break
+                filename, data, error = item
+                if error:
+                    yield {"filename": filename, "error": error}
+                    continue
+
+                sha = storage.content_hash(data)
+                cached = storage.load_result(sha, PIPELINE_VERSION)
+                if cached is not None:
+                    storage.save_blob(sha, data)
+                    yield finish_receipt(user_id, sha, filename, cached, cached=True)
+                    continue
+                pending[executor.submit(process_receipt, data)] = (filename, sha, data)
+
+            if not pending:
+                continue
+
+            # ---- Stream results as soon as any image finishes ----
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename, sha, data = pending.pop(future)
+                try:
+                    result = future.result()
+                    storage.save_blob(sha, data)
+                    yield finish_receipt(user_id, sha, filename, result)
+                except Exception as e:
+                    yield {"filename": filename, "error": f"Image processing failed: {str(e)}"}
+
+    return ndjson_response(_generate())
+
+
+@image_bp.route("/jobs/<string:job_id>", methods=["GET"])
+@jwt_required()
+def receipt_job(job_id):
+    """
+    Get status and result of a receipt processing job
+    ---
+    tags:
+      - Image
+    security:
+      - Bearer: []
+    produces:
+      - application/json
+    parameters:
+      - name: job_id
+        in: path
+        type: string
+        required: true
+        description: Job id returned by /image/upload-receipt
+    responses:
+      200:
+        description: Job status (queued, running, done or failed) and result when done
+        schema:
+          type: object
+          properties:
+            id:
+              type: string
+            status:
+              type: string
+              example: "done"
+            result:
+              type: object
+            error:
+              type: string
+      404:
+        description: Job not found
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Job not found"
+    """
+    user_id = get_jwt_identity()
+    job = get_job(job_id, user_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@image_bp.route("/receipts/<string:sha>/thumbnail", methods=["GET"])
+@jwt_required()
+def receipt_thumbnail(sha):
+    """
+    Get a receipt thumbnail (generated on first request)
+    ---
+    tags:
+      - Image
+    security:
+      - Bearer: []
+    produces:
+      - image/jpeg
+    parameters:
+      - name: sha
+        in: path
+        type: string
+        required: true
+        description: SHA-256 of the receipt, as returned by /image/upload-receipt
+    responses:
+      200:
+        description: JPEG thumbnail, supports Range and conditional requests
+      404:
+        description: Receipt not found
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Receipt not found"
+    """
+    user_id = get_jwt_identity()
+    if not SHA256_RE.match(sha):
+        return jsonify({"error": "Receipt not found"}), 404
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM receipts WHERE user_id = %s AND sha256 = %s", (user_id, sha))
+            if not cur.fetchone():
+                return jsonify({"error": "Receipt not found"}), 404
+
+    path = storage.ensure_thumbnail(sha)
+    if not path:
+        return jsonify({"error": "Receipt not found"}), 404
+
+    response = send_file(
+        path,
+        mimetype="image/jpeg",
+        conditional=True,
+        etag=f"{sha}-thumb",
+        max_age=THUMBNAIL_MAX_AGE
+    )
+    # Content-addressed, so it can be cached forever, but only by the owner
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
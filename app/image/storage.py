@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import tempfile
+import cv2
+import numpy as np
+from app.image.processing import REDUCED_COLOR, image_size, reduction_factor
+
+# ----------------- CONFIG -----------------
+# Receipts are stored by SHA-256 of their bytes: <root>/ab/cd/abcd...ef
+STORAGE_ROOT = os.environ.get(
+    "RECEIPT_STORAGE_ROOT",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "receipts")
+)
+THUMBNAIL_LONG_SIDE = 320
+THUMBNAIL_QUALITY = 80
+
+
+def content_hash(data):
+    """Returns the hex SHA-256 of the given bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _shard_dir(sha):
+    return os.path.join(STORAGE_ROOT, sha[:2], sha[2:4])
+
+
+def blob_path(sha):
+    return os.path.join(_shard_dir(sha), sha)
+
+
+def result_path(sha):
+    return os.path.join(_shard_dir(sha), f"{sha}.json")
+
+
+def thumbnail_path(sha):
+    return os.path.join(_shard_dir(sha), f"{sha}.thumb.jpg")
+
+
+def _atomic_write(path, data):
+    """
+    Writes to a temp file in the target directory and renames it into place,
+    so concurrent readers never see a half-written file.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+# ----------------- BLOBS -----------------
+def save_blob(sha, data):
+    """
+    Stores receipt bytes under their hash. Identical uploads share one file.
+    """
+    path = blob_path(sha)
+    if not os.path.exists(path):
+        _atomic_write(path, data)
+    return path
+
+
+def has_blob(sha):
+    return os.path.exists(blob_path(sha))
+
+
+# ----------------- EXTRACTION CACHE -----------------
+def load_result(sha, version):
+    """
+    Returns the cached extraction result for a hash, or None when missing
+    or produced by a different pipeline version.
+    """
+    try:
+        with open(result_path(sha), "r", encoding="utf-8") as fh:
+            cached = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != version:
+        return None
+    return cached.get("result")
+
+
+def save_result(sha, version, result):
+    payload = json.dumps({"version": version, "result": result}).encode("utf-8")
+    _atomic_write(result_path(sha), payload)
+
+
+# ----------------- THUMBNAILS -----------------
+def ensure_thumbnail(sha):
+    """
+    Returns the thumbnail path for a stored receipt, generating it on first
+    request. Returns None if the original is not stored.
+    """
+    path = thumbnail_path(sha)
+    if os.path.exists(path):
+        return path
+    if not has_blob(sha):
+        return None
+
+    with open(blob_path(sha), "rb") as fh:
+        data = fh.read()
+    factor = reduction_factor(image_size(data), THUMBNAIL_LONG_SIDE)
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_COLOR[factor])
+    if img is None:
+        return None
+
+    h, w = img.shape[:2]
+    scale = THUMBNAIL_LONG_SIDE / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    if not ok:
+        return None
+    _atomic_write(path, encoded.tobytes())
+    return path
@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from app.utils import get_db_connection, admin_required  # absolute import
+from app.utils import get_db_connection, admin_required, Money  # absolute import
 
 sio_bp = Blueprint("tba_sio", __name__, url_prefix="/tba_sio")
 
@@ -66,8 +66,8 @@ def create_tba_sio():
         return jsonify({"error": "Key and value are required"}), 400
 
     try:
-        value = float(value)
-    except:
+        value = Money.parse(value)
+    except ValueError:
         return jsonify({"error": "Value must be a number"}), 400
 
     conn = get_db_connection()
@@ -117,7 +117,7 @@ def get_all_tba_sio():
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT key, value FROM tba_sio ORDER BY key")
-    entries = [{"key": row[0], "value": float(row[1])} for row in cur.fetchall()]
+    entries = [{"key": row[0], "value": Money(row[1])} for row in cur.fetchall()]
     cur.close()
     conn.close()
     return jsonify(entries)
@@ -147,7 +147,7 @@ def get_tba_sio(key):
     conn.close()
     if not row:
         return jsonify({"error": "Key not found"}), 404
-    return jsonify({"key": row[0], "value": float(row[1])})
+    return jsonify({"key": row[0], "value": Money(row[1])})
 
 @sio_bp.route("/<string:key>", methods=["PUT"])
 @jwt_required()
@@ -209,8 +209,8 @@ def update_tba_sio(key):
     if value is None:
         return jsonify({"error": "Value is required"}), 400
     try:
-        value = float(value)
-    except:
+        value = Money.parse(value)
+    except ValueError:
         return jsonify({"error": "Value must be a number"}), 400
 
     conn = get_db_connection()
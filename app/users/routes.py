@@ -3,13 +3,41 @@ from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identi
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import date, datetime, timedelta
 import random, string
-from app.utils import PASSWORD_RULES, validate_password, apply_monthly_payday, send_email, admin_required, get_db_connection
+from app.utils import PASSWORD_RULES, validate_password, apply_monthly_payday, send_email, admin_required, get_db_connection, bump_versions, conditional_get, user_scope, notify_user, json_array_sql, json_response, SQL_JSON_RESPONSES, Money, money_sql
+from app.expenses.archive import remove_archive
+from app.expenses.cache import expense_cache
 
 users_bp = Blueprint("users", __name__)
 
 
+def users_json_sql():
+    """GET /users/ rendered by PostgreSQL, keys sorted like jsonify's."""
+    return json_array_sql(f"""
+        SELECT {money_sql("COALESCE(balance, 0)")} AS balance, created_at, id, last_payday, username FROM users
+    """, "r.id")
+
+
+def get_profile(conn, user_id):
+    """
+    The /me payload: balance and salary. Callers apply the monthly payday first.
+    Returns None if the user doesn't exist.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT balance, salary FROM users WHERE id = %s", (user_id,))
+        row = cur.fetchone()
+    if not row:
+        return None
+    return {
+        "user_id": user_id,
+        "balance": Money(row[0] or 0),
+        "salary": Money(row[1]) if row[1] is not None else None,
+        "message": "You are authenticated!"
+    }
+
+
 @users_bp.route("/me", methods=["GET"])
 @jwt_required()
+@conditional_get("user")
 def me():
     """
     Get authenticated user info (current balance includes all expenses)
@@ -60,19 +88,11 @@ def me():
 
     # Use context managers to safely handle DB connection and cursor
     with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT salary FROM users WHERE id = %s", (user_id,))
-            row = cur.fetchone()
-            if not row:
-                return jsonify({"error": "User not found"}), 404
-            salary = float(row[0])
+        profile = get_profile(conn, user_id)
+    if profile is None:
+        return jsonify({"error": "User not found"}), 404
 
-    return jsonify({
-        "user_id": user_id,
-        "balance": float(balance),
-        "salary": salary,
-        "message": "You are authenticated!"
-    })
+    return jsonify(profile)
 
 @users_bp.route("/request-password-reset", methods=["POST"])
 def request_password_reset():
@@ -314,14 +334,18 @@ def get_users():
     """
     with get_db_connection() as conn:
         with conn.cursor() as cur:
+            if SQL_JSON_RESPONSES:
+                cur.execute(users_json_sql())
+                return json_response(cur.fetchone()[0])
+
             cur.execute("SELECT id, username, balance, created_at, last_payday FROM users ORDER BY id")
             users = [
                 {
                     "id": row[0],
                     "username": row[1],
-                    "balance": float(row[2]) if row[2] is not None else 0,
-                    "created_at": row[3].isoformat() if row[3] else None,
-                    "last_payday": row[4].isoformat() if row[4] else None
+                    "balance": Money(row[2] or 0),
+                    "created_at": row[3],
+                    "last_payday": row[4]
                 }
                 for row in cur.fetchall()
             ]
@@ -389,9 +413,9 @@ def get_user(user_id):
     return jsonify({
         "id": row[0],
         "username": row[1],
-        "balance": float(row[2]) if row[2] else 0,
-        "created_at": row[3].isoformat() if row[3] else None,
-        "last_payday": row[4].isoformat() if row[4] else None
+        "balance": Money(row[2] or 0),
+        "created_at": row[3],
+        "last_payday": row[4]
     })
 
 @users_bp.route("/<int:user_id>", methods=["PUT"])
@@ -452,8 +476,12 @@ def update_user(user_id):
     fields, values = [], []
 
     if "balance" in data:
+        try:
+            balance = Money.parse(data["balance"])
+        except ValueError:
+            return jsonify({"error": "Invalid balance"}), 400
         fields.append("balance = %s")
-        values.append(data["balance"])
+        values.append(balance)
 
     if "password" in data:
         hashed_pw = generate_password_hash(data["password"])
@@ -476,13 +504,16 @@ def update_user(user_id):
     with get_db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                f"UPDATE users SET {', '.join(fields)} WHERE id = %s RETURNING id",
+                f"UPDATE users SET {', '.join(fields)} WHERE id = %s RETURNING id, balance",
                 tuple(values)
             )
             updated = cur.fetchone()
             if not updated:
                 conn.rollback()
                 return jsonify({"error": "User not found"}), 404
+            bump_versions(cur, user_scope(user_id))
+            if "balance" in data:
+                notify_user(cur, user_id, balance={"balance": Money(updated[1])}, aggregation={})
 
         conn.commit()
 
@@ -535,4 +566,6 @@ def delete_user(user_id):
     conn.commit()
     cur.close()
     conn.close()
+    remove_archive(user_id)
+    expense_cache.forget(user_id)
     return jsonify({"message": "User deleted", "id": user_id})
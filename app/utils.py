@@ -1,12 +1,20 @@
 import re
 import os
+import hashlib
+import threading
+import orjson
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extensions import register_adapter, AsIs
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
 from functools import wraps
-from flask import jsonify
+from flask import jsonify, request, make_response, current_app, g, has_app_context, has_request_context, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_jwt_extended import get_jwt_identity
 import smtplib
 from email.mime.text import MIMEText
-from datetime import date, datetime
+from datetime import date
 
 # ----------------- PASSWORD VALIDATION -----------------
 PASSWORD_RULES = {
@@ -36,16 +44,446 @@ def validate_password(password: str):
     return errors
 
 # ----------------- DATABASE CONNECTION -----------------
-def get_db_connection():
+def get_db_connection(autocommit=False):
     """
     Creates and returns a new PostgreSQL database connection.
+    Inside a /batch request every handler shares the batch's connection.
+    Handlers that do all their work in a single statement ask for
+    autocommit: the statement is its own transaction, which saves the
+    BEGIN and COMMIT round trips.
     """
-    return psycopg2.connect(
-        host=os.environ.get("POSTGRES_HOST", "db"),
-        database=os.environ.get("POSTGRES_DB", "home_budget"),
-        user=os.environ.get("POSTGRES_USER", "postgres"),
-        password=os.environ.get("POSTGRES_PASSWORD", "postgres")
-    )
+    shared = g.get("_batch_connection") if has_app_context() else None
+    if shared is not None:
+        return shared
+    conn = psycopg2.connect(**_connect_params())
+    conn.autocommit = autocommit
+    return conn
+
+
+def _connect_params():
+    return {
+        "host": os.environ.get("POSTGRES_HOST", "db"),
+        "database": os.environ.get("POSTGRES_DB", "home_budget"),
+        "user": os.environ.get("POSTGRES_USER", "postgres"),
+        "password": os.environ.get("POSTGRES_PASSWORD", "postgres")
+    }
+
+
+# Pool for endpoints that fan one request out over several connections.
+# ThreadedConnectionPool raises when empty; the semaphore makes callers wait.
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrows a connection from the process-wide pool; commits on success,
+    rolls back on error and returns it to the pool either way.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(0, DB_POOL_MAX, **_connect_params())
+    with _pool_slots:
+        conn = _pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _pool.putconn(conn, close=conn.closed)
+
+
+class SharedConnection:
+    """
+    Stands in for a connection inside /batch. Handlers keep using it the
+    usual way (with-block, commit, close), but close is a no-op and, when
+    the batch is atomic, commit only ends the current sub-request's
+    savepoint; the batch commits once at the end.
+    """
+
+    def __init__(self, conn, atomic):
+        self._conn = conn
+        self.atomic = atomic
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.atomic:
+            if exc_type is not None:
+                self.rollback()
+        else:
+            self._conn.__exit__(exc_type, exc, tb)
+
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(*args, **kwargs)
+
+    def begin_item(self):
+        if self.atomic:
+            with self._conn.cursor() as cur:
+                cur.execute("SAVEPOINT batch_item")
+
+    def commit(self):
+        if not self.atomic:
+            self._conn.commit()
+
+    def rollback(self):
+        if self.atomic:
+            with self._conn.cursor() as cur:
+                cur.execute("ROLLBACK TO SAVEPOINT batch_item")
+        else:
+            self._conn.rollback()
+
+    def close(self):
+        pass
+
+# ----------------- DATA VERSIONS -----------------
+# Every write bumps the version of the data it touched: the user's own
+# data, or the shared categories. Read endpoints derive their ETag from it.
+CATEGORIES_SCOPE = "categories"
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def bump_versions(cur, *scopes):
+    """
+    Increments the given data versions inside the caller's transaction,
+    so the new version becomes visible together with the write.
+    Scopes are locked in sorted order to avoid deadlocks. The new
+    (scope, version) rows can be fetched from cur.
+    """
+    cur.execute("""
+        INSERT INTO data_versions (scope, version)
+        SELECT scope, 1 FROM unnest(%s::text[]) AS scope ORDER BY scope
+        ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1
+        RETURNING scope, version
+    """, (sorted(set(scopes)),))
+
+
+def conditional_get(*scopes):
+    """
+    Flask decorator for GET endpoints whose response depends only on the
+    given data versions ("user" means the caller's own data), the query
+    string and today's date. Answers If-None-Match with 304 after a single
+    primary-key lookup, before the endpoint runs any of its queries. The
+    versions it read are left in g.data_versions.
+    Place it below @jwt_required().
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            keys = [user_scope(get_jwt_identity()) if scope == "user" else scope for scope in scopes]
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT scope, version FROM data_versions WHERE scope = ANY(%s)", (keys,))
+                    versions = dict(cur.fetchall())
+
+            state = "|".join(f"{key}={versions.get(key, 0)}" for key in keys)
+            etag = hashlib.sha1(f"{request.full_path}|{state}|{date.today()}".encode("utf-8")).hexdigest()
+            g.data_etag = etag
+            g.data_versions = {key: versions.get(key, 0) for key in keys}
+
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+# ----------------- MONEY -----------------
+class Money(int):
+    """
+    An amount of money in minor units (cents). The database stores every
+    amount, balance and setting value as BIGINT cents and sums them as
+    integers; the API speaks major units: 25.5, or "25.50" with
+    ?money=string.
+    """
+    MINOR_UNITS = 100
+    # Amounts are stored as bigint
+    MAX_CENTS = 2**63 - 1
+
+    @classmethod
+    def parse(cls, value):
+        """Major units from a request (25.5, "25.50") to Money. Raises ValueError."""
+        if isinstance(value, bool):
+            raise ValueError("Not an amount")
+        try:
+            major = Decimal(str(value).strip())
+            if not major.is_finite():
+                raise ValueError("Not an amount")
+            # Overflow on exponents like "1e999999999"
+            cents = int((major * cls.MINOR_UNITS).to_integral_value(rounding=ROUND_HALF_UP))
+        except ArithmeticError:
+            raise ValueError("Not an amount")
+        if abs(cents) > cls.MAX_CENTS:
+            raise ValueError("Amount out of range")
+        return cls(cents)
+
+    def to_float(self):
+        return int(self) / self.MINOR_UNITS
+
+    def __str__(self):
+        return f"{Decimal(int(self)).scaleb(-2):f}"
+
+    def __repr__(self):
+        return f"Money({int(self)})"
+
+    def __add__(self, other):
+        return Money(int(self) + other) if isinstance(other, int) else NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Money(int(self) - other) if isinstance(other, int) else NotImplemented
+
+    def __rsub__(self, other):
+        return Money(other - int(self)) if isinstance(other, int) else NotImplemented
+
+    def __neg__(self):
+        return Money(-int(self))
+
+
+# Sent to the database as the plain integer, never through __str__
+register_adapter(Money, lambda money: AsIs(int(money)))
+
+
+def money_event_sql(column):
+    """SQL for a cents column as the major-units number /events messages carry."""
+    return f"({column} / 100.0)::float8"
+
+
+def money_sql(column):
+    """SQL rendering a cents column in major units, as the JSON provider would."""
+    if has_request_context() and request.args.get("money") == "string":
+        return f"({column} / 100.0)::numeric(20,2)::text"
+    return f"({column} / 100.0)::float8"
+
+# ----------------- JSON -----------------
+class OrjsonProvider(JSONProvider):
+    """
+    App-wide JSON provider on orjson. Dates and datetimes serialize as
+    ISO strings, Money and Decimals as numbers, or as exact strings when
+    the request asks with ?money=string. Keys are sorted, like Flask's
+    default.
+    """
+    mimetype = "application/json"
+    # Subclasses (Money is an int) go to the default function
+    options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_SUBCLASS
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj):
+        exact = has_request_context() and request.args.get("money") == "string"
+        return orjson.dumps(obj, default=_exact_default if exact else _default, option=self.options)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def _default(obj):
+    if isinstance(obj, Money):
+        return obj.to_float()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    # Other subclasses of the native types (passed through above)
+    for native in (str, int, dict, list):
+        if isinstance(obj, native):
+            return native(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _exact_default(obj):
+    if isinstance(obj, (Money, Decimal)):
+        return str(obj)
+    return _default(obj)
+
+
+def ndjson_response(items, status=200):
+    """
+    Streams an iterable of objects as NDJSON, one line per object as soon
+    as it's produced, encoded like every other response.
+    """
+    provider = current_app.json
+
+    def _lines():
+        for item in items:
+            yield provider.dumps_bytes(item) + b"\n"
+
+    return current_app.response_class(stream_with_context(_lines()), status=status, mimetype="application/x-ndjson")
+
+# ----------------- JSON FROM THE DATABASE -----------------
+# List endpoints can have PostgreSQL render the response body and pass it
+# through untouched, instead of building dicts and re-serializing them.
+# Same keys and nesting as jsonify, keys in the same (sorted) order;
+# numbers print like PostgreSQL's (25 rather than 25.0).
+SQL_JSON_RESPONSES = os.environ.get("SQL_JSON_RESPONSES", "1") == "1"
+
+
+def json_array_sql(query, order):
+    """
+    Wraps a query into one returning its rows as a JSON array (text).
+    The output columns become the keys; `order` is an ORDER BY over them.
+    """
+    return f"""
+        SELECT COALESCE('[' || string_agg(row_to_json(r)::text, ',' ORDER BY {order}) || ']', '[]')
+        FROM ({query}) r
+    """
+
+
+def json_response(body, status=200):
+    """Response for a JSON body that is already serialized."""
+    return current_app.response_class(body + "\n", status=status, mimetype="application/json")
+
+# ----------------- SINGLE FLIGHT -----------------
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers that arrive while a
+    call for their key is running wait for it and get its result (or
+    its exception) instead of running it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> in-flight call
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+        return call["result"]
+
+    def stats(self):
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+flights = SingleFlight()
+
+
+def single_flight(fn):
+    """
+    Flask decorator for expensive read endpoints. Identical requests
+    (same user, endpoint and query arguments) that arrive while one is
+    being answered share its response. Below @conditional_get the key
+    also holds the data versions, so a request that already sees newer
+    data never gets an older response. Not used inside /batch, where the
+    connection may hold the batch's own uncommitted writes.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if g.get("_batch_connection") is not None:
+            return fn(*args, **kwargs)
+
+        key = (
+            str(get_jwt_identity()),
+            request.endpoint,
+            tuple(sorted(request.args.items(multi=True))),
+            g.get("data_etag")
+        )
+
+        def _respond():
+            response = make_response(fn(*args, **kwargs))
+            return response.get_data(), response.status_code, list(response.headers.items())
+
+        # Every caller gets its own response object built from the shared parts
+        body, status, headers = flights.do(key, _respond)
+        return current_app.response_class(body, status=status, headers=headers)
+    return wrapper
+
+# ----------------- CHANGE EVENTS -----------------
+# Delivered on commit to the /events listener (app/events/hub.py)
+EVENTS_CHANNEL = "budget_events"
+
+
+def notify_user(cur, user_id, **events):
+    """
+    Queues events for one user's /events streams, e.g.
+    notify_user(cur, user_id, balance={"balance": 12.5}, aggregation={}).
+    Sent only if the caller's transaction commits.
+    """
+    cur.execute("SELECT pg_notify(%s, %s)", (EVENTS_CHANNEL, _event_payload(user_id, events)))
+
+
+def notify_users(cur, messages):
+    """notify_user for many (user_id, events) pairs in one statement."""
+    payloads = [_event_payload(user_id, events) for user_id, events in messages]
+    cur.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload", (EVENTS_CHANNEL, payloads))
+
+
+def _event_payload(user_id, events):
+    payload = {"user": None if user_id is None else str(user_id), "events": events}
+    return orjson.dumps(payload, default=_default, option=orjson.OPT_PASSTHROUGH_SUBCLASS).decode("utf-8")
+
+
+# ----------------- SINGLE-STATEMENT WRITES -----------------
+# bump_versions and notify_user as CTE bodies, for handlers that do their
+# whole write in one statement. They use the %(scope)s and %(user_id)s
+# parameters and act once per row of `source`. bump_version_sql returns
+# the new version, for the caller to patch caches with.
+def bump_version_sql(source):
+    return f"""
+        INSERT INTO data_versions (scope, version)
+        SELECT %(scope)s, 1 WHERE EXISTS (SELECT 1 FROM {source})
+        ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1
+        RETURNING version"""
+
+
+def notify_sql(events, source):
+    """events is a SQL expression for the events object, e.g. json_build_object(...)."""
+    return f"""
+        SELECT pg_notify('{EVENTS_CHANNEL}', json_build_object('user', %(user_id)s::text, 'events', {events})::text)
+        FROM {source}"""
+
+
+def notify_all(cur, **events):
+    """Queues events for every connected client (shared data such as categories)."""
+    notify_user(cur, None, **events)
 
 # ----------------- ADMIN DECORATOR -----------------
 def admin_required(fn):
@@ -60,7 +498,8 @@ def admin_required(fn):
             with conn.cursor() as cur:
                 cur.execute("SELECT value FROM tba_sio WHERE key = %s", (current_user,))
                 row = cur.fetchone()
-        if not row or row[0] != 1:
+        # The admin flag is stored like every tba_sio value: 1.00 in cents
+        if not row or row[0] != Money.parse(1):
             return jsonify({"error": "Access denied. Admin rights required."}), 403
         return fn(*args, **kwargs)
     return wrapper
@@ -95,39 +534,46 @@ def send_email(to_email, subject, message):
 def apply_monthly_payday(user_id):
     """
     Applies monthly salary to user balance and subtracts proportional rent.
-    Updates last_payday in database.
+    Updates last_payday in database. One statement: the conditional update
+    also keeps two concurrent requests from both paying out.
     """
     from app.utils import get_db_connection  # avoid circular import
     today = date.today()
-    with get_db_connection() as conn:
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
-            # Get user data
-            cur.execute("SELECT balance, last_payday, salary FROM users WHERE id = %s", (user_id,))
-            result = cur.fetchone()
-            if not result:
-                return None
-
-            balance, last_payday, salary = result
-
-            # Get rent
-            cur.execute("SELECT key, value FROM tba_sio WHERE key='Rent'")
-            sio_values = dict(cur.fetchall())
-            rent = sio_values.get("Rent", 0)
-
-            # Calculate per-user rent
-            cur.execute("SELECT COUNT(DISTINCT username) FROM users")
-            usercount = cur.fetchone()[0]
-            rent = rent / usercount if usercount else 0
-
-            # Convert last_payday to date if needed
-            if last_payday and isinstance(last_payday, datetime):
-                last_payday = last_payday.date()
-
-            # Apply payday if not already applied this month
-            if not last_payday or (last_payday.year < today.year or last_payday.month < today.month):
-                balance += salary
-                balance -= rent
-                cur.execute("UPDATE users SET balance=%s, last_payday=%s WHERE id=%s",
-                            (balance, today, user_id))
-                conn.commit()
-    return balance
+            cur.execute(PAYDAY_SQL, {
+                "user_id": user_id,
+                "scope": user_scope(user_id),
+                "today": today,
+                "year": today.year,
+                "month": today.month
+            })
+            row = cur.fetchone()
+            conn.commit()
+    # None if the user doesn't exist
+    return Money(row[0]) if row else None
+
+
+# Per-user rent is the Rent setting split over all users. Paid when
+# last_payday is in an earlier month (or never).
+PAYDAY_EVENTS = f"""json_build_object(
+    'balance', json_build_object('balance', {money_event_sql("paid.balance")}),
+    'aggregation', '{{}}'::json)"""
+PAYDAY_SQL = f"""
+    WITH rent AS (
+        SELECT round(COALESCE((SELECT value FROM tba_sio WHERE key = 'Rent'), 0)::numeric
+                     / NULLIF((SELECT COUNT(DISTINCT username) FROM users), 0))::bigint AS share
+    ), paid AS (
+        UPDATE users
+        SET balance = COALESCE(balance, 0) + COALESCE(salary, 0) - COALESCE((SELECT share FROM rent), 0),
+            last_payday = %(today)s
+        WHERE id = %(user_id)s::int
+          AND (last_payday IS NULL
+               OR EXTRACT(YEAR FROM last_payday) < %(year)s
+               OR EXTRACT(MONTH FROM last_payday) < %(month)s)
+        RETURNING balance
+    ), bumped AS ({bump_version_sql("paid")}
+    ), notified AS ({notify_sql(PAYDAY_EVENTS, "paid")})
+    SELECT COALESCE((SELECT balance FROM paid), balance), (SELECT COUNT(*) FROM notified)
+    FROM users WHERE id = %(user_id)s::int
+"""
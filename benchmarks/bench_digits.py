@@ -0,0 +1,105 @@
+"""
+Accuracy and throughput benchmark for the receipt total recognizer.
+
+    python -m benchmarks.bench_digits [--count 200] [--seed 1]
+
+Runs extract_amount_opencv on app/image/Rezija-44.jpg (total 36,00) and on
+synthetic receipts: random item lines and a total in the lower-right
+quadrant, rendered at varying sizes and weights, then blurred, shaded,
+rotated and JPEG-compressed like a phone photo.
+"""
+import argparse
+import os
+import random
+import time
+import cv2
+import numpy as np
+from app.image.digits import get_templates
+from app.image.processing import decode_receipt, extract_amount_opencv
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "image", "Rezija-44.jpg")
+SAMPLE_TOTAL = 36.00
+
+FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_PLAIN)
+WORDS = ("Kruh", "Mlijeko", "Jaja", "Sir", "Voda", "Kava", "DDV", "PDV", "Popust")
+
+
+def fmt(value):
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",").replace(" ", ".")
+
+
+def synthetic_receipt(rng):
+    """Returns (jpeg bytes, expected total)."""
+    font = rng.choice(FONTS)
+    scale = rng.uniform(0.9, 1.5)
+    thickness = rng.choice((2, 3))
+    line_h = int(40 * scale) + 10
+    if font == cv2.FONT_HERSHEY_PLAIN:
+        scale *= 2.0
+
+    prices = [round(rng.uniform(0.5, 99.99), 2) for _ in range(rng.randint(3, 8))]
+    total = round(sum(prices), 2)
+
+    # Items and total go in the bottom half, with a margin below them
+    h = max(rng.randint(1400, 2600), 2 * (len(prices) + 4) * line_h)
+    w = rng.randint(800, 1300)
+    img = np.full((h, w), 245, dtype=np.uint8)
+
+    y = line_h
+    cv2.putText(img, "TRGOVINA d.o.o.", (w // 5, y), font, scale * 1.3, 20, thickness + 1, cv2.LINE_AA)
+    y = h // 2 + line_h
+    for price in prices:
+        cv2.putText(img, rng.choice(WORDS), (40, y), font, scale, 20, thickness, cv2.LINE_AA)
+        cv2.putText(img, f"{fmt(price)} EUR", (w // 2 + 40, y), font, scale, 20, thickness, cv2.LINE_AA)
+        y += line_h
+    cv2.putText(img, "UKUPNO", (40, y + line_h), font, scale, 20, thickness, cv2.LINE_AA)
+    cv2.putText(img, f"{fmt(total)} EUR", (w // 2 + 40, y + line_h), font, scale, 20, thickness, cv2.LINE_AA)
+
+    # ---- Phone-photo degradations ----
+    shade = np.linspace(rng.uniform(0.55, 1.0), 1.0, w, dtype=np.float32)[None, :]
+    img = (img.astype(np.float32) * shade).astype(np.uint8)
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), rng.uniform(-1.5, 1.5), 1.0)
+    img = cv2.warpAffine(img, matrix, (w, h), borderValue=245)
+    img = cv2.GaussianBlur(img, (3, 3), rng.uniform(0.3, 1.0))
+    noise = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 6, img.shape)
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, rng.randint(60, 90)])
+    return encoded.tobytes(), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    get_templates()
+    print(f"template build: {(time.perf_counter() - start) * 1000:.0f} ms (once per process)")
+
+    with open(SAMPLE, "rb") as fh:
+        img = decode_receipt(fh.read())
+    start = time.perf_counter()
+    amount = extract_amount_opencv(img)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"Rezija-44.jpg: got {amount}, expected {SAMPLE_TOTAL:.2f}, {elapsed:.1f} ms")
+
+    rng = random.Random(args.seed)
+    samples = [synthetic_receipt(rng) for _ in range(args.count)]
+    decoded = [(decode_receipt(data), total) for data, total in samples]
+
+    correct, timings = 0, []
+    for img, total in decoded:
+        start = time.perf_counter()
+        amount = extract_amount_opencv(img)
+        timings.append(time.perf_counter() - start)
+        correct += amount is not None and abs(amount - total) < 0.005
+
+    timings = np.array(timings) * 1000
+    print(f"synthetic: {correct}/{len(decoded)} totals exact ({correct / len(decoded):.1%})")
+    print(f"latency ms: p50 {np.percentile(timings, 50):.1f}, p95 {np.percentile(timings, 95):.1f}, "
+          f"throughput {1000 / timings.mean():.0f} receipts/s per core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Throughput of POST /expenses with and without group commit.
+
+    POSTGRES_HOST=localhost python -m benchmarks.bench_expense_inserts [--clients 32] [--requests 50]
+
+Needs a database initialised from db_init/. Creates a throwaway user,
+has --clients threads each post --requests expenses through the Flask
+app, once with every request committing on its own and once through the
+group-commit writer, then deletes the user and its expenses.
+"""
+import argparse
+import threading
+import time
+import uuid
+import numpy as np
+from flask_jwt_extended import create_access_token
+from app import create_app
+from app.utils import get_db_connection, Money
+import app.expenses.routes as expense_routes
+
+
+def run(app, token, clients, requests):
+    timings = []
+    lock = threading.Lock()
+
+    def _client():
+        client = app.test_client()
+        local = []
+        for i in range(requests):
+            start = time.perf_counter()
+            response = client.post("/expenses", headers={"Authorization": f"Bearer {token}"},
+                                   json={"amount": 1.25, "description": f"bench {i}", "categoryId": 3})
+            local.append(time.perf_counter() - start)
+            assert response.status_code == 201, response.get_data(as_text=True)
+        with lock:
+            timings.extend(local)
+
+    threads = [threading.Thread(target=_client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(timings) / elapsed, np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    name = f"bench-{uuid.uuid4().hex[:8]}"
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (username, password, email, balance, salary) VALUES (%s, '-', %s, 0, 0) RETURNING id",
+                (name, f"{name}@example.invalid")
+            )
+            user_id = cur.fetchone()[0]
+        conn.commit()
+
+    app = create_app()
+    with app.app_context():
+        token = create_access_token(identity=str(user_id))
+
+    try:
+        for label, enabled in (("commit per request", False), ("group commit", True)):
+            expense_routes.GROUP_COMMIT_ENABLED = enabled
+            rate, timings = run(app, token, args.clients, args.requests)
+            print(f"{label:<20} {rate:8.0f} inserts/s   latency ms: p50 {np.percentile(timings, 50):.1f}, "
+                  f"p95 {np.percentile(timings, 95):.1f}")
+
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT balance, (SELECT COUNT(*) FROM expenses WHERE user_id = %s) FROM users WHERE id = %s",
+                            (user_id, user_id))
+                balance, count = cur.fetchone()
+        expected = 2 * args.clients * args.requests
+        print(f"rows {count}/{expected}, balance {Money(balance)} (expected {Money(-125 * expected)})")
+    finally:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Application CPU per request for large lists: Python-built JSON versus
+JSON rendered by PostgreSQL (SQL_JSON_RESPONSES).
+
+    POSTGRES_HOST=localhost python -m benchmarks.bench_json_responses [--rows 50000] [--repeat 20]
+
+Needs a database initialised from db_init/. Creates a throwaway user with
+--rows expenses, fetches GET /expenses both ways, checks that the two
+bodies decode to the same document, and reports CPU time of this process
+(the Flask side; the database's own work is not included) and wall time.
+"""
+import argparse
+import json
+import time
+import uuid
+import numpy as np
+from flask_jwt_extended import create_access_token
+from app import create_app
+from app.utils import get_db_connection
+import app.expenses.routes as expense_routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    name = f"bench-{uuid.uuid4().hex[:8]}"
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (username, password, email, balance, salary) VALUES (%s, '-', %s, 0, 0) RETURNING id",
+                (name, f"{name}@example.invalid")
+            )
+            user_id = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO expenses (description, amount, category_id, user_id, date)
+                SELECT 'Bench expense ' || i, (random() * 20000)::bigint, 1 + i %% 10, %s,
+                       DATE '2025-01-01' + (i %% 365)
+                FROM generate_series(1, %s) AS i
+            """, (user_id, args.rows))
+        conn.commit()
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+    try:
+        bodies = {}
+        for label, enabled in (("python", False), ("postgres", True)):
+            expense_routes.SQL_JSON_RESPONSES = enabled
+            cpu, wall = [], []
+            for _ in range(args.repeat):
+                cpu_start, wall_start = time.process_time(), time.perf_counter()
+                response = client.get("/expenses", headers=headers)
+                body = response.get_data()
+                cpu.append(time.process_time() - cpu_start)
+                wall.append(time.perf_counter() - wall_start)
+            bodies[label] = body
+            print(f"{label:<10} {len(body) / 1e6:6.1f} MB   cpu ms p50 {np.percentile(cpu, 50) * 1000:7.1f}   "
+                  f"wall ms p50 {np.percentile(wall, 50) * 1000:7.1f}")
+
+        same = json.loads(bodies["python"]) == json.loads(bodies["postgres"])
+        print(f"same document: {same}")
+    finally:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Round trips and latency of the write handlers.
+
+    POSTGRES_HOST=db.example python -m benchmarks.bench_write_latency [--iterations 200]
+
+Needs a database initialised from db_init/, ideally on another host
+(round trips are what this measures). Registers a throwaway user, then
+times register, payday, create, update and delete through the Flask app
+and counts the round trips each one makes, not counting the connection
+handshake. To compare against an older version, check out its app/
+directory and run the same command.
+"""
+import argparse
+import time
+import uuid
+import numpy as np
+import psycopg2.extensions as ext
+from flask_jwt_extended import create_access_token
+import app.utils as utils
+from app import create_app
+from app.utils import get_db_connection
+
+round_trips = 0
+
+
+class CountingCursor(ext.cursor):
+    def execute(self, query, vars=None):
+        global round_trips
+        conn = self.connection
+        if not conn.autocommit and conn.get_transaction_status() == ext.TRANSACTION_STATUS_IDLE:
+            round_trips += 1  # the BEGIN psycopg2 sends first
+        round_trips += 1
+        return super().execute(query, vars)
+
+
+class CountingConnection(ext.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", CountingCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        global round_trips
+        if self.get_transaction_status() != ext.TRANSACTION_STATUS_IDLE:
+            round_trips += 1
+        super().commit()
+
+
+def measure(label, iterations, call):
+    global round_trips
+    timings, trips = [], []
+    for i in range(iterations):
+        round_trips = 0
+        start = time.perf_counter()
+        call(i)
+        timings.append(time.perf_counter() - start)
+        trips.append(round_trips)
+    timings = np.array(timings) * 1000
+    print(f"{label:<16} {np.mean(trips):5.1f} round trips   latency ms: p50 {np.percentile(timings, 50):.2f}, "
+          f"p95 {np.percentile(timings, 95):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    connect_params = utils._connect_params
+    utils._connect_params = lambda: {**connect_params(), "connection_factory": CountingConnection}
+
+    app = create_app()
+    client = app.test_client()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    password = "Bench-pass1!"
+
+    def _register(i):
+        response = client.post("/register", json={
+            "username": f"{prefix}-{i}", "password": password, "email": f"{prefix}-{i}@example.invalid"})
+        assert response.status_code == 201, response.get_data(as_text=True)
+        return response.get_json()["id"]
+
+    try:
+        measure("register", args.iterations, _register)
+
+        user_id = _register("main")
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+        def _payday(i):
+            # Every call after the first finds the month already paid
+            utils.apply_monthly_payday(str(user_id))
+
+        ids = []
+
+        def _create(i):
+            response = client.post("/expenses", headers=headers,
+                                   json={"amount": 2.5, "description": f"bench {i}", "categoryId": 3})
+            assert response.status_code == 201, response.get_data(as_text=True)
+            ids.append(response.get_json()["id"])
+
+        def _update(i):
+            response = client.put(f"/expenses/{ids[i]}", headers=headers, json={"amount": 3.0})
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        def _delete(i):
+            response = client.delete(f"/expenses/{ids[i]}", headers=headers)
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        measure("payday", args.iterations, _payday)
+        measure("create_expense", args.iterations, _create)
+        measure("update_expense", args.iterations, _update)
+        measure("delete_expense", args.iterations, _delete)
+    finally:
+        utils._connect_params = connect_params
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM users WHERE username LIKE %s", (f"{prefix}-%",))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -92,3 +92,190 @@ CREATE TABLE IF NOT EXISTS public.password_resets
         REFERENCES public.users (email)
         ON DELETE CASCADE
 );
+
+
+-- =========================
+-- Receipts (files are stored by SHA-256, see app/image/storage.py)
+-- =========================
+CREATE TABLE IF NOT EXISTS public.receipts
+(
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    sha256 CHAR(64) NOT NULL,
+    filename VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_receipts_user_sha UNIQUE (user_id, sha256)
+);
+
+-- Perceptual hash for near-duplicate detection, and the expense a receipt was booked as
+ALTER TABLE public.receipts ADD COLUMN IF NOT EXISTS phash BIGINT;
+ALTER TABLE public.receipts ADD COLUMN IF NOT EXISTS expense_id INTEGER REFERENCES public.expenses(id) ON DELETE SET NULL;
+
+
+-- =========================
+-- Merchant dictionary for automatic categorization (see app/categories/merchants.py)
+-- user_id NULL = global entry, otherwise learned from the user's own choices
+-- =========================
+CREATE TABLE IF NOT EXISTS public.merchant_keywords
+(
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES public.users(id) ON DELETE CASCADE,
+    keyword VARCHAR(100) NOT NULL,
+    category_id INTEGER NOT NULL REFERENCES public.categories(id) ON DELETE CASCADE,
+    hits INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_merchant_keywords_user_keyword UNIQUE NULLS NOT DISTINCT (user_id, keyword)
+);
+
+INSERT INTO public.merchant_keywords (user_id, keyword, category_id) VALUES
+(NULL, 'konzum', 3), (NULL, 'lidl', 3), (NULL, 'spar', 3), (NULL, 'interspar', 3),
+(NULL, 'kaufland', 3), (NULL, 'plodine', 3), (NULL, 'tommy', 3), (NULL, 'studenac', 3),
+(NULL, 'mercator', 3), (NULL, 'eurospin', 3), (NULL, 'ribola', 3),
+(NULL, 'hep', 2), (NULL, 'vodovod', 2), (NULL, 'gradska plinara', 2), (NULL, 'cistoca', 2),
+(NULL, 'restoran', 4), (NULL, 'pizzeria', 4), (NULL, 'caffe bar', 4), (NULL, 'bistro', 4),
+(NULL, 'mcdonald''s', 4), (NULL, 'kfc', 4), (NULL, 'burger king', 4), (NULL, 'wolt', 4), (NULL, 'glovo', 4),
+(NULL, 'ina', 5), (NULL, 'petrol', 5), (NULL, 'crodux', 5), (NULL, 'tifon', 5), (NULL, 'shell', 5),
+(NULL, 'omv', 5), (NULL, 'zet', 5), (NULL, 'hzpp', 5), (NULL, 'uber', 5), (NULL, 'bolt', 5), (NULL, 'parking', 5),
+(NULL, 'autoservis', 6), (NULL, 'vulkanizer', 6), (NULL, 'tehnicki pregled', 6),
+(NULL, 'ljekarna', 7), (NULL, 'pharmacy', 7), (NULL, 'poliklinika', 7), (NULL, 'stomatolog', 7),
+(NULL, 'osiguranje', 8), (NULL, 'allianz', 8), (NULL, 'generali', 8), (NULL, 'wiener', 8),
+(NULL, 'cinestar', 9), (NULL, 'kino', 9), (NULL, 'koncert', 9), (NULL, 'steam', 9),
+(NULL, 'zara', 10), (NULL, 'h&m', 10), (NULL, 'pull&bear', 10), (NULL, 'deichmann', 10), (NULL, 'c&a', 10),
+(NULL, 'skolarina', 11), (NULL, 'udemy', 11), (NULL, 'coursera', 11), (NULL, 'knjizara', 11),
+(NULL, 'donacija', 12), (NULL, 'poklon', 12),
+(NULL, 'dm', 13), (NULL, 'muller', 13), (NULL, 'bipa', 13), (NULL, 'frizer', 13),
+(NULL, 'booking.com', 14), (NULL, 'airbnb', 14), (NULL, 'ryanair', 14), (NULL, 'croatia airlines', 14), (NULL, 'jadrolinija', 14),
+(NULL, 'a1', 15), (NULL, 'telemach', 15), (NULL, 'hrvatski telekom', 15), (NULL, 'iskon', 15),
+(NULL, 'netflix', 16), (NULL, 'spotify', 16), (NULL, 'hbo max', 16), (NULL, 'disney+', 16), (NULL, 'youtube premium', 16),
+(NULL, 'ikea', 17), (NULL, 'pevex', 17), (NULL, 'bauhaus', 17), (NULL, 'jysk', 17), (NULL, 'emmezeta', 17),
+(NULL, 'vrtic', 18), (NULL, 'igracke', 18),
+(NULL, 'stednja', 19), (NULL, 'fond', 19)
+ON CONFLICT (user_id, keyword) DO NOTHING;
+
+
+-- =========================
+-- Expense search: full text (tsvector), typo-tolerant trigram matching and keyset pagination
+-- btree_gin lets user_id sit in the same GIN index as the text columns
+-- =========================
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+ALTER TABLE public.expenses ADD COLUMN IF NOT EXISTS description_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', description)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_expenses_user_tsv ON public.expenses USING GIN (user_id, description_tsv);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_trgm ON public.expenses USING GIN (user_id, description gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date_id ON public.expenses (user_id, date DESC, id DESC);
+
+
+-- =========================
+-- Data versions for conditional GET (ETag / If-None-Match)
+-- scope: 'user:<id>' for a user's own data, 'categories' for the shared categories
+-- =========================
+CREATE TABLE IF NOT EXISTS public.data_versions
+(
+    scope VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+
+-- =========================
+-- Delta sync (GET /expenses/changes): every insert/update takes a new change_seq,
+-- deletes leave a tombstone with one. Writers lock the user's row first, so per
+-- user the sequence order is also the commit order.
+-- =========================
+CREATE SEQUENCE IF NOT EXISTS public.expense_change_seq;
+
+ALTER TABLE public.expenses ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT nextval('public.expense_change_seq');
+CREATE INDEX IF NOT EXISTS idx_expenses_user_change_seq ON public.expenses (user_id, change_seq);
+
+CREATE TABLE IF NOT EXISTS public.expense_tombstones
+(
+    expense_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    change_seq BIGINT NOT NULL DEFAULT nextval('public.expense_change_seq'),
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_expense_tombstones_user_change_seq ON public.expense_tombstones (user_id, change_seq);
+
+
+-- =========================
+-- Money as BIGINT minor units (cents): users.balance, users.salary,
+-- expenses.amount and tba_sio.value (Rent 600.00 -> 60000, admin flag 1 -> 100).
+-- Converts columns still in NUMERIC; a no-op once they are BIGINT.
+-- =========================
+DO $$
+DECLARE
+    col RECORD;
+BEGIN
+    FOR col IN
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND data_type = 'numeric'
+          AND (table_name, column_name) IN (('users', 'balance'), ('users', 'salary'),
+                                            ('expenses', 'amount'), ('tba_sio', 'value'))
+    LOOP
+        EXECUTE format('ALTER TABLE public.%I ALTER COLUMN %I TYPE BIGINT USING round(%I * 100)',
+                       col.table_name, col.column_name, col.column_name);
+    END LOOP;
+END $$;
+
+
+-- =========================
+-- expenses range-partitioned by month (expenses_y2025m01, ...) plus a default
+-- partition for dates no monthly partition covers (see app/admin/partitions.py).
+-- A fresh database is set up here. A database that already holds expenses is
+-- converted online by: flask --app app.app:app admin partitions-migrate
+-- The primary key has to include the partition key, so receipts.expense_id is
+-- no longer a foreign key; the delete paths clear it themselves.
+-- =========================
+DO $$
+DECLARE
+    first_day DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'public.expenses'::regclass) = 'r'
+       AND NOT EXISTS (SELECT 1 FROM public.expenses) THEN
+        DROP TABLE public.expenses CASCADE;
+
+        CREATE TABLE public.expenses
+        (
+            id SERIAL,
+            description VARCHAR(255) NOT NULL,
+            amount BIGINT NOT NULL,
+            date DATE NOT NULL DEFAULT CURRENT_DATE,
+            category_id INTEGER NOT NULL REFERENCES public.categories(id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+            description_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', description)) STORED,
+            change_seq BIGINT NOT NULL DEFAULT nextval('public.expense_change_seq'),
+            CONSTRAINT expenses_pkey PRIMARY KEY (id, date)
+        ) PARTITION BY RANGE (date);
+
+        CREATE TABLE public.expenses_default PARTITION OF public.expenses DEFAULT;
+
+        CREATE INDEX idx_expenses_user_tsv ON public.expenses USING GIN (user_id, description_tsv);
+        CREATE INDEX idx_expenses_user_trgm ON public.expenses USING GIN (user_id, description gin_trgm_ops);
+        CREATE INDEX idx_expenses_user_date_id ON public.expenses (user_id, date DESC, id DESC);
+        CREATE INDEX idx_expenses_user_change_seq ON public.expenses (user_id, change_seq);
+
+        -- This month and the next three; partitions-maintain keeps extending the range
+        FOR first_day IN
+            SELECT generate_series(date_trunc('month', CURRENT_DATE), date_trunc('month', CURRENT_DATE) + INTERVAL '3 months', INTERVAL '1 month')::date
+        LOOP
+            EXECUTE format('CREATE TABLE public.%I PARTITION OF public.expenses FOR VALUES FROM (%L) TO (%L)',
+                           'expenses_y' || to_char(first_day, 'YYYY') || 'm' || to_char(first_day, 'MM'),
+                           first_day, (first_day + INTERVAL '1 month')::date);
+        END LOOP;
+    END IF;
+END $$;
+
+
+-- =========================
+-- Cold history: expenses dated before a user's horizon live in their Parquet
+-- file under EXPENSE_ARCHIVE_ROOT (see app/expenses/archive.py) instead of here
+-- =========================
+CREATE TABLE IF NOT EXISTS public.expense_archives
+(
+    user_id INTEGER PRIMARY KEY REFERENCES public.users(id) ON DELETE CASCADE,
+    horizon DATE NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,81 @@
+import random
+from app.image import duplicates
+from app.image.duplicates import BKTree, to_signed, to_unsigned
+
+
+def _brute_force(values, query, radius):
+    return sorted(
+        ((value ^ query).bit_count(), item)
+        for item, value in values
+        if (value ^ query).bit_count() <= radius
+    )
+
+
+def test_empty_tree_finds_nothing():
+    assert BKTree().search(0, 64) == []
+
+
+def test_radius_search_matches_brute_force():
+    rng = random.Random(7)
+    values = [(i, rng.getrandbits(64)) for i in range(500)]
+    # Near-duplicates of a few of them, a handful of bits apart
+    for i in range(0, 500, 50):
+        flipped = values[i][1]
+        for bit in rng.sample(range(64), rng.randint(1, 12)):
+            flipped ^= 1 << bit
+        values.append((1000 + i, flipped))
+
+    tree = BKTree()
+    for item, value in values:
+        tree.add(value, item)
+    assert tree.size == len(values)
+
+    for query in [values[0][1], values[250][1], rng.getrandbits(64)]:
+        for radius in (0, 1, 5, 10, 20):
+            found = tree.search(query, radius)
+            assert sorted(found) == _brute_force(values, query, radius)
+
+
+def test_results_are_closest_first():
+    tree = BKTree()
+    tree.add(0b1111, "four")
+    tree.add(0b0001, "one")
+    tree.add(0b0000, "zero")
+    tree.add(0b0011, "two")
+    assert [item for _, item in tree.search(0, 4)] == ["zero", "one", "two", "four"]
+
+
+def test_identical_hashes_share_a_node():
+    tree = BKTree()
+    tree.add(42, "a")
+    tree.add(42, "b")
+    assert tree.size == 2
+    assert tree.search(42, 0) == [(0, "a"), (0, "b")]
+
+
+def test_radius_is_inclusive():
+    tree = BKTree()
+    tree.add(0, "root")
+    tree.add((1 << 10) - 1, "ten bits")
+    assert tree.search(0, 9) == [(0, "root")]
+    assert tree.search(0, 10) == [(0, "root"), (10, "ten bits")]
+
+
+def test_signed_round_trip():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed(value)
+        assert -(1 << 63) <= signed < (1 << 63)
+        assert to_unsigned(signed) == value
+
+
+def test_user_indexes_evict_least_recently_used(monkeypatch):
+    monkeypatch.setattr(duplicates, "MAX_USER_INDEXES", 2)
+    monkeypatch.setattr(duplicates, "_indexes", duplicates.OrderedDict())
+    first = duplicates._get_index(1)
+    duplicates._get_index(2)
+    assert duplicates._get_index(1) is first
+    duplicates._get_index(3)
+    assert list(duplicates._indexes) == [1, 3]
+    # An evicted user starts over from an empty index
+    assert duplicates._get_index(2).max_id == 0
+    assert list(duplicates._indexes) == [3, 2]
@@ -0,0 +1,148 @@
+from datetime import date
+import numpy as np
+import pytest
+from app.expenses.cache import ExpenseCache, ExpenseColumns, EXPENSE_DTYPE, _Entry
+from app.utils import Money
+
+NAMES = {1: "Groceries", 2: "Utilities", 3: "Dining Out"}
+
+
+def _columns(*expenses, names=NAMES):
+    """expenses: (id, "YYYY-MM-DD", category_id, cents)."""
+    rows = np.array([(i, np.datetime64(d, "D"), c, a) for i, d, c, a in expenses], dtype=EXPENSE_DTYPE)
+    rows = rows[np.lexsort((rows["id"], rows["date"]))]
+    return ExpenseColumns(rows, names)
+
+
+SAMPLE = _columns(
+    (1, "2025-09-01", 1, 1000),
+    (2, "2025-09-21", 2, 250),   # Sunday
+    (3, "2025-09-22", 1, 500),   # Monday
+    (4, "2025-09-24", 3, 1999),  # Wednesday
+    (5, "2025-10-03", 1, 1),
+)
+
+
+# ----------------- FILTER / GROUP BY -----------------
+def test_filter_date_range_is_inclusive():
+    picked = SAMPLE.filter(date(2025, 9, 21), date(2025, 9, 24))
+    assert picked.rows["id"].tolist() == [2, 3, 4]
+    assert len(SAMPLE.filter(date(2025, 9, 2), date(2025, 9, 20))) == 0
+
+
+def test_filter_categories_and_amounts():
+    assert SAMPLE.filter(category_ids=[1]).rows["id"].tolist() == [1, 3, 5]
+    assert SAMPLE.filter(min_amount=Money(250), max_amount=Money(1000)).rows["id"].tolist() == [1, 2, 3]
+
+
+def test_group_by_category_and_name():
+    assert SAMPLE.group_by("category") == {1: 1501, 2: 250, 3: 1999}
+    by_name = SAMPLE.filter(end=date(2025, 9, 30)).group_by("name")
+    assert by_name == {"Groceries": 1500, "Utilities": 250, "Dining Out": 1999}
+    assert all(isinstance(total, Money) for total in by_name.values())
+    assert SAMPLE.total() == 3750
+    with pytest.raises(ValueError):
+        SAMPLE.group_by("merchant")
+
+
+# ----------------- BUCKETS -----------------
+def test_week_buckets_start_on_monday():
+    buckets = SAMPLE.filter(end=date(2025, 9, 30)).bucket("week")
+    assert buckets == [
+        (date(2025, 9, 1), 1000),
+        (date(2025, 9, 8), 0),
+        (date(2025, 9, 15), 250),
+        (date(2025, 9, 22), 2499),
+    ]
+    assert all(day.weekday() == 0 for day, _ in buckets)
+
+
+def test_week_bucket_of_a_sunday_is_the_previous_monday():
+    assert _columns((1, "2025-09-28", 1, 7)).bucket("week") == [(date(2025, 9, 22), 7)]
+    # 1970-01-01, the epoch, was a Thursday
+    assert _columns((1, "1970-01-01", 1, 7)).bucket("week") == [(date(1969, 12, 29), 7)]
+
+
+def test_day_buckets_fill_gaps_and_respect_bounds():
+    buckets = SAMPLE.bucket("day", date(2025, 9, 20), date(2025, 9, 23))
+    assert buckets == [
+        (date(2025, 9, 20), 0),
+        (date(2025, 9, 21), 250),
+        (date(2025, 9, 22), 500),
+        (date(2025, 9, 23), 0),
+    ]
+
+
+def test_month_and_year_buckets():
+    assert SAMPLE.bucket("month") == [(date(2025, 9, 1), 3749), (date(2025, 10, 1), 1)]
+    assert SAMPLE.bucket("year", date(2024, 6, 1)) == [(date(2024, 1, 1), 0), (date(2025, 1, 1), 3750)]
+
+
+def test_buckets_without_expenses():
+    empty = _columns()
+    assert empty.bucket("day") == []
+    assert empty.bucket("month", date(2025, 1, 15), date(2025, 3, 1)) == [
+        (date(2025, 1, 1), 0), (date(2025, 2, 1), 0), (date(2025, 3, 1), 0)
+    ]
+    with pytest.raises(ValueError):
+        SAMPLE.bucket("hour")
+
+
+# ----------------- PERCENTILES -----------------
+def test_percentiles_empty_and_one_row():
+    assert _columns().percentiles([50, 90]) == [None, None]
+    assert _columns((1, "2025-01-01", 1, 1234)).percentiles([0, 50, 100]) == [1234, 1234, 1234]
+
+
+def test_percentiles_are_actual_amounts():
+    values = SAMPLE.percentiles([0, 50, 100])
+    assert values == [1, 500, 1999]
+    assert all(isinstance(value, Money) for value in values)
+    assert SAMPLE.percentiles(50) == [500]
+
+
+# ----------------- PATCHING -----------------
+def _cache_with(user_id, columns, version):
+    cache = ExpenseCache()
+    with cache._lock:
+        cache._store(user_id, _Entry(columns, version, 1))
+    return cache
+
+
+def _cached(cache, user_id):
+    entry = cache._entries.get(user_id)
+    return entry and (entry.version, entry.columns.rows["id"].tolist())
+
+
+def test_patches_apply_one_version_at_a_time():
+    cache = _cache_with(7, SAMPLE, 10)
+    cache.insert(7, 11, [(6, date(2025, 9, 2), 2, 300)])
+    assert _cached(cache, 7) == (11, [1, 6, 2, 3, 4, 5])
+
+    cache.update(7, 12, 1, expense_date=date(2025, 12, 1), amount=Money(5))
+    assert _cached(cache, 7) == (12, [6, 2, 3, 4, 5, 1])
+    assert cache._entries[7].columns.rows["amount"][-1] == 5
+
+    cache.delete(7, 13, 3)
+    assert _cached(cache, 7) == (13, [6, 2, 4, 5, 1])
+    assert cache.stats()["patches"] == 3
+
+
+def test_patch_out_of_order_drops_the_entry():
+    cache = _cache_with(7, SAMPLE, 10)
+    held = cache._entries[7].columns
+    cache.delete(7, 12, 3)
+    assert _cached(cache, 7) is None
+    # Queries already holding the columns are unaffected
+    assert held.rows["id"].tolist() == [1, 2, 3, 4, 5]
+    assert cache.stats()["bytes"] == 0
+
+
+def test_lru_eviction_by_bytes():
+    row_bytes = EXPENSE_DTYPE.itemsize * len(SAMPLE)
+    cache = ExpenseCache(max_bytes=2 * row_bytes)
+    with cache._lock:
+        for user_id in (1, 2, 3):
+            cache._store(user_id, _Entry(SAMPLE, 1, 1))
+    assert list(cache._entries) == [2, 3]
+    assert cache.stats()["bytes"] == 2 * row_bytes
@@ -0,0 +1,13 @@
+from datetime import date
+from app.expenses.export import _ndjson_line
+
+
+def test_ndjson_tail_line_matches_row_to_json():
+    # What PostgreSQL writes for the same row of EXPORT_COLUMNS
+    expected = b'{"id":3,"date":"2025-09-24","description":"Coffee","amount":25.50,"category_id":1,"category":"Dining Out"}\n'
+    assert _ndjson_line(3, date(2025, 9, 24), "Coffee", 2550, 1, "Dining Out") == expected
+
+
+def test_ndjson_tail_line_amounts_keep_two_decimals():
+    assert b'"amount":-0.05,' in _ndjson_line(1, date(2025, 1, 1), "Refund", -5, 1, "Other")
+    assert b'"amount":100.00,' in _ndjson_line(1, date(2025, 1, 1), "Rent", 10000, 1, "Other")
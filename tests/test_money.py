@@ -0,0 +1,61 @@
+import pytest
+from app.utils import Money
+
+
+@pytest.mark.parametrize("value, cents", [
+    (25.5, 2550),
+    ("25.50", 2550),
+    (" 25.50 ", 2550),
+    (25, 2500),
+    ("0.01", 1),
+    ("1.234", 123),
+    # ROUND_HALF_UP: halves go away from zero
+    ("0.005", 1),
+    ("2.675", 268),
+    ("-0.005", -1),
+    ("-2.675", -268),
+    ("-25.50", -2550),
+    (0, 0),
+    ("1e2", 10000),
+])
+def test_parse(value, cents):
+    money = Money.parse(value)
+    assert isinstance(money, Money)
+    assert int(money) == cents
+
+
+def test_parse_accepts_the_bigint_limits():
+    assert Money.parse("92233720368547758.07") == 2**63 - 1
+    assert Money.parse("-92233720368547758.07") == -(2**63 - 1)
+
+
+def test_parse_float_uses_its_shortest_repr():
+    # 0.1 + 0.2 is 0.30000000000000004, not 0.3
+    assert Money.parse(0.1 + 0.2) == 30
+    assert Money.parse(19.99) == 1999
+
+
+@pytest.mark.parametrize("value", [
+    True, False, "abc", "", "nan", "inf", "-Infinity", None, "1,5",
+    # Overflows Decimal
+    "1e999999999",
+    # Outside bigint cents
+    "92233720368547758.08", "-92233720368547758.08",
+])
+def test_parse_rejects(value):
+    with pytest.raises(ValueError):
+        Money.parse(value)
+
+
+@pytest.mark.parametrize("cents, text", [(2550, "25.50"), (5, "0.05"), (-5, "-0.05"), (0, "0.00"), (-2550, "-25.50")])
+def test_str_in_major_units(cents, text):
+    assert str(Money(cents)) == text
+
+
+def test_arithmetic_stays_money():
+    total = Money(150) + Money(250) - 100
+    assert isinstance(total, Money) and total == 300
+    assert isinstance(-Money(5), Money) and -Money(5) == -5
+    assert isinstance(1000 - Money(1), Money)
+    assert isinstance(sum([Money(1), Money(2)], Money(0)), Money)
+    assert Money(-250).to_float() == -2.5
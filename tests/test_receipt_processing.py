@@ -0,0 +1,24 @@
+import struct
+import cv2
+import numpy as np
+from app.image.processing import image_size, process_receipt
+
+
+def _with_orientation(data, orientation):
+    """Inserts an EXIF APP1 segment holding only the Orientation tag."""
+    ifd = struct.pack(">H", 1) + struct.pack(">HHIHH", 0x0112, 3, 1, orientation, 0) + b"\x00\x00\x00\x00"
+    app1 = b"Exif\x00\x00" + b"MM\x00\x2a" + struct.pack(">I", 8) + ifd
+    return data[:2] + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + data[2:]
+
+
+def test_store_regions_use_the_oriented_upload():
+    page = np.full((2400, 800), 255, np.uint8)
+    cv2.putText(page, "STORE NAME", (120, 150), cv2.FONT_HERSHEY_SIMPLEX, 3, 0, 8)
+    # Stored on its side; orientation 6 turns it back upright when decoded
+    stored = cv2.rotate(page, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    data = _with_orientation(cv2.imencode(".jpg", stored)[1].tobytes(), 6)
+    assert image_size(data) == (2400, 800)
+
+    region = process_receipt(data)["store_regions"][0]
+    assert 100 <= region["x"] <= 140 and 60 <= region["y"] <= 110
+    assert region["x"] + region["w"] <= 800
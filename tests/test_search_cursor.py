@@ -0,0 +1,39 @@
+import numpy as np
+from werkzeug.datastructures import MultiDict
+from app.expenses.routes import decode_cursor, encode_cursor, expenses_query
+
+# ts_rank + word_similarity is real; each score is what a float8 cast of it
+# holds. The first page ends inside the tie at 0.1, right after 0.1 + 1 ulp.
+REAL_SCORES = np.array([0.3, 0.1, 0.1, 0.1, 0.1, 0.05], dtype=np.float32)
+REAL_SCORES[1] = np.nextafter(REAL_SCORES[1], np.float32(1))
+ROWS = [(float(score), expense_id) for expense_id, score in zip(range(6, 0, -1), REAL_SCORES)]
+
+
+def _pages(fetched_score, limit=2):
+    """Reads ROWS page by page the way GET /expenses?q= does, with
+    fetched_score giving the value the driver hands back for a row."""
+    seen, cursor = [], None
+    while True:
+        rows = sorted((row for row in ROWS if cursor is None or row < tuple(cursor)), reverse=True)
+        page = rows[:limit]
+        seen += [expense_id for _, expense_id in page]
+        if len(rows) <= limit:
+            return seen
+        score, expense_id = page[-1]
+        cursor = decode_cursor(encode_cursor([fetched_score(score), expense_id]), "score")
+
+
+def test_query_selects_score_as_float8():
+    query, *_ = expenses_query(1, MultiDict({"q": "coffee", "cursor": encode_cursor([0.5, 3])}))
+    assert "::float8 AS score" in query
+    assert "WHERE (score, id) < (%s, %s)" in query
+
+
+def test_float8_score_pages_through_ties_exactly_once():
+    assert _pages(lambda score: score) == [6, 5, 4, 3, 2, 1]
+
+
+def test_float4_text_score_skips_rows_at_the_boundary():
+    # What a real column comes back as: its shortest float4 text, which is
+    # not the stored value, so rows at the boundary repeat or go missing
+    assert _pages(lambda score: float(str(np.float32(score)))) != [6, 5, 4, 3, 2, 1]
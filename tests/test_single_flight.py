@@ -0,0 +1,89 @@
+import threading
+import time
+import pytest
+from app.utils import SingleFlight
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+def _start_followers(flight, key, count, fn, results):
+    def follower():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=follower) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = _start_followers(flight, "k", 1, slow, results)
+    _wait_for(lambda: calls)
+    followers = _start_followers(flight, "k", 4, slow, results)
+    _wait_for(lambda: flight.stats()["coalesced"] == 4)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ["result"] * 5
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_leader_failure_reaches_every_follower():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    results = []
+    leader = _start_followers(flight, "k", 1, failing, results)
+    started.wait(5)
+    followers = _start_followers(flight, "k", 3, failing, results)
+    _wait_for(lambda: flight.stats()["coalesced"] == 3)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert len(results) == 4
+    assert all(isinstance(r, ValueError) and str(r) == "boom" for r in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_key_is_released_after_failure():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError("first")))
+    # A new call runs again instead of seeing the old error
+    assert flight.do("k", lambda: "second") == "second"
+    assert flight.stats()["leaders"] == 2
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats() == {"leaders": 2, "coalesced": 0, "in_flight": 0}